@@ -8,6 +8,9 @@ from cdk.basic_role_stack import BasicRole
 from cdk.lib.construct import Authorizer
 from cdk.lib.construct import API
 
+from cdk.settings.dev import JWKS_URL
+from cdk.settings.dev import JWT_AUDIENCE
+from cdk.settings.dev import JWT_ISSUER
 from src.users.views import url as user_views
 
 app = cdk.App()
@@ -21,8 +24,12 @@ basic_role = BasicRole(init_stack, 'roles')
 fn_auth = Authorizer(
     cdk.Stack(app, 'authorizer'),
     f'authorizer-id',
-    env={'abcd': 'def'},
-    layers=[layer.jwt_layer],
+    env={
+        'JWKS_URL': JWKS_URL,
+        'JWT_AUDIENCE': JWT_AUDIENCE,
+        'JWT_ISSUER': JWT_ISSUER,
+    },
+    layers=[layer.jwt_layer, layer.utils_layer],
     role=basic_role.basic_lambda_role,
 )
 
@@ -1,5 +1,6 @@
 """
-This module defines the LayerStack
+This module defines the LayerStack. The layers are the slim builds of
+``python -m deploy_scripts.build_layers``, run before ``cdk synth``
 """
 
 from aws_cdk import core as cdk
@@ -15,13 +16,13 @@ class Layer(cfn.NestedStack):
         self.utils_layer = function.LayerVersion(
             self,
             "CommonLayer",
-            code=function.AssetCode("layers/common"),
+            code=function.AssetCode("build/layers/common"),
             layer_version_name="new-common",
         )
 
         self.jwt_layer = function.LayerVersion(
             self,
             "JwtLayer",
-            code=function.AssetCode("layers/jwt"),
+            code=function.AssetCode("build/layers/jwt"),
             layer_version_name="new-jwt",
         )
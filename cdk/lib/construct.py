@@ -4,6 +4,7 @@ This module defines the base class for:
 - Authorizer
 - APIHandler
 """
+import json
 from typing import List, Mapping
 
 from aws_cdk import core as cdk
@@ -11,9 +12,17 @@ from aws_cdk import aws_lambda as function
 from aws_cdk import aws_apigateway as api
 from aws_cdk import aws_iam as iam
 
+from lib.helpers import cors_preflight
 from settings.dev import HEADER
 from settings.dev import RESPONSE_4XX
 from settings.dev import RESPONSE_5XX
+from settings.dev import RESOURCE_ARN
+from settings.dev import SECRET_ARN
+
+ARCHITECTURES = {
+    'x86_64': function.Architecture.X86_64,
+    'arm64': function.Architecture.ARM_64,
+}
 
 
 class Authorizer(cdk.Construct):
@@ -29,7 +38,7 @@ class Authorizer(cdk.Construct):
                  layers: List[function.LayerVersion],
                  role: iam.Role,
                  timeout: cdk.Duration = cdk.Duration.seconds(10),
-                 handler: str = 'authorizer.handler',
+                 handler: str = 'miracle.utils.authorizer.handler',
                  runtime: function.Runtime = function.Runtime.PYTHON_3_7(),
                  code: function.Code = function.Code.asset('lambdas/authorizer'),
                  ):
@@ -43,7 +52,7 @@ class Authorizer(cdk.Construct):
             role (iam.Role): specify an IAM role for the authorizer
             timeout (cdk.Duration): set the maximum timeout, default=10s
             handler (str): specify which function is the handler inside the package,
-                default=authorizer.handler
+                default=the JWT authorizer of miracle, shipped in the common layer
             runtime (function.Runtime): specify the runtime of the authorizer
                 default=PYTHON_3_7
             code (str): specify the location of the authorizer function
@@ -81,7 +90,11 @@ class Handler(cdk.Construct):
                  role: iam.Role,
                  code_location: str,
                  timeout: cdk.Duration = cdk.Duration.seconds(10),
-                 runtime: function.Runtime = function.Runtime.PYTHON_3_7,
+                 runtime: function.Runtime = None,
+                 memory_size: int = None,
+                 architecture: str = 'x86_64',
+                 reserved_concurrency: int = None,
+                 provisioned_concurrency: int = None,
                  ):
         """
 
@@ -97,11 +110,25 @@ class Handler(cdk.Construct):
             timeout (cdk.Duration): specify the function timeout for all funcitons of this API
                 default=10
             handler:
-            runtime:
+            runtime (function.Runtime): default=PYTHON_3_7 on x86_64,
+                PYTHON_3_8 on arm64 which has no Python 3.7 runtime
             code_location:
+            memory_size (int): the memory in MB, default=128
+            architecture (str): 'x86_64' or 'arm64', default=x86_64
+            reserved_concurrency (int): the concurrent executions reserved
+                for the function, default=unreserved
+            provisioned_concurrency (int): the pre-initialized execution
+                environments, served through the 'live' alias
         """
         super().__init__(scope, construct_id)
 
+        if architecture not in ARCHITECTURES:
+            raise ValueError(f"architecture must be 'x86_64' or 'arm64': "
+                             f"{architecture}")
+        if runtime is None:
+            runtime = function.Runtime.PYTHON_3_8 \
+                if architecture == 'arm64' else function.Runtime.PYTHON_3_7
+
         self.handler = function.Function(
             self,
             id=construct_id,
@@ -112,9 +139,24 @@ class Handler(cdk.Construct):
             role=role,
             layers=layers,
             timeout=timeout,
-            environment=env
+            environment=env,
+            memory_size=memory_size,
+            architectures=[ARCHITECTURES[architecture]],
+            reserved_concurrent_executions=reserved_concurrency,
         )
 
+        # API Gateway invokes the alias, so the provisioned environments
+        # of the published version serve the requests
+        self.target = self.handler
+        if provisioned_concurrency:
+            self.target = function.Alias(
+                self,
+                id=f'{construct_id}-live',
+                alias_name='live',
+                version=self.handler.current_version,
+                provisioned_concurrent_executions=provisioned_concurrency,
+            )
+
 
 class API(cdk.Construct):
     """
@@ -136,6 +178,13 @@ class API(cdk.Construct):
                  headers: Mapping[str, str] = HEADER,
                  template_4xx: str = RESPONSE_4XX,
                  template_5xx: str = RESPONSE_5XX,
+                 mode: str = 'endpoint',
+                 authorizer_cache_ttl: cdk.Duration = cdk.Duration.minutes(5),
+                 identity_sources: List[str] = None,
+                 cache_cluster_size: str = '0.5',
+                 cors_max_age: int = 7200,
+                 minimum_compression_size: int = 1024,
+                 binary_media_types: List[str] = None,
                  ):
         """
 
@@ -151,20 +200,54 @@ class API(cdk.Construct):
             headers:
             template_4xx:
             template_5xx:
+            mode (str): 'endpoint' deploys one Lambda function per endpoint,
+                'router' deploys one function for the whole module which
+                dispatches each request to its endpoint in-process
+            authorizer_cache_ttl (cdk.Duration): how long API Gateway caches
+                the authorizer policy per identity, default=5 minutes;
+                Duration.seconds(0) invokes the authorizer on every request
+            identity_sources (List[str]): the request parameters identifying
+                the caller, default=[Authorization header]
+            cache_cluster_size (str): the size in GB of the stage cache
+                cluster, provisioned only when an endpoint of ``views``
+                declares a ``cache``, default=0.5
+            cors_max_age (int): the seconds browsers cache a CORS preflight,
+                default=7200, the maximum honoured by Chromium
+            minimum_compression_size (int): API Gateway compresses the
+                responses of at least this many bytes for clients sending
+                Accept-Encoding, default=1024; None disables it
+            binary_media_types (List[str]): the media types whose base64
+                bodies API Gateway decodes, needed by endpoints gzipping
+                their responses in Lambda with ``gzip_min_size``
         """
         super().__init__(scope, construct_id)
 
+        if mode not in ('endpoint', 'router'):
+            raise ValueError(f"mode must be 'endpoint' or 'router': {mode}")
+
+        self._mode = mode
         self._module_name = module_name
         self._layers = layers
         self._role = role
-        self._env = env
+        # Data API clients in the handlers are cached per cluster & secret
+        self._env = {
+            'RESOURCE_ARN': RESOURCE_ARN,
+            'SECRET_ARN': SECRET_ARN,
+            **env,
+        }
         self._views = views
+        self._headers = headers
+        self._cors_max_age = cors_max_age
+        self._identity_sources = identity_sources or \
+            [api.IdentitySource.header('Authorization')]
 
         self.root_node = api.RestApi(
             self,
             id=f'{stage}.api.{module_name}',
             endpoint_types=endpoint_types,
             deploy=True,
+            minimum_compression_size=minimum_compression_size,
+            binary_media_types=binary_media_types,
         )
 
         # GATEWAY RESPONSE
@@ -185,27 +268,31 @@ class API(cdk.Construct):
         )
 
         # CUSTOM AUTHORIZER
+        self._api_auth = None
         if authorizer:
             self._api_auth = api.RequestAuthorizer(
                 self,
                 id=f"{module_name}-api-authorizer",
                 authorizer_name=f"{module_name}-authorizer",
                 handler=authorizer,
-                results_cache_ttl=cdk.Duration.minutes(0),
-                identity_sources=[api.IdentitySource.header("Authorization")],
+                results_cache_ttl=authorizer_cache_ttl,
+                identity_sources=self._identity_sources,
             )
 
-        # ENABLE CORS
-        self.cors = function.Function(
-            self,
-            id=f'{module_name}-cors',
-            function_name=f"{module_name}-cors",
-            runtime=function.Runtime.PYTHON_3_7(),
-            code=function.Code.asset("functions/cors"),
-            handler="cors.handler",
-        )
-
         # DEPLOY & STAGE
+        method_options = {
+            f'{self._resource_path(endpoint, metadata)}/{metadata["method"]}':
+                api.MethodDeploymentOptions(
+                    caching_enabled=True,
+                    cache_ttl=cdk.Duration.seconds(
+                        metadata['cache'].get('ttl', 300)
+                    ),
+                    cache_data_encrypted=metadata['cache'].get('encrypted',
+                                                               False),
+                )
+            for endpoint, metadata in views.items() if metadata.get('cache')
+        }
+
         deployment = api.Deployment(
             self,
             f'{module_name}-deployment',
@@ -219,6 +306,9 @@ class API(cdk.Construct):
             deployment=deployment,
             stage_name=f'{module_name}-{stage}',
             variables={"schema": stage, "alias": stage},
+            cache_cluster_enabled=bool(method_options),
+            cache_cluster_size=cache_cluster_size if method_options else None,
+            method_options=method_options,
         )
 
         self.root_node.deployment_stage = stage
@@ -241,22 +331,194 @@ class API(cdk.Construct):
             stage=stage.stage_name,
         )
 
+    def _endpoint_environment(self, endpoint, metadata, overrides):
+        """Return the environment variables specific to one endpoint"""
+        env = {}
+        if overrides.get(endpoint):
+            env.update(overrides[endpoint])
+        if metadata.get('environment'):
+            env.update(metadata['environment'])
+        if metadata.get('response_cache'):
+            env['RESPONSE_CACHE_TTL'] = \
+                str(metadata['response_cache'].get('ttl', 30))
+            env['RESPONSE_CACHE_SIZE'] = \
+                str(metadata['response_cache'].get('max_size', 128))
+            if metadata['response_cache'].get('shared'):
+                env['RESPONSE_CACHE_SHARED'] = 'true'
+        if metadata.get('gzip_min_size') is not None:
+            env['RESPONSE_GZIP_MIN_SIZE'] = str(metadata['gzip_min_size'])
+        pagination = metadata.get('pagination')
+        if pagination:
+            env['PAGE_ORDER_BY'] = pagination.get('order_by', 'id')
+            env['PAGE_SIZE'] = str(pagination.get('default_limit', 50))
+            env['MAX_PAGE_SIZE'] = str(pagination.get('max_limit', 200))
+        return env
+
+    @staticmethod
+    def _function_settings(metadata):
+        """Return the Lambda settings declared for one endpoint"""
+        settings = {
+            name: metadata[name]
+            for name in ('memory_size', 'architecture',
+                         'reserved_concurrency', 'provisioned_concurrency')
+            if metadata.get(name) is not None
+        }
+        if metadata.get('timeout'):
+            settings['timeout'] = cdk.Duration.seconds(metadata['timeout'])
+        return settings
+
+    def _router_settings(self):
+        """
+        Combine the settings of all endpoints for the router function:
+        the largest memory size & timeout, arm64 only if every endpoint runs
+        on it, and the sum of the (reserved, provisioned) concurrencies
+        """
+        endpoints = [self._function_settings(metadata)
+                     for metadata in self._views.values()]
+        settings = {}
+        memory_sizes = [item['memory_size'] for item in endpoints
+                        if 'memory_size' in item]
+        if memory_sizes:
+            settings['memory_size'] = max(memory_sizes)
+        timeouts = [metadata['timeout'] for metadata in self._views.values()
+                    if metadata.get('timeout')]
+        if timeouts:
+            settings['timeout'] = cdk.Duration.seconds(max(timeouts))
+        if endpoints and all(item.get('architecture') == 'arm64'
+                             for item in endpoints):
+            settings['architecture'] = 'arm64'
+        # Unreserved endpoints can scale freely, so must the router
+        if endpoints and all('reserved_concurrency' in item
+                             for item in endpoints):
+            settings['reserved_concurrency'] = sum(
+                item['reserved_concurrency'] for item in endpoints
+            )
+        provisioned = sum(item.get('provisioned_concurrency', 0)
+                          for item in endpoints)
+        if provisioned:
+            settings['provisioned_concurrency'] = provisioned
+        return settings
+
+    @staticmethod
+    def _resource_path(endpoint, metadata):
+        if metadata.get('pathParams'):
+            return f'/{endpoint}/{metadata["pathParams"]}'
+        return f'/{endpoint}'
+
+    @staticmethod
+    def _query_parameters(metadata):
+        """Return the query string parameters declared by an endpoint"""
+        if metadata.get('pagination'):
+            return ['method.request.querystring.limit',
+                    'method.request.querystring.cursor']
+        return []
+
+    def _cache_key_parameters(self, metadata):
+        """
+        Return the method request parameters keying the stage cache of an
+        endpoint: its path parameter, its query string parameters, the
+        ``key_parameters`` of its ``cache``, and the caller identity
+        unless the cache is ``shared`` between callers
+        """
+        cache = metadata['cache']
+        keys = []
+        if metadata.get('pathParams'):
+            keys.append(
+                f'method.request.path.{metadata["pathParams"].strip("{}+")}'
+            )
+        keys.extend(self._query_parameters(metadata))
+        keys.extend(f'method.request.{name}'
+                    for name in cache.get('key_parameters', ()))
+        if self._api_auth and not cache.get('shared'):
+            keys.extend(source for source in self._identity_sources
+                        if source.startswith('method.request.'))
+        return list(dict.fromkeys(keys))
+
+    def _add_endpoint(self, endpoint, metadata, handler):
+        """Declare the resource & methods of one endpoint"""
+        child_node = self.root_node.root.add_resource(endpoint)
+
+        if metadata.get('pathParams'):
+            # ENDPOINT HAS PATH-PARAM
+            api_endpoint = child_node.add_resource(metadata['pathParams'])
+        else:
+            # ENDPOINT HAS NO PATH-PARAMS
+            api_endpoint = child_node
+
+        cache_keys = self._cache_key_parameters(metadata) \
+            if metadata.get('cache') else []
+        api_endpoint.add_method(
+            http_method=metadata.get('method'),
+            integration=api.LambdaIntegration(
+                handler,
+                proxy=True,
+                cache_key_parameters=cache_keys or None,
+            ),
+            authorizer=self._api_auth,
+            request_parameters={
+                key: key.startswith('method.request.path.')
+                for key in self._query_parameters(metadata) + cache_keys
+            } or None,
+        )
+
+        # ENABLE CORS
+        cors = metadata.get('cors') or {}
+        cors_preflight(
+            api_endpoint,
+            headers=self._headers,
+            methods=cors.get('methods') or [metadata.get('method')],
+            max_age=cors.get('max_age', self._cors_max_age),
+        )
+        return api_endpoint
+
     def __call__(self, **kwargs):
         self._handlers = {}
 
         # MODULE CODE
         root_directory = f'lambdas/{self._module_name}'
 
+        if self._mode == 'router':
+            # ONE LAMBDA FUNCTION DISPATCHING EVERY ENDPOINT OF THE MODULE
+            routes = {
+                endpoint: {
+                    'method': metadata.get('method'),
+                    'pathParams': metadata.get('pathParams'),
+                    'environment': self._endpoint_environment(
+                        endpoint, metadata, kwargs
+                    ),
+                }
+                for endpoint, metadata in self._views.items()
+            }
+            router = Handler(
+                self,
+                construct_id=f'{self._module_name}-router',
+                module_name=self._module_name,
+                fn_name='router',
+                handler='miracle.utils.router.handler',
+                env={
+                    **self._env,
+                    'ROUTER_VIEWS': json.dumps(routes, separators=(',', ':')),
+                },
+                layers=self._layers,
+                role=self._role,
+                code_location=f'{root_directory}/src',
+                **self._router_settings(),
+            )
+            for endpoint, metadata in self._views.items():
+                self._handlers[endpoint] = router
+                self._add_endpoint(endpoint, metadata, router.target)
+            return
+
         # LOOP TO PROVISION LAMBDA FUNCTIONS OF MODULE
         for endpoint, metadata in self._views.items():
 
             path = f'{root_directory}/src/{endpoint}'
 
             # UPDATE LAMBDA FUNCTION ENVIRONMENT
-            if kwargs.get(endpoint):
-                self._env.update(kwargs[endpoint])
-            if metadata.get('environment'):
-                self._env.update(metadata['environment'])
+            env = {
+                **self._env,
+                **self._endpoint_environment(endpoint, metadata, kwargs),
+            }
 
             # DECLARE LAMBDA FUNCTION
             self._handlers[endpoint] = Handler(
@@ -265,30 +527,13 @@ class API(cdk.Construct):
                 module_name=self._module_name,
                 fn_name=endpoint,
                 handler=f'{endpoint}.handler',
-                env=self._env,
+                env=env,
                 layers=self._layers,
                 role=self._role,
-                code_location=path
+                code_location=path,
+                **self._function_settings(metadata),
             )
 
             # ENDPOINT
-            child_node = self.root_node.root.add_resource(endpoint)
-
-            if metadata.get('pathParams'):
-                # ENDPOINT HAS PATH-PARAM
-                api_endpoint = child_node.add_resource(metadata['pathParams'])
-            else:
-                # ENDPOINT HAS NO PATH-PARAMS
-                api_endpoint = child_node
-
-            api_endpoint.add_method(
-                http_method=metadata.get('method'),
-                integration=api.LambdaIntegration(self._handlers[endpoint]),
-                authorizer=self._api_auth,
-            )
-
-            # ENABLE CORS
-            api_endpoint.add_method(
-                http_method='OPTIONS',
-                integration=api.LambdaIntegration(self.cors)
-            )
+            self._add_endpoint(endpoint, metadata,
+                               self._handlers[endpoint].target)
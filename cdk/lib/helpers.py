@@ -0,0 +1,53 @@
+"""
+This module defines the helpers shared by the CDK constructs
+"""
+from typing import Iterable, Mapping
+
+from aws_cdk import aws_apigateway as api
+
+
+def cors_preflight(resource: api.IResource,
+                   *,
+                   headers: Mapping[str, str],
+                   methods: Iterable[str],
+                   max_age: int = None,
+                   ) -> api.Method:
+    """
+    Answer the CORS preflight of a resource with an API Gateway MOCK
+    integration, so OPTIONS requests never reach a Lambda function.
+
+    Args:
+        resource (api.IResource): the resource receiving the preflight
+        headers (dict): the Access-Control-* response headers, values are
+            quoted static values, e.g. HEADER of the settings
+        methods (list): the methods allowed on the resource, replace the
+            Access-Control-Allow-Methods of ``headers``
+        max_age (int): the seconds browsers cache the preflight, sent as
+            Access-Control-Max-Age, default=browser default
+    """
+    response_headers = dict(headers)
+    response_headers['Access-Control-Allow-Methods'] = \
+        f"'{','.join(dict.fromkeys([*methods, 'OPTIONS']))}'"
+    if max_age is not None:
+        response_headers['Access-Control-Max-Age'] = f"'{max_age}'"
+    parameters = {
+        f'method.response.header.{name}': value
+        for name, value in response_headers.items()
+    }
+
+    return resource.add_method(
+        http_method='OPTIONS',
+        integration=api.MockIntegration(
+            request_templates={'application/json': '{"statusCode": 200}'},
+            passthrough_behavior=api.PassthroughBehavior.NEVER,
+            integration_responses=[api.IntegrationResponse(
+                status_code='200',
+                response_parameters=parameters,
+            )],
+        ),
+        method_responses=[api.MethodResponse(
+            status_code='200',
+            response_parameters={name: True for name in parameters},
+        )],
+        authorization_type=api.AuthorizationType.NONE,
+    )
@@ -27,3 +27,8 @@ SECRET_ARN = 'arn:aws:acm:us-east-1:573915606947:sm/5a4c6547-41b7-4f2e-8ab2-4cef
 
 # SETTINGS FOR AWS AURORA
 RESOURCE_ARN = 'arn:aws:acm:us-east-1:573915606947:aurora/5a4c6547-41b7-4f2e-8ab2-4cef78d693a8'
+
+# SETTINGS FOR THE JWT AUTHORIZER
+JWKS_URL = 'https://cognito-idp.us-east-1.amazonaws.com/us-east-1_example/.well-known/jwks.json'
+JWT_ISSUER = 'https://cognito-idp.us-east-1.amazonaws.com/us-east-1_example'
+JWT_AUDIENCE = ''
@@ -0,0 +1,110 @@
+"""
+This module benchmarks the decoding of ExecuteStatement results to model
+instances.
+
+It builds the responses of a SELECT of ``User`` rows and reports, for
+each path, the ``json.loads`` of the response body and the loading of the
+instances:
+- generic: ``decode_field`` for every cell, as before the typed decoders
+- typed: the decoders precompiled per column by ``Options.record_loader``
+- json: the ``formatRecordsAs='JSON'`` rows used by ``QuerySet``
+
+botocore's per-cell parsing of ``records``, which the JSON format also
+avoids, is not measured.
+
+    python -m deploy_scripts.benchmark_decoder
+    python -m deploy_scripts.benchmark_decoder --rows 50000
+"""
+import argparse
+import gc
+import json
+import time
+
+from miracle.euni.users import User
+from miracle.utils.data_api import decode_field
+
+
+def make_rows(count):
+    return [
+        {'id': index, 'created_by': index % 10 or None, 'updated_by': None,
+         'created_at': 1600000000 + index, 'updated_at': None,
+         'fname': f'First {index}', 'last_name': f'Last {index}'}
+        for index in range(1, count + 1)
+    ]
+
+
+def to_field(value):
+    if value is None:
+        return {'isNull': True}
+    if isinstance(value, int):
+        return {'longValue': value}
+    return {'stringValue': value}
+
+
+def generic(cls, records, columns):
+    """The former ``from_records``: one generic decode per cell"""
+    setters = {'id': cls.id.__set__}
+    setters.update((f.column, f.slot.__set__)
+                   for f in cls._meta.fields.values())
+    loaded = [(setters[column], index) for index, column in enumerate(columns)]
+    instances = []
+    for record in records:
+        instance = cls.__new__(cls)
+        for setter, index in loaded:
+            setter(instance, decode_field(record[index]))
+        instances.append(instance)
+    return instances
+
+
+def timed(function, repeat):
+    """Return the best time of ``repeat`` runs, without GC pauses"""
+    best = float('inf')
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function()
+            best = min(best, time.perf_counter() - started)
+    finally:
+        gc.enable()
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=10000,
+                        help='number of rows of the result')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='runs of each path, the best one is reported')
+    options = parser.parse_args()
+
+    columns = ('id',) + User._meta.column_names
+    rows = make_rows(options.rows)
+    records_body = json.dumps({'records': [
+        [to_field(row[column]) for column in columns] for row in rows
+    ]})
+    json_body = json.dumps({'formattedRecords': json.dumps(rows)})
+
+    paths = {
+        'generic': (lambda: json.loads(records_body)['records'],
+                    lambda records: generic(User, records, columns)),
+        'typed': (lambda: json.loads(records_body)['records'],
+                  lambda records: User.from_records(records, columns)),
+        'json': (lambda: json.loads(json.loads(json_body)['formattedRecords']),
+                 lambda rows: User.from_json(rows, columns)),
+    }
+    results = {}
+    print(f'{options.rows} rows     parse      load     total')
+    for name, (parse, load) in paths.items():
+        parse_seconds, parsed = timed(parse, options.repeat)
+        load_seconds, instances = timed(lambda: load(parsed), options.repeat)
+        results[name] = [instance.to_dict() for instance in instances]
+        print(f'{name:10} {parse_seconds * 1000:6.1f} ms '
+              f'{load_seconds * 1000:6.1f} ms '
+              f'{(parse_seconds + load_seconds) * 1000:6.1f} ms')
+    if not results['generic'] == results['typed'] == results['json']:
+        raise RuntimeError('The decoders loaded different instances')
+
+
+if __name__ == '__main__':
+    main()
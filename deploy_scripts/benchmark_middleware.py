@@ -0,0 +1,61 @@
+"""
+This module benchmarks the overhead of the handler middleware of
+``miracle.utils.decorators``.
+
+It wraps a handler returning a small model response and reports the
+percentiles of the ``Middleware`` timing the middleware records for
+itself, and the wall time of a call compared with the bare handler.
+
+    python -m deploy_scripts.benchmark_middleware
+    python -m deploy_scripts.benchmark_middleware --calls 100000
+"""
+import argparse
+import time
+
+from miracle.euni.users import User
+from miracle.utils import metrics
+from miracle.utils.decorators import middleware
+
+EVENT = {'httpMethod': 'GET', 'resource': '/get/{user_id}',
+         'pathParameters': {'user_id': '1'}}
+
+
+def handle(event, context):
+    return {'statusCode': 200,
+            'body': {'user': User(id=1, first_name='Ada', last_name='L')}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--calls', type=int, default=20000,
+                        help='number of warm invocations')
+    options = parser.parse_args()
+
+    recorded = []
+    metrics.finish = lambda invocation, rate=None: recorded.append(
+        invocation.metrics['Middleware'][0]
+    )
+    handler = middleware()(handle)
+    handler(EVENT, None)
+    recorded.clear()
+
+    started = time.perf_counter()
+    for _ in range(options.calls):
+        handle(EVENT, None)
+    bare = (time.perf_counter() - started) / options.calls
+
+    started = time.perf_counter()
+    for _ in range(options.calls):
+        handler(EVENT, None)
+    wrapped = (time.perf_counter() - started) / options.calls
+
+    recorded.sort()
+    for percentile in (50, 90, 99):
+        value = recorded[len(recorded) * percentile // 100]
+        print(f'{f"Middleware p{percentile}":16} {value * 1000:8.1f} us')
+    print(f'{"bare handler":16} {bare * 1e6:8.1f} us')
+    print(f'{"with middleware":16} {wrapped * 1e6:8.1f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+This module builds the slim Lambda layers deployed by ``cdk.layer_stack``.
+
+Each layer of ``layers/<name>`` is copied to ``build/layers/<name>``:
+- tests, caches, docs, type stubs and C sources are stripped, and the
+  package metadata unless --keep-metadata
+- a package shipped by several layers is only kept in the first one of
+  LAYERS, every function attaching all of them
+- the sources are precompiled to unchecked-hash .pyc for each Lambda
+  runtime of RUNTIMES, so imports never stat or recompile the sources;
+  every --python interpreter must be one of these runtimes, .pyc of any
+  other version would only be dead weight
+
+A report of the size and of the import time of every package is written
+to ``build/layers/report.json``.
+
+    python -m deploy_scripts.build_layers
+    python -m deploy_scripts.build_layers --python /opt/py38/bin/python3
+"""
+import argparse
+import fnmatch
+import json
+import os
+import shutil
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = os.path.join(ROOT, 'layers')
+BUILD = os.path.join(ROOT, 'build', 'layers')
+
+# Deduplication priority: the jwt layer is attached to every function
+LAYERS = ('jwt', 'common')
+
+# The Python runtimes of the functions: 3.7 on x86_64, 3.8 on arm64
+RUNTIMES = ('3.7', '3.8')
+
+STRIPPED_DIRECTORIES = (
+    '__pycache__', 'tests', 'test', 'docs', 'examples', 'benchmarks',
+)
+STRIPPED_FILES = (
+    '*.pyc', '*.pyo', '*.pyi', '*.pyx', '*.pxd', '*.c', '*.h', '*.cpp',
+    '*.md', '*.rst', 'py.typed', '.DS_Store',
+)
+METADATA = ('*.dist-info', '*.egg-info')
+
+IMPORT_SCRIPT = '''
+import importlib, sys, time
+started = time.perf_counter()
+importlib.import_module(sys.argv[1])
+print(int((time.perf_counter() - started) * 1e6))
+'''
+
+
+def site_directory(layer):
+    """Return the directory on sys.path of a layer, ``python/`` if any"""
+    python = os.path.join(layer, 'python')
+    return python if os.path.isdir(python) else layer
+
+
+def directory_size(path):
+    size = count = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(directory, name))
+            count += 1
+    return size, count
+
+
+def top_level_packages(site):
+    """Return ``{name: entry}`` of the importable packages of a layer"""
+    packages = {}
+    for entry in sorted(os.listdir(site)):
+        path = os.path.join(site, entry)
+        if os.path.isdir(path):
+            if not any(fnmatch.fnmatch(entry, pattern)
+                       for pattern in METADATA):
+                packages[entry] = path
+        elif entry.endswith('.py'):
+            packages[entry[:-3]] = path
+        elif entry.endswith('.so'):
+            packages[entry.split('.', 1)[0]] = path
+    return packages
+
+
+def strip(site, keep_metadata=False):
+    """Remove the files never used at runtime from a layer"""
+    patterns = STRIPPED_DIRECTORIES + (() if keep_metadata else METADATA)
+    for directory, directories, files in os.walk(site, topdown=True):
+        for name in list(directories):
+            if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                shutil.rmtree(os.path.join(directory, name))
+                directories.remove(name)
+        for name in files:
+            # Licenses stay with the package they cover
+            if name.upper().startswith(('LICENSE', 'COPYING', 'NOTICE')):
+                continue
+            if any(fnmatch.fnmatch(name, pattern)
+                   for pattern in STRIPPED_FILES):
+                os.remove(os.path.join(directory, name))
+
+
+def deduplicate(sites):
+    """
+    Remove from every layer the packages of the layers before it in
+    LAYERS, return ``{layer: [removed packages]}``
+    """
+    seen = set()
+    removed = {}
+    for name, site in sites.items():
+        packages = top_level_packages(site)
+        removed[name] = sorted(set(packages) & seen)
+        for package in removed[name]:
+            path = packages[package]
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        seen.update(packages)
+    return removed
+
+
+def runtime_version(interpreter):
+    """Return the ``major.minor`` version of an interpreter"""
+    try:
+        result = subprocess.run(
+            [interpreter, '-c',
+             'import sys; print("%d.%d" % sys.version_info[:2])'],
+            capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        raise ValueError(f'Can\'t run the interpreter {interpreter}') \
+            from None
+    return result.stdout.strip()
+
+
+def check_interpreters(interpreters, runtimes=RUNTIMES):
+    """Reject the interpreters which don't match a Lambda runtime"""
+    for interpreter in interpreters:
+        version = runtime_version(interpreter)
+        if version not in runtimes:
+            raise ValueError(
+                f'{interpreter} is Python {version}, the Lambda runtimes '
+                f'are {", ".join(runtimes)}: its .pyc would never be used'
+            )
+
+
+def precompile(site, interpreter):
+    subprocess.run(
+        [interpreter, '-m', 'compileall', '-q', '-j', '0',
+         '--invalidation-mode', 'unchecked-hash', site],
+        check=True,
+    )
+
+
+def import_times(sites, interpreter):
+    """Return ``{layer: {package: import time in ms}}`` of fresh imports"""
+    path = os.pathsep.join(sites.values())
+    report = {}
+    for name, site in sites.items():
+        report[name] = {}
+        for package in top_level_packages(site):
+            result = subprocess.run(
+                [interpreter, '-c', IMPORT_SCRIPT, package],
+                capture_output=True, text=True,
+                env={**os.environ, 'PYTHONPATH': path},
+            )
+            report[name][package] = \
+                int(result.stdout.strip()) / 1000 if not result.returncode \
+                else None
+    return report
+
+
+def build(layers=LAYERS, interpreters=None, keep_metadata=False,
+          source=SOURCE, target=BUILD):
+    """
+    Build the layers, precompiled by ``interpreters``, default=one
+    ``python<version>`` per runtime of RUNTIMES
+    """
+    interpreters = interpreters or \
+        tuple(f'python{version}' for version in RUNTIMES)
+    check_interpreters(interpreters)
+    report = {}
+    sites = {}
+    for name in layers:
+        source_layer = os.path.join(source, name)
+        target_layer = os.path.join(target, name)
+        shutil.rmtree(target_layer, ignore_errors=True)
+        shutil.copytree(source_layer, target_layer)
+        report[name] = {'source_bytes': directory_size(source_layer)[0]}
+        sites[name] = site_directory(target_layer)
+        strip(sites[name], keep_metadata)
+
+    removed = deduplicate(sites)
+    for interpreter in interpreters:
+        for site in sites.values():
+            precompile(site, interpreter)
+
+    imports = import_times(sites, interpreters[0])
+    for name in layers:
+        size, count = directory_size(os.path.join(target, name))
+        report[name].update(bytes=size, files=count,
+                            deduplicated=removed[name],
+                            import_ms=imports[name])
+    with open(os.path.join(target, 'report.json'), 'w') as fp:
+        json.dump(report, fp, indent=2, sort_keys=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--python', action='append', dest='interpreters',
+                        help='runtime interpreter precompiling the layers, '
+                             'repeat for each runtime, default=python3.7 '
+                             'and python3.8 on the PATH')
+    parser.add_argument('--keep-metadata', action='store_true',
+                        help='keep the dist-info/egg-info of the packages')
+    options = parser.parse_args()
+
+    try:
+        report = build(interpreters=options.interpreters,
+                       keep_metadata=options.keep_metadata)
+    except ValueError as error:
+        parser.error(str(error))
+    for name, layer in report.items():
+        print(f'{name}: {layer["source_bytes"] / 1e6:.1f} MB -> '
+              f'{layer["bytes"] / 1e6:.1f} MB, {layer["files"]} files')
+        if layer['deduplicated']:
+            print(f'    removed, already in an earlier layer: '
+                  f'{", ".join(layer["deduplicated"])}')
+        for package, milliseconds in sorted(
+                layer['import_ms'].items(),
+                key=lambda item: -(item[1] or 0)):
+            timing = 'failed' if milliseconds is None \
+                else f'{milliseconds:8.1f} ms'
+            print(f'    {timing:>11}  {package}')
+
+
+if __name__ == '__main__':
+    main()
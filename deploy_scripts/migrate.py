@@ -0,0 +1,45 @@
+"""
+This module prints the incremental SQL migration between the deployed
+schema snapshot and the current models.
+
+    python -m deploy_scripts.migrate            # print the statements
+    python -m deploy_scripts.migrate --write    # also update the snapshot
+
+With --concurrently, the indexes of existing tables are built without
+blocking writes; run the statements one by one, outside of a transaction.
+"""
+import argparse
+import os
+
+from miracle.db import migrations
+from miracle.euni.users import User
+from miracle.euni.dictionary import Dictionary
+
+
+MODELS = [User, Dictionary]
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), 'schema.json')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--lock-timeout', default='5s')
+    parser.add_argument('--concurrently', action='store_true',
+                        help='create & drop indexes of existing tables '
+                             'CONCURRENTLY')
+    parser.add_argument('--write', action='store_true',
+                        help='record the current models as the new snapshot')
+    options = parser.parse_args()
+
+    statements, current = migrations.migrate(
+        MODELS, options.snapshot, lock_timeout=options.lock_timeout,
+        concurrently=options.concurrently,
+    )
+    print('\n'.join(statements))
+    if options.write:
+        migrations.write_snapshot(current, options.snapshot)
+
+
+if __name__ == '__main__':
+    main()
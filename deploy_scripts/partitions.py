@@ -0,0 +1,40 @@
+"""
+This module maintains the partitions of the partitioned models: it creates
+the upcoming partitions ahead of time and detaches the ones past their
+retention. Meant to run on a schedule, e.g. daily.
+
+    python -m deploy_scripts.partitions             # print the statements
+    python -m deploy_scripts.partitions --execute   # also run them
+"""
+import argparse
+
+from miracle.db import partitions
+from miracle.utils import data_api
+from deploy_scripts.migrate import MODELS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--execute', action='store_true',
+                        help='run the statements through the Data API')
+    parser.add_argument('--concurrently', action='store_true',
+                        help='DETACH PARTITION CONCURRENTLY, PostgreSQL 14+')
+    options = parser.parse_args()
+
+    for model in MODELS:
+        if model._meta.partition_by is None:
+            continue
+        statements = partitions.maintenance_statements(
+            model, partitions.list_partitions(model),
+            concurrently=options.concurrently,
+        )
+        for statement in statements:
+            print(statement)
+            if options.execute:
+                # Statement by statement: CONCURRENTLY can't run in a
+                # transaction block
+                data_api.execute_statement(statement)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+This module profiles the cold-start import cost of every API handler.
+
+Each handler listed in the ``views`` of a module under ``src`` is imported
+in a fresh interpreter with ``-X importtime``; the import time of the
+handler and of its slowest modules is reported, and the check fails when
+a handler takes longer than the threshold.
+
+    python -m deploy_scripts.profile_imports
+    python -m deploy_scripts.profile_imports --threshold-ms 150 --top 5
+"""
+import argparse
+import glob
+import importlib
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports the handler file like the Lambda runtime does, then prints the
+# wall time it took in microseconds. The marker separates the imports of
+# the profiling script itself (pkgutil is imported lazily by run_path)
+# from the handler ones
+MARKER = '-- handler --'
+IMPORT_SCRIPT = f'''
+import pkgutil, runpy, sys, time
+sys.stderr.write({MARKER!r} + '\\n')
+started = time.perf_counter()
+runpy.run_path(sys.argv[1], run_name='handler')
+print(int((time.perf_counter() - started) * 1e6))
+'''
+
+
+def find_handlers(root=ROOT):
+    """Yield ``(module, endpoint, path)`` of the handlers in the views"""
+    for views_path in sorted(glob.glob(os.path.join(root, 'src', '*',
+                                                    'views.py'))):
+        module = os.path.basename(os.path.dirname(views_path))
+        views = importlib.import_module(f'src.{module}.views').url
+        for endpoint in views:
+            yield module, endpoint, os.path.join(
+                os.path.dirname(views_path), endpoint, f'{endpoint}.py'
+            )
+
+
+def parse_importtime(stderr):
+    """Return ``{module: (self_us, cumulative_us)}`` from -X importtime"""
+    modules = {}
+    if MARKER in stderr:
+        stderr = stderr.split(MARKER, 1)[1]
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def profile(path, root=ROOT):
+    """Import one handler in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', IMPORT_SCRIPT, path],
+        cwd=root, capture_output=True, text=True,
+        env={**os.environ, 'PYTHONPATH': root},
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return int(result.stdout.strip().splitlines()[-1]), \
+        parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threshold-ms', type=float, default=200,
+                        help='fail when a handler imports slower than this')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of slowest modules shown per handler')
+    options = parser.parse_args()
+
+    failed = []
+    for module, endpoint, path in find_handlers():
+        name = f'{module}/{endpoint}'
+        if not os.path.exists(path):
+            print(f'{name}: no handler at {os.path.relpath(path, ROOT)}')
+            continue
+        total_us, modules = profile(path)
+        print(f'{name}: {total_us / 1000:.1f} ms')
+        slowest = sorted(modules.items(), key=lambda item: item[1][0],
+                         reverse=True)[:options.top]
+        for module_name, (self_us, cumulative_us) in slowest:
+            print(f'    {self_us / 1000:8.1f} ms self '
+                  f'{cumulative_us / 1000:8.1f} ms cumulative  {module_name}')
+        if total_us / 1000 > options.threshold_ms:
+            failed.append(name)
+
+    if failed:
+        print(f'Import time over {options.threshold_ms} ms: '
+              f'{", ".join(failed)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+"""
+This module defines the schema migration helpers.
+
+The current models are described as a serializable schema snapshot. A
+snapshot is compared with the previously deployed one to produce the
+minimal list of ALTER statements, instead of re-running the full
+CREATE TABLE scripts.
+"""
+import json
+import os
+
+from miracle.db.query import quote_name
+
+SNAPSHOT_VERSION = 1
+
+PRIMARY_KEY = {
+    'type': 'BIGSERIAL',
+    'nullable': False,
+    'unique': False,
+    'default': None,
+    'references': None,
+    'primary_key': True,
+}
+
+
+def table_state(model):
+    """Describe the table of a model from its field registry"""
+    meta = model._meta
+    columns = {'id': dict(PRIMARY_KEY)}
+    for field in meta.fields.values():
+        columns[field.column] = field.describe()
+    return {
+        'table_name': meta.table_name,
+        'db_schema': meta.db_schema,
+        'columns': columns,
+        'indexes': meta.index_scripts(),
+        'partition': meta.partition_by.describe(meta)
+        if meta.partition_by else None,
+    }
+
+
+def snapshot(models):
+    """Build the schema snapshot of the given models"""
+    return {
+        'version': SNAPSHOT_VERSION,
+        'tables': {
+            model._meta.db_table: table_state(model) for model in models
+        },
+    }
+
+
+def empty_snapshot():
+    return {'version': SNAPSHOT_VERSION, 'tables': {}}
+
+
+def load_snapshot(path):
+    """Read a snapshot file, an absent file means an empty database"""
+    if not os.path.exists(path):
+        return empty_snapshot()
+    with open(path) as fp:
+        state = json.load(fp)
+    if state.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(
+            f'Unsupported schema snapshot version: {state.get("version")}'
+        )
+    return state
+
+
+def write_snapshot(state, path):
+    with open(path, 'w') as fp:
+        json.dump(state, fp, indent=2)
+        fp.write('\n')
+
+
+def column_definition(column, state):
+    """Render the column definition used by CREATE TABLE and ADD COLUMN"""
+    column = quote_name(column)
+    if state.get('primary_key'):
+        return f'{column} {state["type"]} PRIMARY KEY'
+    script = f'{column} {state["type"]}'
+    if state['references']:
+        script += f' REFERENCES {quote_name(state["references"]["table"])}' \
+                  f' ({quote_name(state["references"]["column"])})'
+        if state['references']['on_delete']:
+            script += f' ON DELETE {state["references"]["on_delete"]}'
+    if state['default']:
+        script += f' DEFAULT {state["default"]}'
+    if not state['nullable']:
+        script += ' NOT NULL'
+    if state['unique']:
+        script += ' UNIQUE'
+    return script
+
+
+def create_table(table, state):
+    """
+    Render the CREATE TABLE statement of a table state, the one renderer
+    used by migrations and ``Model.generate_ddl_scripts``
+    """
+    partition = state.get('partition')
+    rows = []
+    for column, column_state in state['columns'].items():
+        if partition and column_state.get('primary_key'):
+            # The primary key of a partitioned table includes its key
+            rows.append(f'{quote_name(column)} {column_state["type"]}')
+        else:
+            rows.append(column_definition(column, column_state))
+    suffix = ''
+    if partition:
+        key = quote_name(partition['column'])
+        rows.append(f'PRIMARY KEY ("id", {key})')
+        suffix = f' PARTITION BY {partition["method"]} ({key})'
+    rows = ',\n\t'.join(rows)
+    return f'CREATE TABLE {quote_name(table)} (\n\t{rows}\n){suffix};'
+
+
+def _dependency_order(tables):
+    """Order tables so that referenced tables come before referencing ones"""
+    ordered = []
+    visiting = set()
+
+    def visit(table):
+        if table in ordered or table in visiting:
+            return
+        visiting.add(table)
+        for column_state in tables[table]['columns'].values():
+            references = column_state['references']
+            if references and references['table'] in tables:
+                visit(references['table'])
+        visiting.discard(table)
+        ordered.append(table)
+
+    for table in tables:
+        visit(table)
+    return ordered
+
+
+def _add_column(table, column, state):
+    """
+    Add a column to a populated table. A required column needs a default:
+    PostgreSQL 11+ stores a non-volatile default in the catalog, so
+    ``ADD COLUMN ... DEFAULT ... NOT NULL`` neither rewrites nor scans the
+    table and only holds its lock briefly.
+    """
+    if not state['nullable'] and not state['default']:
+        raise ValueError(
+            f'The required column {table}.{column} can\'t be added to an '
+            f'existing table: make it nullable or give it a default'
+        )
+    return [
+        f'ALTER TABLE {quote_name(table)} ADD COLUMN '
+        f'{column_definition(column, state)};'
+    ]
+
+
+def _alter_column(table, table_name, column, old, new):
+    """
+    Return the statements altering a column; the constraints are named
+    after the unqualified ``table_name``, as PostgreSQL names them
+    """
+    prefix = f'ALTER TABLE {quote_name(table)}'
+    name = quote_name(column)
+    statements = []
+    if old['references'] != new['references'] and old['references']:
+        statements.append(
+            f'{prefix} DROP CONSTRAINT IF EXISTS'
+            f' {table_name}_{column}_fkey;'
+        )
+    if old['type'] != new['type']:
+        statements.append(
+            f'{prefix} ALTER COLUMN {name} TYPE {new["type"]}'
+            f' USING {name}::{new["type"]};'
+        )
+    if old['default'] != new['default']:
+        if new['default']:
+            statements.append(
+                f'{prefix} ALTER COLUMN {name}'
+                f' SET DEFAULT {new["default"]};'
+            )
+        else:
+            statements.append(
+                f'{prefix} ALTER COLUMN {name} DROP DEFAULT;'
+            )
+    if old['nullable'] != new['nullable']:
+        action = 'DROP' if new['nullable'] else 'SET'
+        statements.append(
+            f'{prefix} ALTER COLUMN {name} {action} NOT NULL;'
+        )
+    if old['unique'] != new['unique']:
+        if new['unique']:
+            statements.append(
+                f'{prefix} ADD CONSTRAINT {table_name}_{column}_key'
+                f' UNIQUE ({name});'
+            )
+        else:
+            statements.append(
+                f'{prefix} DROP CONSTRAINT IF EXISTS'
+                f' {table_name}_{column}_key;'
+            )
+    if old['references'] != new['references'] and new['references']:
+        references = new['references']
+        script = f'{prefix} ADD CONSTRAINT {table_name}_{column}_fkey' \
+                 f' FOREIGN KEY ({name}) REFERENCES' \
+                 f' {quote_name(references["table"])}' \
+                 f' ({quote_name(references["column"])})'
+        if references['on_delete']:
+            script += f' ON DELETE {references["on_delete"]}'
+        statements.append(f'{script};')
+    return statements
+
+
+def _concurrently(script):
+    """Turn a CREATE/DROP INDEX statement into its CONCURRENTLY form"""
+    return script.replace(' INDEX ', ' INDEX CONCURRENTLY ', 1)
+
+
+def diff(old, new, *, concurrently=False):
+    """
+    Compare two snapshots and return the SQL statements migrating the
+    database from ``old`` to ``new``, in dependency order:
+
+    - drop removed or changed indexes
+    - create new tables, referenced tables first
+    - add, alter then drop columns of existing tables
+    - drop removed tables, referencing tables first
+    - create new or changed indexes
+
+    With ``concurrently``, the indexes of existing tables are created and
+    dropped CONCURRENTLY so writes are not blocked. Such statements can't
+    run in a transaction block.
+    """
+    old_tables = old['tables']
+    new_tables = new['tables']
+
+    drop_indexes = []
+    create_indexes = []
+    create_tables = []
+    add_columns = []
+    alter_columns = []
+    drop_columns = []
+    drop_tables = []
+
+    for table in _dependency_order(new_tables):
+        new_state = new_tables[table]
+        old_state = old_tables.get(table)
+        if old_state and \
+                old_state.get('partition') != new_state.get('partition'):
+            raise ValueError(
+                f'Changing the partitioning of {table} needs a data copy, '
+                f'it is not migrated in place'
+            )
+        old_indexes = old_state['indexes'] if old_state else {}
+        # New tables are empty, building their indexes blocks nothing, and
+        # partitioned parents can't be indexed CONCURRENTLY
+        online = _concurrently if concurrently and old_state \
+            and not new_state.get('partition') else str
+        schema = f'{new_state["db_schema"]}.' if new_state['db_schema'] \
+            else ''
+
+        for name, script in old_indexes.items():
+            if new_state['indexes'].get(name) != script:
+                drop_indexes.append(
+                    online(f'DROP INDEX IF EXISTS {schema}{name};')
+                )
+        for name, script in new_state['indexes'].items():
+            if old_indexes.get(name) != script:
+                create_indexes.append(online(script))
+
+        if old_state is None:
+            create_tables.append(create_table(table, new_state))
+            continue
+
+        old_columns = old_state['columns']
+        for column, column_state in new_state['columns'].items():
+            if column not in old_columns:
+                add_columns.extend(_add_column(table, column, column_state))
+            elif old_columns[column] != column_state:
+                alter_columns.extend(_alter_column(
+                    table, new_state['table_name'], column,
+                    old_columns[column], column_state,
+                ))
+        for column in old_columns:
+            if column not in new_state['columns']:
+                drop_columns.append(
+                    f'ALTER TABLE {quote_name(table)} '
+                    f'DROP COLUMN {quote_name(column)};'
+                )
+
+    removed = {
+        table: state for table, state in old_tables.items()
+        if table not in new_tables
+    }
+    for table in reversed(_dependency_order(removed)):
+        drop_tables.append(f'DROP TABLE {quote_name(table)};')
+
+    return drop_indexes + create_tables + add_columns + alter_columns \
+        + drop_columns + drop_tables + create_indexes
+
+
+def migrate(models, path, *, lock_timeout='5s', concurrently=False):
+    """
+    Return the statements migrating the snapshot stored at ``path`` to the
+    given models together with the new snapshot. ``lock_timeout`` bounds
+    how long each statement may wait for its lock on a live table, and
+    ``concurrently`` builds the indexes of existing tables online.
+    """
+    current = snapshot(models)
+    statements = diff(load_snapshot(path), current,
+                      concurrently=concurrently)
+    if statements and lock_timeout:
+        statements.insert(0, f"SET lock_timeout = '{lock_timeout}';")
+    return statements, current
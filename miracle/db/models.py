@@ -1,49 +1,466 @@
-import inspect
+import json
 from decimal import Decimal
-from typing import Optional, ClassVar
+from types import MappingProxyType
+
+from miracle.db.query import DEFAULT_BATCH_SIZE
+from miracle.db.query import Manager
+from miracle.db.query import bulk_create
+from miracle.db.query import bulk_update
+from miracle.db.query import compile_insert
+from miracle.db.query import compile_update
+from miracle.db.query import quote_name
+from miracle.utils import data_api
+from miracle.utils.data_api import decode_field
+from miracle.utils.data_api import execute_statement
+
+
+class Options:
+    """
+    Per-model field registry, built once by ``ModelBase`` when the class
+    is created. Fields are kept in column order: inherited fields first,
+    then the fields declared on the class itself.
+    """
+
+    def __init__(self, model, fields):
+        meta = getattr(model, 'Meta', None)
+        self.model = model
+        self.table_name = getattr(meta, 'table_name', None) or model.__name__
+        self.db_schema = getattr(meta, 'db_schema', None)
+        self.db_table = f'{self.db_schema}.{self.table_name}' \
+            if self.db_schema else self.table_name
+
+        self.fields = MappingProxyType(fields)
+        self.field_names = tuple(fields)
+        self.column_names = tuple(f.column for f in fields.values())
+        self.columns = MappingProxyType(
+            {f.column: f for f in fields.values()}
+        )
+        self.column_order = MappingProxyType(
+            {column: i for i, column in enumerate(self.column_names)}
+        )
+        self._record_loaders = {}
+        self._json_loaders = {}
+        self._validator = None
+        self._serializer = None
+
+        # Single-column indexes of the fields, then the Meta ones
+        self.indexes = tuple(
+            Index(attname) for attname, f in fields.items()
+            if f.db_index and not f.unique
+        ) + tuple(getattr(meta, 'indexes', ()))
+        for index in self.indexes:
+            index.resolve(self)
+
+        self.partition_by = getattr(meta, 'partition_by', None)
+        if self.partition_by is not None and fields:
+            self.partition_by.check(self)
+
+    @property
+    def validator(self):
+        """The model validator, compiled on first use"""
+        if self._validator is None:
+            from miracle.db import validation
+            self._validator = validation.compile_validator(self.model)
+        return self._validator
+
+    @property
+    def serializer(self):
+        """The JSON serializer of the instances, compiled on first use"""
+        if self._serializer is None:
+            from miracle.utils import response
+            self._serializer = response.compile_serializer(self.model)
+        return self._serializer
+
+    def get_field(self, name):
+        return self.fields[name]
+
+    def index_scripts(self, *, concurrently=False):
+        """Return the CREATE INDEX statement of each index, by name"""
+        return {
+            index.name_for(self): index.to_sql(self, concurrently=concurrently)
+            for index in self.indexes
+        }
+
+    def _column_loaders(self):
+        """Return ``{column: (slot setter, field)}``, ``id`` first"""
+        loaders = {'id': (self.model.id.__set__, None)}
+        loaders.update(
+            (f.column, (f.slot.__set__, f)) for f in self.fields.values()
+        )
+        return loaders
+
+    def record_loader(self, columns):
+        """
+        Return the precompiled loader of records with the given columns, as
+        ``(loaded, missing)``: the ``(cell index, slot setter, decoder)``
+        of each known column, and the setters of the fields absent from
+        the records.
+        """
+        loader = self._record_loaders.get(columns)
+        if loader is None:
+            slots = self._column_loaders()
+            loaded = []
+            for index, column in enumerate(columns):
+                if column not in slots:
+                    continue
+                setter, field = slots.pop(column)
+                loaded.append((
+                    index, setter,
+                    field.decoder() if field else data_api.decode_long,
+                ))
+            loader = self._record_loaders[columns] = (
+                tuple(loaded), tuple(setter for setter, _ in slots.values())
+            )
+        return loader
+
+    def json_loader(self, columns):
+        """
+        Return the precompiled loader of ``formatRecordsAs=JSON`` rows with
+        the given columns, as ``(loaded, missing)``: the ``(column, slot
+        setter, converter)`` of each known column, the converter being
+        ``None`` when the JSON value is used as is, and the setters of the
+        fields absent from the rows.
+        """
+        loader = self._json_loaders.get(columns)
+        if loader is None:
+            slots = self._column_loaders()
+            loaded = []
+            for column in columns:
+                if column not in slots:
+                    continue
+                setter, field = slots.pop(column)
+                loaded.append((
+                    column, setter, field.json_decoder() if field else None,
+                ))
+            loader = self._json_loaders[columns] = (
+                tuple(loaded), tuple(setter for setter, _ in slots.values())
+            )
+        return loader
+
+
+class ModelBase(type):
+    """
+    Metaclass collecting the ``Field`` attributes of a model into its
+    ``_meta`` registry so no reflection is needed afterwards.
+    """
+
+    def __new__(mcs, name, bases, attrs):
+        if not bases:
+            # ``Model`` itself declares no fields
+            cls = super().__new__(mcs, name, bases, attrs)
+            cls._meta = Options(cls, {})
+            return cls
+
+        # Instances keep their values in slots, the Field descriptors
+        # read and write them
+        own_fields = {
+            attr_name: value for attr_name, value in attrs.items()
+            if isinstance(value, Field)
+        }
+        attrs['__slots__'] = tuple(attrs.get('__slots__', ())) + tuple(
+            Field.slot_name_for(attr_name) for attr_name in own_fields
+        )
+        cls = super().__new__(mcs, name, bases, attrs)
+
+        fields = {}
+        for base in reversed(cls.__mro__[1:]):
+            base_meta = base.__dict__.get('_meta')
+            if isinstance(base_meta, Options):
+                fields.update(base_meta.fields)
+
+        for attr_name, value in attrs.items():
+            if attr_name in own_fields:
+                value.attname = attr_name
+                value.slot = cls.__dict__[Field.slot_name_for(attr_name)]
+                fields.pop(attr_name, None)
+                fields[attr_name] = value
+            elif attr_name in fields:
+                # A plain attribute shadows (removes) an inherited field
+                del fields[attr_name]
+
+        cls._meta = Options(cls, fields)
+        return cls
 
 
-class Model:
+class Model(metaclass=ModelBase):
+
+    __slots__ = ('id',)
+
+    objects = Manager()
+
+    def __init__(self, **kwargs):
+        self.id = kwargs.pop('id', None)
+        for attname, field in self._meta.fields.items():
+            field.slot.__set__(self, kwargs.pop(attname, None))
+        if kwargs:
+            raise TypeError(
+                f'{type(self).__name__}() got unexpected fields: '
+                f'{", ".join(kwargs)}'
+            )
+
+    @classmethod
+    def from_records(cls, records, columns):
+        """
+        Build instances from Data API records
+
+        Args:
+            records (list): the ``records`` of an ExecuteStatement response
+            columns (iterable): the column name of each record cell,
+                e.g. taken from ``columnMetadata``
+
+        Returns:
+            list: one instance per record
+        """
+        loaded, missing = cls._meta.record_loader(tuple(columns))
+        new = cls.__new__
+        instances = []
+        for record in records:
+            instance = new(cls)
+            for index, setter, decode in loaded:
+                setter(instance, decode(record[index]))
+            for setter in missing:
+                setter(instance, None)
+            instances.append(instance)
+        return instances
+
+    @classmethod
+    def from_json(cls, rows, columns):
+        """
+        Build instances from the rows of an ExecuteStatement response run
+        with ``formatRecordsAs='JSON'``
+
+        Args:
+            rows (list): the decoded ``formattedRecords``, one dict per row
+            columns (iterable): the selected columns
+
+        Returns:
+            list: one instance per row
+        """
+        loaded, missing = cls._meta.json_loader(tuple(columns))
+        new = cls.__new__
+        instances = []
+        for row in rows:
+            instance = new(cls)
+            for column, setter, convert in loaded:
+                value = row.get(column)
+                if convert is not None and value is not None:
+                    value = convert(value)
+                setter(instance, value)
+            for setter in missing:
+                setter(instance, None)
+            instances.append(instance)
+        return instances
+
+    @classmethod
+    def from_response(cls, response, columns=None):
+        """
+        Build instances from an ExecuteStatement response, with the
+        ``columns`` of the statement or its ``columnMetadata``
+        """
+        if 'formattedRecords' in response:
+            rows = json.loads(response['formattedRecords'] or '[]')
+            if columns is None:
+                columns = rows[0] if rows else ()
+            return cls.from_json(rows, columns)
+        if columns is None:
+            columns = [column['name'] for column in response['columnMetadata']]
+        return cls.from_records(response.get('records', []), columns)
+
+    def to_dict(self):
+        return {
+            attname: field.__get__(self)
+            for attname, field in self._meta.fields.items()
+        }
+
+    def validate(self):
+        """Raise ``ValidationError`` if a field breaks its constraints"""
+        errors = self._meta.validator(self.to_dict())
+        if errors:
+            from miracle.db import validation
+            raise validation.ValidationError(errors)
+
+    @classmethod
+    def validate_many(cls, rows, *, partial=False):
+        """
+        Validate a batch of payloads and collect every error
+
+        Args:
+            rows (iterable): dicts of field values
+            partial (bool): allow absent fields, e.g. for updates
+
+        Returns:
+            dict: the errors per field of each invalid row, by row index
+        """
+        validator = cls._meta.validator
+        errors = {}
+        for index, row in enumerate(rows):
+            row_errors = validator(row, partial)
+            if row_errors:
+                errors[index] = row_errors
+        return errors
+
+    def save(self, *, transaction_id=None):
+        """
+        Insert the instance, or update it when it already has an id.
+        Empty fields with a database default are left to the database.
+        """
+        values = {}
+        for field in self._meta.fields.values():
+            value = field.__get__(self)
+            if value is None and field.db_default:
+                continue
+            values[field.column] = field.to_db(value)
+
+        if self.id is None:
+            sql = compile_insert(self._meta.db_table, tuple(values))
+            response = execute_statement(
+                sql, values, transaction_id=transaction_id
+            )
+            self.id = decode_field(response['records'][0][0])
+        elif values:
+            # Nothing to write when every field is left to the database
+            sql = compile_update(self._meta.db_table, tuple(values))
+            values['id'] = self.id
+            execute_statement(sql, values, transaction_id=transaction_id)
+        return self
+
+    @classmethod
+    def bulk_create(cls, objs, *, batch_size=DEFAULT_BATCH_SIZE,
+                    transaction_id=None):
+        """Insert many instances, one statement per ``batch_size`` rows"""
+        return bulk_create(cls, objs, batch_size=batch_size,
+                           transaction_id=transaction_id)
+
+    @classmethod
+    def bulk_update(cls, objs, fields, *, batch_size=DEFAULT_BATCH_SIZE,
+                    transaction_id=None):
+        """Update ``fields`` of many instances, one statement per batch"""
+        return bulk_update(cls, objs, fields, batch_size=batch_size,
+                           transaction_id=transaction_id)
 
     @classmethod
     def get_all_attributes(cls):
-        attributes = inspect.getmembers(
-            cls, lambda a: not (inspect.isroutine(a))
+        return iter(cls._meta.fields.items())
+
+    @classmethod
+    def generate_ddl_scripts(cls):
+        # Imported here, only the deploy scripts render DDL
+        from miracle.db import migrations
+        state = migrations.table_state(cls)
+        scripts = [migrations.create_table(cls._meta.db_table, state)]
+        scripts.extend(state['indexes'].values())
+        return '\n'.join(scripts)
+
+    @classmethod
+    def generate_index_scripts(cls, *, concurrently=False):
+        """
+        Return the CREATE INDEX statements of the model. CONCURRENTLY
+        statements don't block writes on a live table, but must each run
+        on their own, outside of any transaction.
+        """
+        return list(
+            cls._meta.index_scripts(concurrently=concurrently).values()
         )
+
+
+class Index:
+    """
+    A secondary index of a model, declared in ``Meta.indexes``:
+
+        class Meta:
+            indexes = [
+                Index('last_name', 'first_name'),
+                Index('key', include=('value',), unique=True),
+                Index('created_at', where='updated_by IS NULL'),
+                Index(expressions=('lower(fname)',), name='user_lower_idx'),
+            ]
+    """
+
+    # PostgreSQL truncates longer identifiers
+    MAX_NAME_LENGTH = 63
+
+    def __init__(self, *fields, name: str = None, expressions=(),
+                 where: str = None, include=(), unique: bool = False):
+        """
+
+        Args:
+            fields (str): the indexed fields, by attribute name
+            name (str): the index name, default=<table>_<columns>_idx
+            expressions (tuple): indexed SQL expressions, after the fields
+            where (str): the predicate of a partial index
+            include (tuple): the non-key fields stored in the index, so
+                queries reading them are served by index-only scans
+            unique (bool): create a unique index
+        """
+        if not fields and not expressions:
+            raise ValueError('An index needs fields or expressions')
+        if expressions and not name:
+            raise ValueError('An expression index needs a name')
+        self.fields = tuple(fields)
+        self.name = name
+        self.expressions = tuple(expressions)
+        self.where = where
+        self.include = tuple(include)
+        self.unique = unique
+
+    @staticmethod
+    def _column(meta, attname):
+        if attname == 'id':
+            return 'id'
+        try:
+            return meta.fields[attname].column
+        except KeyError:
+            raise ValueError(
+                f'{meta.model.__name__} has no field {attname!r} to index'
+            ) from None
+
+    def resolve(self, meta):
+        """Return the key & included columns, checking the fields exist"""
         return (
-            a for a in attributes
-            if not(a[0].startswith('__') and a[0].endswith('__'))
+            tuple(self._column(meta, attname) for attname in self.fields),
+            tuple(self._column(meta, attname) for attname in self.include),
         )
 
-    @classmethod
-    def generate_ddl_scripts(cls):
-        rows = ['id BIGSERIAL PRIMARY KEY']
-        for attr in cls.get_all_attributes():
-            if attr[0] == 'Meta':
-                continue
-            if getattr(attr[1], '_name'):
-                script = attr[1].to_ddl_script()
-            else:
-                script = f'{attr[0]} {attr[1].to_ddl_script()}'
-            rows.append(script)
-        temp = ',\n\t'.join(rows)
-        schema = ''
-        table_name = cls.__name__
-        if getattr(cls, 'Meta', None):
-            table_name = cls.Meta.table_name \
-                if getattr(cls.Meta, 'table_name', None) else cls.__name__
-            schema = f"'{cls.Meta.db_schema}'." \
-                if getattr(cls.Meta, 'db_schema', None) else ''
-        return f"CREATE TABLE {schema}{table_name} (\n\t{temp}\n);"
+    def name_for(self, meta):
+        if self.name:
+            return self.name
+        columns, _ = self.resolve(meta)
+        name = f'{meta.table_name}_{"_".join(columns)}_idx'
+        if len(name) > self.MAX_NAME_LENGTH:
+            import hashlib
+            digest = hashlib.md5(name.encode()).hexdigest()[:8]
+            name = f'{name[:self.MAX_NAME_LENGTH - 9]}_{digest}'
+        return name
+
+    def to_sql(self, meta, *, concurrently=False):
+        columns, include = self.resolve(meta)
+        script = 'CREATE UNIQUE INDEX' if self.unique else 'CREATE INDEX'
+        if concurrently:
+            script += ' CONCURRENTLY'
+        keys = tuple(map(quote_name, columns)) + self.expressions
+        script += f' {self.name_for(meta)} ON {quote_name(meta.db_table)}' \
+                  f' ({", ".join(keys)})'
+        if include:
+            script += f' INCLUDE ({", ".join(map(quote_name, include))})'
+        if self.where:
+            script += f' WHERE {self.where}'
+        return f'{script};'
 
 
 class Field:
 
-    def __init__(self, *, nullable: bool = False, unique: bool = False):
+    _name = None
+    attname = None
+    slot = None
+    db_type = None
+
+    def __init__(self, *, nullable: bool = False, unique: bool = False,
+                 db_index: bool = False):
         self.nullable = nullable
         self.unique = unique
+        self.db_index = db_index
         self._null_script = ' NOT NULL' if not nullable else ''
-        self._unique_script = ' UNIQUE' if not unique else ''
+        self._unique_script = ' UNIQUE' if unique else ''
 
     @property
     def nullable(self):
@@ -61,18 +478,96 @@ class Field:
     def unique(self, value):
         self._unique = value
 
+    @property
+    def column(self):
+        return self._name or self.attname
+
+    @staticmethod
+    def slot_name_for(attname):
+        return f'_{attname}_value'
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return self.slot.__get__(instance, owner)
+
+    def __set__(self, instance, value):
+        self.slot.__set__(instance, value)
+
+    @property
+    def db_default(self):
+        default = getattr(self, '_default', None)
+        return f"'{default}'" if default else None
+
+    def validators(self):
+        """Return the type check followed by the constraint checks"""
+        from miracle.db import validation
+        return [validation.is_type(object, 'a value')]
+
+    def encoder(self):
+        """Return the function writing a non-null value as JSON"""
+        from miracle.utils import response
+        return response.encode_value
+
+    def decoder(self):
+        """Return the function reading the value of a Data API ``Field``"""
+        return decode_field
+
+    def to_db(self, value):
+        """Convert a valid value to the one written to the column"""
+        return value
+
+    def json_decoder(self):
+        """
+        Return the function converting a non-null value of a JSON formatted
+        record, ``None`` when the JSON value is used as is
+        """
+        return None
+
+    def describe(self):
+        """Return the column state recorded in schema snapshots"""
+        return {
+            'type': self.db_type,
+            'nullable': self.nullable,
+            'unique': self.unique,
+            'default': self.db_default,
+            'references': None,
+        }
+
 
 class CharField(Field):
 
     def __init__(self, name: str = None, max_length: int = None,
                  min_length: int = None, nullable: bool = False,
-                 unique: bool = False, default: str = None):
-        super().__init__(nullable=nullable, unique=unique)
+                 unique: bool = False, default: str = None,
+                 db_index: bool = False):
+        super().__init__(nullable=nullable, unique=unique, db_index=db_index)
         self._name = name
         self._max_length = max_length
         self._min_length = min_length
         self.default_value = default
 
+    @property
+    def db_type(self):
+        return f'varchar({self._max_length or 255})'
+
+    def validators(self):
+        from miracle.db import validation
+        checks = [
+            validation.is_type(str, 'a string'),
+            validation.max_length(self._max_length or 255),
+        ]
+        if self._min_length:
+            checks.append(validation.min_length(self._min_length))
+        return checks
+
+    def encoder(self):
+        from miracle.utils import response
+        return response.encode_text
+
+    def decoder(self):
+        return data_api.decode_string
+
     @property
     def default_value(self):
         return self._default
@@ -86,11 +581,7 @@ class CharField(Field):
             self._default_script = ''
 
     def to_ddl_script(self):
-        if self._max_length:
-            data_type = f'varchar({self._max_length})'
-        else:
-            data_type = 'varchar(255)'
-        script = f'{data_type}{self._default_script}' \
+        script = f'{self.db_type}{self._default_script}' \
                  f'{self._null_script}{self._unique_script}'
         if self._name:
             return f'{self._name} {script}'
@@ -102,13 +593,32 @@ class IntegerField(Field):
 
     def __init__(self, name: str = None, min_value: int = None,
                  max_value: int = None, nullable: bool = False,
-                 unique: bool = False, default: int = None):
-        super().__init__(nullable=nullable, unique=unique)
+                 unique: bool = False, default: int = None,
+                 db_index: bool = False):
+        super().__init__(nullable=nullable, unique=unique, db_index=db_index)
         self._name = name
         self._min_value = min_value
         self._max_value = max_value
         self.default_value = default
 
+    db_type = 'INT'
+
+    def validators(self):
+        from miracle.db import validation
+        checks = [validation.is_type(int, 'an integer')]
+        if self._min_value is not None:
+            checks.append(validation.min_value(self._min_value))
+        if self._max_value is not None:
+            checks.append(validation.max_value(self._max_value))
+        return checks
+
+    def encoder(self):
+        from miracle.utils import response
+        return response.encode_integer
+
+    def decoder(self):
+        return data_api.decode_long
+
     @property
     def default_value(self):
         return self._default
@@ -125,7 +635,7 @@ class IntegerField(Field):
         script = f'INT{self._default_script}' \
                  f'{self._null_script}{self._unique_script}'
         if self._name:
-            return f'{self._name}{script}'
+            return f'{self._name} {script}'
         else:
             return f'{script}'
 
@@ -135,14 +645,37 @@ class DecimalField(Field):
     def __init__(self, name: str = None, min_value: Decimal = None,
                  max_value: Decimal = None, nullable: bool = False,
                  unique: bool = False, decimal_places: int = None,
-                 default: Decimal = None):
-        super().__init__(nullable=nullable, unique=unique)
+                 default: Decimal = None, db_index: bool = False):
+        super().__init__(nullable=nullable, unique=unique, db_index=db_index)
         self._name = name
         self._min_value = min_value
         self._max_value = max_value
         self._decimal_places = decimal_places
         self.default_value = default
 
+    db_type = 'REAL'
+
+    def validators(self):
+        from miracle.db import validation
+        checks = [validation.is_decimal]
+        if self._min_value is not None:
+            checks.append(validation.min_value(self._min_value))
+        if self._max_value is not None:
+            checks.append(validation.max_value(self._max_value))
+        if self._decimal_places is not None:
+            checks.append(validation.decimal_places(self._decimal_places))
+        return checks
+
+    def encoder(self):
+        from miracle.utils import response
+        return response.encode_number
+
+    def decoder(self):
+        return data_api.decode_decimal
+
+    def json_decoder(self):
+        return data_api.to_decimal
+
     @property
     def default_value(self):
         return self._default
@@ -159,7 +692,7 @@ class DecimalField(Field):
         script = f'REAL{self._default_script}' \
                  f'{self._null_script}{self._unique_script}'
         if self._name:
-            return f'{self._name}{script}'
+            return f'{self._name} {script}'
         else:
             return f'{script}'
 
@@ -169,14 +702,47 @@ class DateField(Field):
     def __init__(self, name: str = None, min_date: str = None,
                  max_date: str = None, nullable: bool = False,
                  unique: bool = False, format_date: str = '%Y-%m-%d',
-                 default_now: bool = False):
-        super().__init__(nullable=nullable, unique=unique)
+                 default_now: bool = False, db_index: bool = False):
+        super().__init__(nullable=nullable, unique=unique, db_index=db_index)
         self._name = name
         self._min_date = min_date
         self._max_date = max_date
         self._format_date = format_date
         self.default_now = default_now
 
+    db_type = 'BIGINT'
+
+    @property
+    def db_default(self):
+        if self._default_now:
+            return 'EXTRACT(EPOCH FROM CURRENT_TIMESTAMP)'
+        return None
+
+    def validators(self):
+        from miracle.db import validation
+        checks = [validation.is_date(self._format_date)]
+        if self._min_date or self._max_date:
+            checks.append(validation.date_range(
+                self._format_date, self._min_date, self._max_date
+            ))
+        return checks
+
+    def encoder(self):
+        from miracle.utils import response
+        # The values are epoch seconds, written in the input format
+        return response.encode_epoch(self._format_date)
+
+    def decoder(self):
+        # Kept as the epoch seconds save() and the validators work with
+        return data_api.decode_long
+
+    def to_db(self, value):
+        # Dates are accepted as strings or objects, stored as epochs
+        if value is None or type(value) is int:
+            return value
+        from miracle.db import validation
+        return validation.to_epoch(value, self._format_date)
+
     @property
     def default_now(self):
         return self._default_now
@@ -194,7 +760,7 @@ class DateField(Field):
         script = f'BIGINT{self._default_script}' \
                  f'{self._null_script}{self._unique_script}'
         if self._name:
-            return f'{self._name}{script}'
+            return f'{self._name} {script}'
         else:
             return f'{script}'
 
@@ -204,14 +770,47 @@ class DateTimeField(Field):
     def __init__(self, name: str = None, min_date: str = None,
                  max_date: str = None, nullable: bool = False,
                  unique: bool = False, format_date: str = '%Y-%m-%d %H:%M:%S',
-                 default_now: bool = False):
-        super().__init__(nullable=nullable, unique=unique)
+                 default_now: bool = False, db_index: bool = False):
+        super().__init__(nullable=nullable, unique=unique, db_index=db_index)
         self._name = name
         self._min_date = min_date
         self._max_date = max_date
         self._format_date = format_date
         self.default_now = default_now
 
+    db_type = 'BIGINT'
+
+    @property
+    def db_default(self):
+        if self._default_now:
+            return 'EXTRACT(EPOCH FROM CURRENT_TIMESTAMP)'
+        return None
+
+    def validators(self):
+        from miracle.db import validation
+        checks = [validation.is_date(self._format_date)]
+        if self._min_date or self._max_date:
+            checks.append(validation.date_range(
+                self._format_date, self._min_date, self._max_date
+            ))
+        return checks
+
+    def encoder(self):
+        from miracle.utils import response
+        # The values are epoch seconds, written in the input format
+        return response.encode_epoch(self._format_date)
+
+    def decoder(self):
+        # Kept as the epoch seconds save() and the validators work with
+        return data_api.decode_long
+
+    def to_db(self, value):
+        # Dates are accepted as strings or objects, stored as epochs
+        if value is None or type(value) is int:
+            return value
+        from miracle.db import validation
+        return validation.to_epoch(value, self._format_date)
+
     @property
     def default_now(self):
         return self._default_now
@@ -229,23 +828,26 @@ class DateTimeField(Field):
         script = f'BIGINT{self._default_script}' \
                  f'{self._null_script}{self._unique_script}'
         if self._name:
-            return f'{self._name}{script}'
+            return f'{self._name} {script}'
         else:
             return f'{script}'
 
 
 class ForeignKey(Field):
 
-    def __init__(self, *, ref_column: str, ref_class: ClassVar = None,
+    def __init__(self, *, ref_column: str, ref_class: type = None,
                  ref_table: str = None, name: str = None, default: str = None,
                  unique: bool = False, nullable: bool = False,
-                 on_delete_cascade=True):
-        super().__init__(nullable=nullable, unique=unique)
+                 on_delete_cascade=True, db_index: bool = True):
+        # Indexed by default: PostgreSQL doesn't index referencing columns,
+        # so joins and cascading deletes would scan the whole table
+        super().__init__(nullable=nullable, unique=unique, db_index=db_index)
         self.default_value = default
         self._name = name
         self._ref_class = ref_class
         self._ref_table = ref_table
         self._ref_column = ref_column
+        self._on_delete_cascade = on_delete_cascade
         if isinstance(default, str):
             self._default_script = f"DEFAULT '{default}'"
         elif isinstance(default, int):
@@ -255,14 +857,46 @@ class ForeignKey(Field):
         else:
             self._cascade_script = ''
 
-    def to_ddl_script(self):
+    db_type = 'INT'
+
+    def validators(self):
+        from miracle.db import validation
+        return [validation.is_type(int, 'an integer id')]
+
+    def encoder(self):
+        from miracle.utils import response
+        return response.encode_integer
+
+    def decoder(self):
+        return data_api.decode_long
+
+    @property
+    def ref_table(self):
         if self._ref_class:
-            table_name = getattr(self._ref_class.Meta, 'table_name')
-        else:
-            table_name = self._ref_table
-        script = f'INT REFERENCES {table_name} ({self._ref_column})' \
-                 f'{self._cascade_script}'
+            return getattr(self._ref_class.Meta, 'table_name')
+        return self._ref_table
+
+    @property
+    def db_default(self):
+        if isinstance(self.default_value, str):
+            return f"'{self.default_value}'"
+        elif isinstance(self.default_value, int):
+            return f'{self.default_value}'
+        return None
+
+    def describe(self):
+        state = super().describe()
+        state['references'] = {
+            'table': self.ref_table,
+            'column': self._ref_column,
+            'on_delete': 'CASCADE' if self._on_delete_cascade else None,
+        }
+        return state
+
+    def to_ddl_script(self):
+        script = f'INT REFERENCES {self.ref_table} ({self._ref_column})' \
+                 f'{self._cascade_script}{self._null_script}'
         if self._name:
-            return f'{self._name}{script}'
+            return f'{self._name} {script}'
         else:
             return f'{script}'
@@ -0,0 +1,166 @@
+"""
+This module defines the cursor pagination of the list endpoints.
+
+A page is read with keyset paging: the rows are ordered on a sort key and
+``id``, and the next page starts after the ``(sort key, id)`` of the last
+row, compiled to ``WHERE (sort_key, id) > (:k0, :k1)``. An index on the
+sort key serves every page at the same cost, however deep.
+
+Clients get that position as an opaque ``next_cursor`` and send it back
+with the ``cursor`` query parameter, along with an optional ``limit``.
+The API construct passes the ``pagination`` of the endpoint in ``views``
+as the PAGE_ORDER_BY, PAGE_SIZE and MAX_PAGE_SIZE environment variables.
+"""
+import base64
+import binascii
+import json
+import math
+import os
+from collections import namedtuple
+
+DEFAULT_ORDER_BY = 'id'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+Page = namedtuple('Page', 'items next_cursor')
+
+# The integer range of the sort key column types, the values of a cursor
+# must fit their column or the comparison fails in the database
+INTEGER_RANGES = {
+    'INT': (-2 ** 31, 2 ** 31),
+    'BIGINT': (-2 ** 63, 2 ** 63),
+    'BIGSERIAL': (-2 ** 63, 2 ** 63),
+}
+
+
+class InvalidPage(ValueError):
+    """The ``limit`` or ``cursor`` sent by the client can't be used"""
+
+
+def encode_cursor(order_by, values):
+    data = json.dumps([order_by, *values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).rstrip(b'=').decode()
+
+
+def _matches(value, db_type):
+    """Whether a cursor value can be compared with a column of this type"""
+    if isinstance(value, bool):
+        return False
+    if db_type in INTEGER_RANGES:
+        low, high = INTEGER_RANGES[db_type]
+        return isinstance(value, int) and low <= value < high
+    if db_type == 'REAL':
+        return isinstance(value, (int, float)) and math.isfinite(value)
+    return isinstance(value, str)
+
+
+def decode_cursor(cursor, order_by, types):
+    """
+    Return the key values of a cursor made for the same ordering, given
+    the column type of each sort key
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (ValueError, binascii.Error):
+        raise InvalidPage('Malformed cursor') from None
+    if not isinstance(values, list) or len(values) != len(types) + 1 \
+            or values[0] != order_by:
+        raise InvalidPage('The cursor belongs to another listing')
+    if not all(_matches(value, db_type)
+               for value, db_type in zip(values[1:], types)):
+        raise InvalidPage('Malformed cursor')
+    return values[1:]
+
+
+def _key_type(model, name):
+    if name == 'id':
+        return 'BIGSERIAL'
+    return model._meta.fields[name].db_type
+
+
+def _sort_keys(model, order_by):
+    """Return the ``(attname, descending)`` keys ending with ``id``"""
+    descending = order_by.startswith('-')
+    name = order_by.lstrip('-')
+    if name == 'id':
+        return [('id', descending)]
+    field = model._meta.fields.get(name)
+    if field is None:
+        raise ValueError(f'{model.__name__} has no field {name!r}')
+    if field.nullable:
+        # NULLs never compare greater, their rows would be skipped
+        raise ValueError(f'Can\'t paginate on the nullable field {name!r}')
+    return [(name, descending), ('id', descending)]
+
+
+def paginate(queryset, *, order_by=DEFAULT_ORDER_BY, cursor=None,
+             limit=DEFAULT_PAGE_SIZE):
+    """
+    Read one page of a QuerySet
+
+    Args:
+        queryset (QuerySet): the filtered rows to list
+        order_by (str): the sort key, a leading ``-`` sorts descending;
+            ``id`` breaks the ties
+        cursor (str): the ``next_cursor`` of the previous page, if any
+        limit (int): the number of rows of the page
+
+    Returns:
+        Page: the instances and the cursor of the next page, ``None`` on
+            the last page
+    """
+    keys = _sort_keys(queryset.model, order_by)
+    queryset = queryset.order_by(
+        *(f'-{name}' if descending else name for name, descending in keys)
+    )
+    if cursor:
+        types = [_key_type(queryset.model, name) for name, _ in keys]
+        queryset = queryset.after(*decode_cursor(cursor, order_by, types))
+    # One more row tells whether there is a next page
+    rows = list(queryset.limit(limit + 1))
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(
+            order_by, [getattr(last, name) for name, _ in keys]
+        )
+    return Page(items, next_cursor)
+
+
+def page_size(value, default, maximum):
+    """Parse the ``limit`` query parameter, capped to ``maximum``"""
+    if value in (None, ''):
+        return default
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise InvalidPage('limit must be an integer') from None
+    if size < 1:
+        raise InvalidPage('limit must be positive')
+    return min(size, maximum)
+
+
+def paginate_event(queryset, event, *, order_by=None, default_limit=None,
+                   max_limit=None):
+    """
+    Read the page requested by an API Gateway proxy event, with the
+    ``limit`` and ``cursor`` query parameters. The settings default to
+    the ``pagination`` of the endpoint in ``views``.
+
+    Raises:
+        InvalidPage: to be answered with a 400 response
+    """
+    query = event.get('queryStringParameters') or {}
+    if max_limit is None:
+        max_limit = int(os.getenv('MAX_PAGE_SIZE', MAX_PAGE_SIZE))
+    if default_limit is None:
+        default_limit = int(os.getenv('PAGE_SIZE', DEFAULT_PAGE_SIZE))
+    return paginate(
+        queryset,
+        order_by=order_by or os.getenv('PAGE_ORDER_BY', DEFAULT_ORDER_BY),
+        cursor=query.get('cursor'),
+        limit=page_size(query.get('limit'), min(default_limit, max_limit),
+                        max_limit),
+    )
@@ -0,0 +1,244 @@
+"""
+This module defines the range partitioning of model tables.
+
+A model declaring ``Meta.partition_by`` is created as a partitioned parent
+table; its rows live in one partition per interval of the partition key,
+e.g. one per month of ``created_at``. Queries bounded on the key only
+read the matching partitions, and old data is removed by detaching a
+whole partition instead of deleting its rows.
+
+Partitions are not created on insert: the maintenance script creates the
+next ones ahead of time and detaches the ones past the retention.
+
+    class Event(Abstract):
+        class Meta:
+            table_name = 'event'
+            partition_by = RangePartition('created_at', interval='month',
+                                          premake=3, retention=12)
+"""
+import re
+import time
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+from miracle.db.query import quote_name
+
+INTERVALS = ('month', 'week')
+
+LIST_PARTITIONS = '''
+SELECT child.relname AS name,
+       pg_get_expr(child.relpartbound, child.oid) AS bound
+FROM pg_inherits
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+WHERE pg_inherits.inhparent = CAST(:parent AS regclass)
+'''
+
+_BOUND = re.compile(r"FROM \('?(-?\d+)'?\) TO \('?(-?\d+)'?\)")
+
+
+def _epoch(day):
+    return int(datetime(day.year, day.month, day.day,
+                        tzinfo=timezone.utc).timestamp())
+
+
+def _day(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).date()
+
+
+class RangePartition:
+    """
+    Range partitioning of a table on one field: epoch ``BIGINT`` fields by
+    calendar ``'month'`` or ISO ``'week'`` (UTC), or any integer field by
+    a fixed numeric ``interval``.
+    """
+
+    def __init__(self, field: str, *, interval='month', premake: int = 3,
+                 retention: int = None):
+        """
+
+        Args:
+            field (str): the partition key, by attribute name
+            interval: 'month', 'week' or a positive integer step
+            premake (int): the partitions created ahead of the current one
+            retention (int): the past partitions kept attached besides the
+                current one, default=keep everything
+        """
+        if interval not in INTERVALS and not (
+                isinstance(interval, int) and interval > 0):
+            raise ValueError(
+                f"interval must be 'month', 'week' or a positive integer:"
+                f" {interval!r}"
+            )
+        self.field = field
+        self.interval = interval
+        self.premake = premake
+        self.retention = retention
+
+    def describe(self, meta):
+        """Return the partitioning state recorded in schema snapshots"""
+        return {
+            'method': 'RANGE',
+            'column': self.column(meta),
+            'interval': self.interval,
+        }
+
+    def column(self, meta):
+        try:
+            return meta.fields[self.field].column
+        except KeyError:
+            raise ValueError(
+                f'{meta.model.__name__} has no field {self.field!r} to '
+                f'partition by'
+            ) from None
+
+    def check(self, meta):
+        """Reject the models PostgreSQL can't partition on this key"""
+        self.column(meta)
+        field = meta.fields[self.field]
+        if field.nullable:
+            raise ValueError(
+                f'The partition key {self.field!r} must not be nullable'
+            )
+        unique = [attname for attname, f in meta.fields.items() if f.unique]
+        if unique:
+            # Unique constraints of a partitioned table must include the key
+            raise ValueError(
+                f'A partitioned table can\'t have unique fields: '
+                f'{", ".join(unique)}'
+            )
+
+    def lower_bound(self, value):
+        """Return the lower bound of the partition holding ``value``"""
+        if self.interval == 'month':
+            day = _day(value)
+            return _epoch(date(day.year, day.month, 1))
+        if self.interval == 'week':
+            day = _day(value)
+            return _epoch(day - timedelta(days=day.weekday()))
+        return value // self.interval * self.interval
+
+    def upper_bound(self, lower):
+        if self.interval == 'month':
+            day = _day(lower)
+            year, month = divmod(day.month, 12)
+            return _epoch(date(day.year + year, month + 1, 1))
+        if self.interval == 'week':
+            return lower + 7 * 86400
+        return lower + self.interval
+
+    def suffix(self, lower):
+        if self.interval == 'month':
+            return _day(lower).strftime('%Y_%m')
+        if self.interval == 'week':
+            year, week, _ = _day(lower).isocalendar()
+            return f'{year}w{week:02d}'
+        return str(lower).replace('-', 'm')
+
+    def ranges(self, start, count):
+        """Yield ``(lower, upper)`` of ``count`` partitions from ``start``"""
+        lower = self.lower_bound(start)
+        for _ in range(count):
+            upper = self.upper_bound(lower)
+            yield lower, upper
+            lower = upper
+
+
+def partition_name(model, lower):
+    meta = model._meta
+    return f'{meta.table_name}_p{meta.partition_by.suffix(lower)}'
+
+
+def create_partitions(model, *, now=None):
+    """
+    Return the statements creating the current partition of a model and
+    the ``premake`` next ones, if they don't exist yet. ``now`` is the
+    current partition key value, default=epoch now.
+    """
+    meta = model._meta
+    partition = meta.partition_by
+    now = int(time.time()) if now is None else now
+    schema = f'{meta.db_schema}.' if meta.db_schema else ''
+    return [
+        f'CREATE TABLE IF NOT EXISTS'
+        f' {quote_name(schema + partition_name(model, lower))}'
+        f' PARTITION OF {quote_name(meta.db_table)}'
+        f' FOR VALUES FROM ({lower}) TO ({upper});'
+        for lower, upper in partition.ranges(now, partition.premake + 1)
+    ]
+
+
+def parse_bound(bound):
+    """Return ``(lower, upper)`` of a ``pg_get_expr`` partition bound"""
+    match = _BOUND.search(bound or '')
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def expired_partitions(model, partitions, *, now=None):
+    """
+    Return the names of the partitions past the retention of a model
+
+    Args:
+        model: the partitioned model
+        partitions (dict): the attached partitions, ``{name: bound}`` with
+            ``bound`` as returned by ``pg_get_expr``
+        now (int): the current partition key value, default=epoch now
+    """
+    partition = model._meta.partition_by
+    if partition.retention is None:
+        return []
+    now = int(time.time()) if now is None else now
+    cutoff = partition.lower_bound(now)
+    for _ in range(partition.retention):
+        cutoff = partition.lower_bound(cutoff - 1)
+    expired = []
+    for name, bound in sorted(partitions.items()):
+        bounds = parse_bound(bound)
+        if bounds and bounds[1] <= cutoff:
+            expired.append(name)
+    return expired
+
+
+def detach_partitions(model, names, *, concurrently=False):
+    """
+    Return the statements detaching partitions from their parent. The
+    detached tables are kept, to be archived or dropped separately.
+    CONCURRENTLY (PostgreSQL 14+) doesn't block queries on the parent but
+    can't run in a transaction.
+    """
+    meta = model._meta
+    schema = f'{meta.db_schema}.' if meta.db_schema else ''
+    option = ' CONCURRENTLY' if concurrently else ''
+    return [
+        f'ALTER TABLE {quote_name(meta.db_table)}'
+        f' DETACH PARTITION {quote_name(schema + name)}'
+        f'{option};'
+        for name in names
+    ]
+
+
+def list_partitions(model, *, transaction_id=None):
+    """Return the attached partitions of a model, ``{name: bound}``"""
+    from miracle.utils import data_api
+    response = data_api.execute_statement(
+        LIST_PARTITIONS, {'parent': quote_name(model._meta.db_table)},
+        transaction_id=transaction_id, includeResultMetadata=True,
+    )
+    return {
+        row['name']: row['bound'] for row in data_api.decode_records(response)
+    }
+
+
+def maintenance_statements(model, partitions, *, now=None,
+                           concurrently=False):
+    """
+    Return the statements creating the upcoming partitions of a model and
+    detaching the expired ones among the attached ``partitions``
+    """
+    return create_partitions(model, now=now) + detach_partitions(
+        model, expired_partitions(model, partitions, now=now),
+        concurrently=concurrently,
+    )
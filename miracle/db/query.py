@@ -0,0 +1,452 @@
+"""
+This module defines the lazy QuerySet API of the models.
+
+A QuerySet only records the filters, ordering and limits applied to it.
+The SQL is built when the QuerySet is iterated, from the query *shape*
+(table, columns, lookups, ordering) which is compiled once and kept in an
+LRU cache; the filter values are always sent as Data API parameters.
+The rows are fetched with ``formatRecordsAs='JSON'``, one JSON string
+instead of a structure per cell, and loaded by the precompiled loader of
+the model.
+"""
+import functools
+
+from miracle.utils import data_api
+
+LOOKUPS = {
+    'exact': '=',
+    'ne': '<>',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+    'in': 'IN',
+    'isnull': 'IS NULL',
+}
+
+# Number of compiled query shapes kept per compiler
+SQL_CACHE_SIZE = 256
+
+# Rows written per statement by bulk_create and bulk_update
+DEFAULT_BATCH_SIZE = 200
+
+
+def quote_name(name):
+    """
+    Quote an identifier, schema-qualified ones part by part, e.g.
+    ``app.user`` as ``"app"."user"``, so reserved words like ``user`` can
+    name tables and columns. The names are lowercased the way PostgreSQL
+    folds unquoted identifiers, so they keep addressing the same objects.
+    """
+    return '.'.join(f'"{part.lower()}"' for part in name.split('.'))
+
+
+def _condition_sql(column, lookup, arity, start):
+    operator = LOOKUPS[lookup]
+    column = quote_name(column)
+    if lookup == 'isnull':
+        return f'{column} IS NULL' if arity else f'{column} IS NOT NULL'
+    if lookup == 'in':
+        if not arity:
+            # ``IN ()`` is a syntax error, an empty list matches no row
+            return 'FALSE'
+        placeholders = ', '.join(
+            f':p{start + i}' for i in range(arity)
+        )
+        return f'{column} IN ({placeholders})'
+    return f'{column} {operator} :p{start}'
+
+
+@functools.lru_cache(maxsize=SQL_CACHE_SIZE)
+def compile_select(table, columns, conditions, ordering, limit, offset,
+                   seek=False):
+    """
+    Build the SELECT statement of a query shape
+
+    Args:
+        table (str): the table name
+        columns (tuple): the selected columns
+        conditions (tuple): ``(column, lookup, arity)`` of each filter,
+            arity being the number of parameters it takes
+        ordering (tuple): ``(column, descending)`` pairs
+        limit (bool): whether a ``:limit`` parameter is used
+        offset (bool): whether an ``:offset`` parameter is used
+        seek (bool): whether to keep the rows after the ``:k0..`` values
+            of the ordering columns, all sorted in the same direction
+    """
+    sql = f'SELECT {", ".join(map(quote_name, columns))} ' \
+          f'FROM {quote_name(table)}'
+    parts = []
+    start = 0
+    for column, lookup, arity in conditions:
+        parts.append(_condition_sql(column, lookup, arity, start))
+        if lookup != 'isnull':
+            start += arity
+    if seek:
+        # A row comparison is served by an index on the ordering columns
+        operator = '<' if ordering[0][1] else '>'
+        keys = ', '.join(quote_name(column) for column, _ in ordering)
+        values = ', '.join(f':k{i}' for i in range(len(ordering)))
+        parts.append(f'({keys}) {operator} ({values})')
+    if parts:
+        sql += f' WHERE {" AND ".join(parts)}'
+    if ordering:
+        sql += ' ORDER BY ' + ', '.join(
+            f'{quote_name(column)} DESC' if descending else quote_name(column)
+            for column, descending in ordering
+        )
+    if limit:
+        sql += ' LIMIT :limit'
+    if offset:
+        sql += ' OFFSET :offset'
+    return sql
+
+
+@functools.lru_cache(maxsize=SQL_CACHE_SIZE)
+def compile_insert(table, columns):
+    if not columns:
+        return f'INSERT INTO {quote_name(table)} DEFAULT VALUES ' \
+               f'RETURNING "id"'
+    values = ', '.join(f':{column}' for column in columns)
+    return f'INSERT INTO {quote_name(table)} ' \
+           f'({", ".join(map(quote_name, columns))}) ' \
+           f'VALUES ({values}) RETURNING "id"'
+
+
+@functools.lru_cache(maxsize=SQL_CACHE_SIZE)
+def compile_update(table, columns):
+    assignments = ', '.join(
+        f'{quote_name(column)} = :{column}' for column in columns
+    )
+    return f'UPDATE {quote_name(table)} SET {assignments} WHERE "id" = :id'
+
+
+@functools.lru_cache(maxsize=SQL_CACHE_SIZE)
+def compile_bulk_insert(table, columns, defaults):
+    """
+    Build a multi-row INSERT statement
+
+    Args:
+        table (str): the table name
+        columns (tuple): the inserted columns
+        defaults (tuple): one tuple of booleans per row, telling which
+            cells take the column DEFAULT instead of a parameter
+    """
+    if not columns:
+        # ``() VALUES ()`` is invalid, every row takes the id default
+        columns = ('id',)
+        defaults = tuple((True,) for _ in defaults)
+    rows = []
+    index = 0
+    for row in defaults:
+        cells = []
+        for use_default in row:
+            if use_default:
+                cells.append('DEFAULT')
+            else:
+                cells.append(f':p{index}')
+                index += 1
+        rows.append(f'({", ".join(cells)})')
+    return f'INSERT INTO {quote_name(table)} ' \
+           f'({", ".join(map(quote_name, columns))}) ' \
+           f'VALUES {", ".join(rows)} RETURNING "id"'
+
+
+@functools.lru_cache(maxsize=SQL_CACHE_SIZE)
+def compile_bulk_update(table, columns, types, defaults):
+    """
+    Build a multi-row ``UPDATE ... FROM (VALUES ...)`` statement
+
+    Args:
+        table (str): the table name
+        columns (tuple): the updated columns
+        types (tuple): the SQL type of each column, the VALUES cells are
+            cast to them since parameter types can't be inferred there
+        defaults (tuple): one tuple per row with, for each cell, the
+            column default expression to use instead of a parameter
+    """
+    rows = []
+    index = 0
+    for row in defaults:
+        cells = [f'CAST(:p{index} AS BIGINT)']
+        index += 1
+        for column_type, default in zip(types, row):
+            if default:
+                cells.append(f'CAST({default} AS {column_type})')
+            else:
+                cells.append(f'CAST(:p{index} AS {column_type})')
+                index += 1
+        rows.append(f'({", ".join(cells)})')
+    columns = tuple(map(quote_name, columns))
+    assignments = ', '.join(f'{column} = v.{column}' for column in columns)
+    return f'UPDATE {quote_name(table)} AS t SET {assignments} ' \
+           f'FROM (VALUES {", ".join(rows)}) ' \
+           f'AS v("id", {", ".join(columns)}) WHERE t."id" = v."id"'
+
+
+def _batches(objs, batch_size):
+    for start in range(0, len(objs), batch_size):
+        yield objs[start:start + batch_size]
+
+
+def bulk_create(model, objs, *, batch_size=DEFAULT_BATCH_SIZE,
+                transaction_id=None):
+    """
+    Insert many instances with one multi-row ``INSERT ... RETURNING id``
+    per batch and set their ids. Empty fields with a database default
+    (e.g. ``DateTimeField(default_now=True)``) are written as DEFAULT.
+    Several batches run in one transaction.
+    """
+    objs = list(objs)
+    if transaction_id is None and len(objs) > batch_size:
+        with data_api.transaction() as tx:
+            return bulk_create(model, objs, batch_size=batch_size,
+                               transaction_id=tx.id)
+
+    fields = tuple(model._meta.fields.values())
+    for batch in _batches(objs, batch_size):
+        rows = [[field.to_db(field.__get__(obj)) for field in fields]
+                for obj in batch]
+        uses_default = [
+            [value is None and field.db_default is not None
+             for field, value in zip(fields, row)]
+            for row in rows
+        ]
+        # Columns left to their default on every row are not written
+        kept = [
+            i for i in range(len(fields))
+            if not all(row[i] for row in uses_default)
+        ]
+        sql = compile_bulk_insert(
+            model._meta.db_table,
+            tuple(fields[i].column for i in kept),
+            tuple(tuple(row[i] for i in kept) for row in uses_default),
+        )
+        values = [
+            row[i] for row, defaults in zip(rows, uses_default)
+            for i in kept if not defaults[i]
+        ]
+        response = data_api.execute_statement(
+            sql, {f'p{i}': value for i, value in enumerate(values)},
+            transaction_id=transaction_id,
+        )
+        for obj, record in zip(batch, response.get('records', [])):
+            obj.id = data_api.decode_field(record[0])
+    return objs
+
+
+def bulk_update(model, objs, fields, *, batch_size=DEFAULT_BATCH_SIZE,
+                transaction_id=None):
+    """
+    Update the given fields of many instances with one
+    ``UPDATE ... FROM (VALUES ...)`` statement per batch. Empty fields
+    with a database default are set to that default. Several batches run
+    in one transaction.
+    """
+    objs = list(objs)
+    if any(obj.id is None for obj in objs):
+        raise ValueError('bulk_update needs saved instances with an id')
+    if transaction_id is None and len(objs) > batch_size:
+        with data_api.transaction() as tx:
+            return bulk_update(model, objs, fields, batch_size=batch_size,
+                               transaction_id=tx.id)
+
+    fields = tuple(model._meta.fields[name] for name in fields)
+    for batch in _batches(objs, batch_size):
+        defaults = []
+        values = []
+        for obj in batch:
+            values.append(obj.id)
+            row = []
+            for field in fields:
+                value = field.__get__(obj)
+                if value is None and field.db_default is not None:
+                    row.append(field.db_default)
+                else:
+                    row.append(None)
+                    values.append(field.to_db(value))
+            defaults.append(tuple(row))
+        sql = compile_bulk_update(
+            model._meta.db_table,
+            tuple(field.column for field in fields),
+            tuple(field.db_type for field in fields),
+            tuple(defaults),
+        )
+        data_api.execute_statement(
+            sql, {f'p{i}': value for i, value in enumerate(values)},
+            transaction_id=transaction_id,
+        )
+    return objs
+
+
+def _same(value):
+    return value
+
+
+def resolve_column(model, name):
+    """Return the column of a field given by attribute or column name"""
+    if name == 'id':
+        return 'id'
+    field = model._meta.fields.get(name) or model._meta.columns.get(name)
+    if field is None:
+        raise ValueError(f'{model.__name__} has no field {name!r}')
+    return field.column
+
+
+class QuerySet:
+    """
+    Lazy, chainable query on one model. Every method returns a new
+    QuerySet; the database is only queried on iteration.
+    """
+
+    def __init__(self, model, *, conditions=(), values=(), ordering=(),
+                 limit=None, offset=None, seek=None):
+        self.model = model
+        self._conditions = conditions
+        self._values = values
+        self._ordering = ordering
+        self._limit = limit
+        self._offset = offset
+        self._seek = seek
+        self._result_cache = None
+
+    def _clone(self, **changes):
+        state = {
+            'conditions': self._conditions,
+            'values': self._values,
+            'ordering': self._ordering,
+            'limit': self._limit,
+            'offset': self._offset,
+            'seek': self._seek,
+        }
+        state.update(changes)
+        return QuerySet(self.model, **state)
+
+    def filter(self, **lookups):
+        """
+        Keep the rows matching all lookups, e.g.
+        ``filter(last_name='Doe', created_at__gte=1609459200)``
+        """
+        conditions = list(self._conditions)
+        values = list(self._values)
+        for key, value in lookups.items():
+            name, _, lookup = key.partition('__')
+            lookup = lookup or 'exact'
+            if lookup not in LOOKUPS:
+                raise ValueError(f'Unsupported lookup {lookup!r}')
+            column = resolve_column(self.model, name)
+            field = self.model._meta.columns.get(column)
+            to_db = field.to_db if field is not None else _same
+            if lookup == 'isnull':
+                conditions.append((column, lookup, bool(value)))
+            elif lookup == 'in':
+                value = [to_db(item) for item in value]
+                conditions.append((column, lookup, len(value)))
+                values.extend(value)
+            elif value is None:
+                if lookup not in ('exact', 'ne'):
+                    raise ValueError(
+                        f'{key}=None: only exact and ne lookups compare '
+                        f'with None'
+                    )
+                conditions.append((column, 'isnull', lookup == 'exact'))
+            else:
+                conditions.append((column, lookup, 1))
+                values.append(to_db(value))
+        return self._clone(conditions=tuple(conditions), values=tuple(values))
+
+    def order_by(self, *names):
+        """Order by the given fields, a leading ``-`` sorts descending"""
+        ordering = tuple(
+            (resolve_column(self.model, name.lstrip('-')),
+             name.startswith('-'))
+            for name in names
+        )
+        return self._clone(ordering=ordering, seek=None)
+
+    def after(self, *values):
+        """
+        Keep the rows coming after ``values`` of the ordering columns,
+        i.e. keyset paging: unlike OFFSET, deep pages cost as much as the
+        first one. The ordering must end with a unique column, e.g.
+        ``order_by('-created_at', '-id').after(created_at, id)``.
+        """
+        if not self._ordering or len(values) != len(self._ordering):
+            raise ValueError('after() takes one value per ordering column')
+        if len({descending for _, descending in self._ordering}) > 1:
+            raise ValueError('after() needs all ordering columns sorted in '
+                             'the same direction')
+        return self._clone(seek=tuple(values))
+
+    def limit(self, count):
+        return self._clone(limit=count)
+
+    def offset(self, count):
+        return self._clone(offset=count)
+
+    @property
+    def columns(self):
+        return ('id',) + self.model._meta.column_names
+
+    def compile(self):
+        """Return the SQL statement and its parameters"""
+        sql = compile_select(
+            self.model._meta.db_table, self.columns, self._conditions,
+            self._ordering, self._limit is not None,
+            self._offset is not None, self._seek is not None,
+        )
+        parameters = {f'p{i}': value for i, value in enumerate(self._values)}
+        if self._seek is not None:
+            parameters.update(
+                (f'k{i}', value) for i, value in enumerate(self._seek)
+            )
+        if self._limit is not None:
+            parameters['limit'] = self._limit
+        if self._offset is not None:
+            parameters['offset'] = self._offset
+        return sql, parameters
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            sql, parameters = self.compile()
+            response = data_api.execute_statement(
+                sql, parameters, formatRecordsAs='JSON'
+            )
+            self._result_cache = self.model.from_response(
+                response, self.columns
+            )
+        return self._result_cache
+
+    def __iter__(self):
+        return iter(self._fetch_all())
+
+    def __len__(self):
+        return len(self._fetch_all())
+
+    def first(self):
+        for instance in self.limit(1):
+            return instance
+        return None
+
+    def iterator(self, page_size=data_api.DEFAULT_PAGE_SIZE):
+        """
+        Stream the instances page by page with keyset paging on ``id``,
+        the QuerySet ordering and limits are ignored
+        """
+        sql, parameters = self._clone(limit=None, offset=None,
+                                      ordering=(), seek=None).compile()
+        for response in data_api.iterate_pages(sql, parameters,
+                                               page_size=page_size):
+            yield from self.model.from_response(response)
+
+
+class Manager:
+    """
+    Entry point of the QuerySets of a model, available as
+    ``Model.objects``
+    """
+
+    def __get__(self, instance, owner):
+        if instance is not None:
+            raise AttributeError('Manager is only accessible via the model')
+        return QuerySet(owner)
@@ -0,0 +1,164 @@
+"""
+This module defines the validation engine of the models.
+
+Every Field lists the checks of its constraints; they are compiled once
+per model into a single validator function, so payloads can be rejected
+in-process before they reach the database.
+"""
+import calendar
+import datetime
+from decimal import Decimal, InvalidOperation
+
+REQUIRED = 'This field is required'
+UNKNOWN = 'Unknown field'
+
+
+class ValidationError(Exception):
+    """
+    Raised when a payload breaks the field constraints, ``errors`` maps
+    each invalid field to its error messages
+    """
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def is_type(types, label):
+    def check(value):
+        if isinstance(value, bool) or not isinstance(value, types):
+            return f'Must be {label}'
+    return check
+
+
+def is_decimal(value):
+    if isinstance(value, bool):
+        return 'Must be a decimal number'
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        return 'Must be a decimal number'
+    if not number.is_finite():
+        # NaN and infinities can't be compared by the range checks
+        return 'Must be a finite decimal number'
+
+
+def min_length(limit):
+    def check(value):
+        if len(value) < limit:
+            return f'Ensure this value has at least {limit} characters'
+    return check
+
+
+def max_length(limit):
+    def check(value):
+        if len(value) > limit:
+            return f'Ensure this value has at most {limit} characters'
+    return check
+
+
+def min_value(limit):
+    def check(value):
+        if Decimal(str(value)) < Decimal(str(limit)):
+            return f'Ensure this value is greater than or equal to {limit}'
+    return check
+
+
+def max_value(limit):
+    def check(value):
+        if Decimal(str(value)) > Decimal(str(limit)):
+            return f'Ensure this value is less than or equal to {limit}'
+    return check
+
+
+def decimal_places(places):
+    def check(value):
+        if Decimal(str(value)).as_tuple().exponent < -places:
+            return f'Ensure there are no more than {places} decimal places'
+    return check
+
+
+def _to_datetime(value, format_date):
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    if isinstance(value, int):
+        return datetime.datetime.utcfromtimestamp(value)
+    return datetime.datetime.strptime(value, format_date)
+
+
+def to_epoch(value, format_date):
+    """
+    Convert an accepted date value to the epoch seconds stored in the
+    ``BIGINT`` date columns, naive dates and strings being UTC
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return calendar.timegm(_to_datetime(value, format_date).utctimetuple())
+
+
+def is_date(format_date):
+    """Accept epoch seconds, date objects or strings in ``format_date``"""
+    def check(value):
+        if isinstance(value, bool) or not isinstance(
+                value, (int, str, datetime.date)):
+            return f'Must be a date in the format {format_date}'
+        try:
+            _to_datetime(value, format_date)
+        except (ValueError, OverflowError, OSError):
+            return f'Must be a date in the format {format_date}'
+    return check
+
+
+def date_range(format_date, min_date=None, max_date=None):
+    lower = _to_datetime(min_date, format_date) if min_date else None
+    upper = _to_datetime(max_date, format_date) if max_date else None
+
+    def check(value):
+        value = _to_datetime(value, format_date)
+        if lower and value < lower:
+            return f'Ensure this date is on or after {min_date}'
+        if upper and value > upper:
+            return f'Ensure this date is on or before {max_date}'
+    return check
+
+
+def compile_validator(model):
+    """
+    Build the validator of a model. It takes a dict of field values and
+    returns the errors per field, empty when the row is valid. With
+    ``partial=True`` absent fields are not reported as required.
+    """
+    plan = []
+    for attname, field in model._meta.fields.items():
+        type_check, *checks = field.validators()
+        optional = field.nullable or field.db_default is not None
+        plan.append((attname, optional, type_check, tuple(checks)))
+    plan = tuple(plan)
+    known = frozenset(model._meta.fields) | {'id'}
+
+    def validate(row, partial=False):
+        errors = {}
+        for attname, optional, type_check, checks in plan:
+            if attname not in row:
+                if not (optional or partial):
+                    errors[attname] = [REQUIRED]
+                continue
+            value = row[attname]
+            if value is None:
+                if not optional:
+                    errors[attname] = [REQUIRED]
+                continue
+            message = type_check(value)
+            if message:
+                errors[attname] = [message]
+                continue
+            messages = [m for m in (check(value) for check in checks) if m]
+            if messages:
+                errors[attname] = messages
+        for name in row.keys() - known:
+            errors[name] = [UNKNOWN]
+        return errors
+
+    return validate
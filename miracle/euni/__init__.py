@@ -10,11 +10,13 @@ class Abstract(models.Model):
     created_by = models.ForeignKey(
         ref_table='user',
         ref_column='id',
+        nullable=True,
         on_delete_cascade=True
     )
     updated_by = models.ForeignKey(
         ref_table='user',
         ref_column='id',
+        nullable=True,
         on_delete_cascade=True
     )
     created_at = models.DateTimeField(default_now=True)
@@ -1,11 +1,87 @@
 from miracle.db import models
 from miracle.euni import Abstract
+from miracle.utils.cache import TTLCache
+
+# Read-through cache of the dictionary values in the warm container
+CACHE_SIZE = 2048
+CACHE_TTL = 300
 
 
 class Dictionary(Abstract):
 
-    key = models.CharField(name='key', max_length=50)
+    # The key of the row in the database, invalidated as well when a save
+    # renames the entry
+    __slots__ = ('_saved_key',)
+
+    key = models.CharField(name='key', max_length=50, db_index=True)
     value = models.CharField(name='value', max_length=20)
 
     class Meta:
         table_name = 'dictionary'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._saved_key = self.key if self.id is not None else None
+
+    @classmethod
+    def from_records(cls, records, columns):
+        return _loaded(super().from_records(records, columns))
+
+    @classmethod
+    def from_json(cls, rows, columns):
+        return _loaded(super().from_json(rows, columns))
+
+    @classmethod
+    def get_value(cls, key):
+        """Return the value of a key, ``None`` when it doesn't exist"""
+        return _cache.get(key)
+
+    @classmethod
+    def preload(cls):
+        """Load the whole dictionary into the cache with one query"""
+        _cache.preload((entry.key, entry.value) for entry in cls.objects)
+
+    @classmethod
+    def cache_info(cls):
+        return _cache.info()
+
+    def save(self, **kwargs):
+        super().save(**kwargs)
+        _invalidate([self])
+        return self
+
+    @classmethod
+    def bulk_create(cls, objs, **kwargs):
+        objs = super().bulk_create(objs, **kwargs)
+        _invalidate(objs)
+        return objs
+
+    @classmethod
+    def bulk_update(cls, objs, fields, **kwargs):
+        objs = super().bulk_update(objs, fields, **kwargs)
+        _invalidate(objs)
+        return objs
+
+
+def _load(key):
+    entry = Dictionary.objects.filter(key=key).first()
+    return entry.value if entry else None
+
+
+def _loaded(entries):
+    for entry in entries:
+        entry._saved_key = entry.key
+    return entries
+
+
+def _invalidate(entries):
+    """Drop the old and the new key of saved entries"""
+    for entry in entries:
+        saved_key = getattr(entry, '_saved_key', None)
+        if saved_key is not None and saved_key != entry.key:
+            _cache.invalidate(saved_key)
+        _cache.invalidate(entry.key)
+        entry._saved_key = entry.key
+
+
+_cache = TTLCache(_load, max_size=CACHE_SIZE, ttl=CACHE_TTL)
@@ -13,16 +13,8 @@ class User(Abstract):
 
     class Meta:
         table_name = 'user'
+        # Serves the cursor pagination of users/get-all
+        indexes = [models.Index('created_at', 'id')]
 
-    def __init__(self, *, first_name, last_name):
-        self.first_name = first_name
-        self.last_name = last_name
-
-    def validate(self):
-        pass
-
-    def save(self, *, instance=None, **kwargs):
-        if instance:
-            pass
-        else:
-            pass
+    def __init__(self, *, first_name, last_name, **kwargs):
+        super().__init__(first_name=first_name, last_name=last_name, **kwargs)
@@ -0,0 +1,302 @@
+"""
+This module defines the JWT Lambda authorizer of the APIs.
+
+A warm container keeps the signing keys of the identity provider (JWKS)
+and the tokens it already verified, so most requests are authorized
+without fetching keys or checking a signature. The returned policy
+allows the whole stage, which lets API Gateway cache it per identity
+across every endpoint of the API.
+
+Configured with the JWKS_URL, JWT_AUDIENCE and JWT_ISSUER environment
+variables. PyJWT & cryptography are provided by the jwt layer.
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+ALGORITHMS = ('RS256',)
+JWKS_TTL = 3600
+# The keys are still served while the identity provider can't be reached,
+# up to this age
+JWKS_MAX_AGE = 24 * 3600
+# Unknown ``kid`` refetch the keys at most once per interval, so forged
+# tokens can't make every request call the identity provider
+MIN_REFRESH_INTERVAL = 30
+TOKEN_CACHE_SIZE = 1024
+
+logger = logging.getLogger(__name__)
+
+
+class Unauthorized(Exception):
+    """The token is missing, malformed, expired or not signed by us"""
+
+
+def unverified_header(token):
+    """Return the decoded JOSE header of a token, without verifying it"""
+    try:
+        segment = token.split('.', 1)[0]
+        segment += '=' * (-len(segment) % 4)
+        header = json.loads(base64.urlsafe_b64decode(segment))
+    except (ValueError, TypeError) as error:
+        raise Unauthorized('Malformed token') from error
+    if not isinstance(header, dict):
+        raise Unauthorized('Malformed token')
+    return header
+
+
+def fetch_jwks(url, timeout=5):
+    # Imported here, only the containers refreshing keys need it
+    import urllib.request
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def load_key(jwk):
+    import jwt
+    return jwt.PyJWK(jwk).key
+
+
+def decode(token, key, *, algorithms, audience, issuer, leeway):
+    import jwt
+    try:
+        return jwt.decode(token, key, algorithms=list(algorithms),
+                          audience=audience, issuer=issuer, leeway=leeway)
+    except jwt.InvalidTokenError as error:
+        raise Unauthorized(str(error)) from error
+
+
+class JWKSCache:
+    """
+    The signing keys of the identity provider, by ``kid``. The key set is
+    refetched when it is older than ``ttl`` or when a token is signed with
+    an unknown ``kid``, i.e. after a key rotation. When a refetch fails,
+    the current keys are kept until they are ``max_age`` old.
+    """
+
+    def __init__(self, url, *, ttl=JWKS_TTL, max_age=JWKS_MAX_AGE,
+                 min_refresh_interval=MIN_REFRESH_INTERVAL,
+                 fetch=fetch_jwks, load=load_key, clock=time.monotonic):
+        """
+
+        Args:
+            url (str): the JWKS endpoint of the identity provider
+            ttl (float): the seconds after which the key set is refetched
+            max_age (float): the seconds the key set is served while it
+                can't be refetched
+            min_refresh_interval (float): the minimum seconds between two
+                fetches triggered by an unknown ``kid`` or after a failed
+                fetch
+            fetch (callable): return the JWKS document of an url
+            load (callable): build the verification key of one JWK
+            clock (callable): the time source, default=time.monotonic
+        """
+        self._url = url
+        self._ttl = ttl
+        self._max_age = max_age
+        self._min_refresh_interval = min_refresh_interval
+        self._fetch = fetch
+        self._load = load
+        self._clock = clock
+        self._keys = {}
+        self._fetched_at = None
+        self._attempted_at = None
+        self._lock = threading.Lock()
+        self.fetches = 0
+
+    def _refresh(self):
+        keys = {}
+        for jwk in self._fetch(self._url).get('keys', ()):
+            if jwk.get('kid') and jwk.get('use', 'sig') == 'sig':
+                keys[jwk['kid']] = self._load(jwk)
+        self._keys = keys
+        self._fetched_at = self._clock()
+        self.fetches += 1
+
+    def get(self, kid):
+        with self._lock:
+            now = self._clock()
+            expired = self._fetched_at is None or \
+                now - self._fetched_at >= self._ttl
+            if (expired or kid not in self._keys) and (
+                    self._attempted_at is None or
+                    now - self._attempted_at >= self._min_refresh_interval):
+                self._attempted_at = now
+                try:
+                    self._refresh()
+                except Exception:
+                    # The identity provider is down or slow: keep the keys
+                    logger.exception('Fetching the signing keys from %s '
+                                     'failed', self._url)
+            if self._fetched_at is None or \
+                    self._clock() - self._fetched_at >= self._max_age:
+                raise Unauthorized('The signing keys are unavailable')
+            try:
+                return self._keys[kid]
+            except KeyError:
+                raise Unauthorized(f'Unknown signing key: {kid}') from None
+
+
+class TokenCache:
+    """
+    Bounded LRU of the claims of verified tokens, keyed on the SHA-256 of
+    the token. An entry is dropped once the token expires.
+    """
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE, clock=time.time):
+        self._max_size = max_size
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self.key(token)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= self._clock():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return claims
+
+    def put(self, token, claims):
+        expires_at = claims.get('exp')
+        if not isinstance(expires_at, (int, float)):
+            # Tokens without expiry are verified on every request
+            return
+        key = self.key(token)
+        with self._lock:
+            self._data[key] = (claims, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def policy(principal_id, effect, method_arn, context=None):
+    """
+    Build the IAM policy of an authorizer response. The resource is the
+    whole stage, ``arn:...:<api-id>/<stage>/*``, instead of the invoked
+    method, so the policy API Gateway caches covers all the endpoints.
+
+    Args:
+        principal_id (str): the caller identity
+        effect (str): 'Allow' or 'Deny'
+        method_arn (str): the ``methodArn`` of the authorizer event
+        context (dict): values passed to the backend as
+            ``requestContext.authorizer``, only str, number & bool values
+    """
+    api_arn, _, path = method_arn.partition('/')
+    stage = path.split('/', 1)[0]
+    response = {
+        'principalId': principal_id,
+        'policyDocument': {
+            'Version': '2012-10-17',
+            'Statement': [{
+                'Action': 'execute-api:Invoke',
+                'Effect': effect,
+                'Resource': f'{api_arn}/{stage}/*',
+            }],
+        },
+    }
+    if context:
+        response['context'] = {
+            name: value for name, value in context.items()
+            if isinstance(value, (str, int, float, bool))
+        }
+    return response
+
+
+def bearer_token(event):
+    headers = event.get('headers') or {}
+    value = headers.get('Authorization') or headers.get('authorization') \
+        or event.get('authorizationToken') or ''
+    scheme, _, token = value.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        raise Unauthorized('Missing bearer token')
+    return token.strip()
+
+
+class JWTAuthorizer:
+
+    def __init__(self, keys, *, audience=None, issuer=None,
+                 algorithms=ALGORITHMS, leeway=0, tokens=None,
+                 decode=decode):
+        """
+
+        Args:
+            keys (JWKSCache): the signing keys of the identity provider
+            audience (str): the expected ``aud`` claim
+            issuer (str): the expected ``iss`` claim
+            algorithms (tuple): the accepted signature algorithms
+            leeway (float): the seconds of clock skew tolerated on ``exp``
+            tokens (TokenCache): the verified tokens, default=a new cache
+            decode (callable): verify a token with a key, return its claims
+        """
+        self._keys = keys
+        self._audience = audience
+        self._issuer = issuer
+        self._algorithms = tuple(algorithms)
+        self._leeway = leeway
+        self._tokens = TokenCache() if tokens is None else tokens
+        self._decode = decode
+
+    @classmethod
+    def from_environment(cls):
+        return cls(
+            JWKSCache(os.environ['JWKS_URL']),
+            audience=os.getenv('JWT_AUDIENCE') or None,
+            issuer=os.getenv('JWT_ISSUER') or None,
+        )
+
+    def verify(self, token):
+        """Return the claims of a valid token, raise Unauthorized if not"""
+        claims = self._tokens.get(token)
+        if claims is not None:
+            return claims
+        header = unverified_header(token)
+        if header.get('alg') not in self._algorithms:
+            raise Unauthorized(f'Unsupported algorithm: {header.get("alg")}')
+        claims = self._decode(
+            token,
+            self._keys.get(header.get('kid')),
+            algorithms=self._algorithms,
+            audience=self._audience,
+            issuer=self._issuer,
+            leeway=self._leeway,
+        )
+        self._tokens.put(token, claims)
+        return claims
+
+    def __call__(self, event, context):
+        try:
+            claims = self.verify(bearer_token(event))
+        except Unauthorized:
+            # API Gateway answers 401 to this exact error message
+            raise Exception('Unauthorized') from None
+        return policy(str(claims.get('sub')), 'Allow', event['methodArn'],
+                      context=claims)
+
+
+_authorizer = None
+
+
+def handler(event, context):
+    """Lambda entry point of the authorizer function"""
+    global _authorizer
+    if _authorizer is None:
+        _authorizer = JWTAuthorizer.from_environment()
+    return _authorizer(event, context)
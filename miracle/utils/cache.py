@@ -0,0 +1,148 @@
+"""
+This module defines the in-process caches living in warm Lambda containers
+"""
+import threading
+import time
+from collections import OrderedDict
+from collections import namedtuple
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses evictions refreshes size')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _background_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Imported here, most containers never refresh in background
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='cache-refresh'
+            )
+        return _executor
+
+
+class TTLCache:
+    """
+    Read-through LRU cache whose entries go stale after ``ttl`` seconds.
+
+    A missing key is loaded with ``loader`` on the request path. A stale
+    key is still served, while it is reloaded by a background worker, so
+    only the first read of a key waits for the database. Note that Lambda
+    freezes the container between invocations, so a refresh started at the
+    end of an invocation finishes during the next one.
+    """
+
+    def __init__(self, loader, *, max_size=1024, ttl=300,
+                 clock=time.monotonic, executor=None):
+        """
+
+        Args:
+            loader (callable): load the value of one key, may be ``None``
+                when the cache is only used through peek() and put()
+            max_size (int): the maximum number of entries, LRU evicted
+            ttl (float): the seconds after which an entry is refreshed
+            clock (callable): the time source, default=time.monotonic
+            executor (Executor): runs the background refreshes
+        """
+        self._loader = loader
+        self._max_size = max_size
+        self._ttl = ttl
+        self._clock = clock
+        self._executor = executor
+        self._data = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._refreshes = 0
+        # Bumped by invalidate() so in-flight refreshes don't store
+        # values read before the invalidation
+        self._generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                self._hits += 1
+                value, expires_at = entry
+                stale = expires_at <= self._clock()
+                if stale and key not in self._refreshing:
+                    self._refreshing.add(key)
+                    generation = self._generation
+                else:
+                    stale = False
+            else:
+                self._misses += 1
+
+        if entry is None:
+            value = self._loader(key)
+            self.put(key, value)
+        elif stale:
+            executor = self._executor or _background_executor()
+            executor.submit(self._refresh, key, generation)
+        return value
+
+    def peek(self, key, default=None):
+        """
+        Return the fresh value of a key without loading it, ``default``
+        when it is absent or stale
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > self._clock():
+                self._data.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+            self._misses += 1
+            return default
+
+    def _refresh(self, key, generation):
+        try:
+            value = self._loader(key)
+            with self._lock:
+                self._refreshes += 1
+                if generation == self._generation:
+                    self._store(key, value)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key, value):
+        self._data[key] = (value, self._clock() + self._ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self._max_size:
+            self._data.popitem(last=False)
+            self._evictions += 1
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def preload(self, items):
+        """Store many ``(key, value)`` pairs, e.g. a whole table"""
+        for key, value in items:
+            self.put(key, value)
+
+    def invalidate(self, key=None):
+        """Drop one key, or every key when none is given"""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                refreshes=self._refreshes,
+                size=len(self._data),
+            )
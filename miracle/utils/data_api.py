@@ -1,19 +1,525 @@
 """
 This module defines the RDS Data API helper functions
 """
+import datetime
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal
 
+from miracle.utils import metrics
 
-def execute_statement(*args, **kwargs):
-    pass
+# Data API limits for one BatchExecuteStatement request, kept with some
+# headroom below the documented quotas
+MAX_PARAMETER_SETS = 1000
+MAX_REQUEST_SIZE = 4 * 1024 * 1024 - 64 * 1024
 
+# Rows fetched per page by iterate_statement, small enough for a page of
+# typical rows to stay under the 1 MB ExecuteStatement result limit
+DEFAULT_PAGE_SIZE = 500
 
-def begin_transaction(*args, **kwargs):
-    pass
+# Retry policy of transaction() on transient errors
+DEFAULT_RETRIES = 3
+DEFAULT_BASE_DELAY = 0.2
+DEFAULT_MAX_DELAY = 5.0
 
+RETRYABLE_ERROR_CODES = {
+    'DatabaseResumingException',
+    'StatementTimeoutException',
+    'ServiceUnavailableError',
+}
+RESUMING_MESSAGES = (
+    'Communications link failure',
+    'is resuming after being auto-paused',
+)
 
-def commit_transaction(*args, **kwargs):
-    pass
+logger = logging.getLogger(__name__)
 
 
-def rollback_transaction(*args, **kwargs):
-    pass
+# Connection pool of the cached clients, warm containers reuse the kept
+# alive connections instead of paying a TLS handshake per call
+MAX_POOL_CONNECTIONS = 10
+
+ClientCacheInfo = namedtuple('ClientCacheInfo', 'hits misses size hit_rate')
+
+_clients = {}
+_clients_lock = threading.Lock()
+_client_hits = 0
+_client_misses = 0
+
+
+def get_client(region=None, resource_arn=None, secret_arn=None):
+    """
+    Return the rds-data client of the given region and cluster, created on
+    first use and then reused for the lifetime of the container.
+
+    Args:
+        region (str): the AWS region, default=$AWS_REGION
+        resource_arn (str): the Aurora cluster ARN, default=$RESOURCE_ARN
+        secret_arn (str): the credentials secret ARN, default=$SECRET_ARN
+    """
+    global _client_hits, _client_misses
+
+    key = (
+        region or os.getenv('AWS_REGION') or os.getenv('AWS_DEFAULT_REGION'),
+        resource_arn or os.getenv('RESOURCE_ARN'),
+        secret_arn or os.getenv('SECRET_ARN'),
+    )
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            _client_hits += 1
+            return client
+        _client_misses += 1
+
+        import boto3
+        from botocore.config import Config
+
+        client = boto3.client(
+            'rds-data',
+            region_name=key[0],
+            config=Config(
+                max_pool_connections=MAX_POOL_CONNECTIONS,
+                tcp_keepalive=True,
+                retries={'mode': 'standard'},
+            ),
+        )
+        _clients[key] = client
+        return client
+
+
+def client_cache_info():
+    """Return the hit/miss counters of the client cache"""
+    with _clients_lock:
+        total = _client_hits + _client_misses
+        return ClientCacheInfo(
+            hits=_client_hits,
+            misses=_client_misses,
+            size=len(_clients),
+            hit_rate=_client_hits / total if total else 0.0,
+        )
+
+
+def _call(operation, **request):
+    """Send one Data API request, timed in the invocation metrics"""
+    started = time.perf_counter()
+    try:
+        return getattr(get_client(), operation)(**request)
+    finally:
+        metrics.record_call('DataApi', time.perf_counter() - started)
+
+
+def _arns():
+    return {
+        'resourceArn': os.environ['RESOURCE_ARN'],
+        'secretArn': os.environ['SECRET_ARN'],
+    }
+
+
+def _connection_kwargs(database=None, schema=None):
+    kwargs = _arns()
+    database = database or os.getenv('DB_NAME')
+    if database:
+        kwargs['database'] = database
+    if schema:
+        kwargs['schema'] = schema
+    return kwargs
+
+
+def to_field(value):
+    """Convert a Python value to a Data API ``Field``"""
+    if value is None:
+        return {'isNull': True}
+    if isinstance(value, bool):
+        return {'booleanValue': value}
+    if isinstance(value, int):
+        return {'longValue': value}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, (bytes, bytearray)):
+        return {'blobValue': bytes(value)}
+    return {'stringValue': str(value)}
+
+
+def to_parameters(values):
+    """Convert a mapping of named values to Data API ``SqlParameter`` list"""
+    parameters = []
+    for name, value in values.items():
+        parameter = {'name': name, 'value': to_field(value)}
+        if isinstance(value, Decimal):
+            parameter['typeHint'] = 'DECIMAL'
+        elif isinstance(value, datetime.datetime):
+            parameter['typeHint'] = 'TIMESTAMP'
+        elif isinstance(value, datetime.date):
+            parameter['typeHint'] = 'DATE'
+        parameters.append(parameter)
+    return parameters
+
+
+def decode_field(field):
+    """Convert a Data API ``Field`` to a Python value"""
+    if field.get('isNull'):
+        return None
+    if 'arrayValue' in field:
+        return [decode_field({k: v}) for k, values in
+                field['arrayValue'].items() for v in values]
+    for value in field.values():
+        return value
+    return None
+
+
+def decode_long(field):
+    """Typed decoder of INT/BIGINT cells, see ``decode_field``"""
+    value = field.get('longValue')
+    if value is None and 'isNull' not in field:
+        return decode_field(field)
+    return value
+
+
+def decode_string(field):
+    """Typed decoder of text cells, see ``decode_field``"""
+    value = field.get('stringValue')
+    if value is None and 'isNull' not in field:
+        return decode_field(field)
+    return value
+
+
+def decode_decimal(field):
+    """
+    Typed decoder of REAL/NUMERIC cells to ``Decimal``: REAL arrives as
+    ``doubleValue``, NUMERIC as ``stringValue`` to keep its precision
+    """
+    return to_decimal(decode_field(field))
+
+
+def to_decimal(value):
+    """Convert a decoded or JSON number to ``Decimal``"""
+    if value is None or type(value) is Decimal:
+        return value
+    if type(value) is float:
+        # The shortest repr, i.e. 0.1 and not its binary expansion
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def execute_statement(sql, parameters=None, *, transaction_id=None,
+                      database=None, schema=None, **kwargs):
+    """
+    Run one SQL statement
+
+    Args:
+        sql (str): the SQL statement, using ``:name`` placeholders
+        parameters (dict): the values of the placeholders
+        transaction_id (str): run inside this transaction
+        database (str): the database name, default=$DB_NAME
+        schema (str): the database schema
+        kwargs: other ExecuteStatement arguments,
+            e.g. includeResultMetadata
+
+    Returns:
+        dict: the raw ExecuteStatement response
+    """
+    request = _connection_kwargs(database, schema)
+    request.update(kwargs)
+    request['sql'] = sql
+    if parameters:
+        request['parameters'] = to_parameters(parameters)
+    if transaction_id:
+        request['transactionId'] = transaction_id
+    return _call('execute_statement', **request)
+
+
+def decode_records(response):
+    """
+    Yield the records of an ExecuteStatement response as dicts, the
+    statement must be run with ``includeResultMetadata=True``
+    """
+    names = [column['name'] for column in response.get('columnMetadata', [])]
+    for record in response.get('records', []):
+        yield dict(zip(names, map(decode_field, record)))
+
+
+def iterate_pages(sql, parameters=None, *, key='id',
+                  page_size=DEFAULT_PAGE_SIZE, transaction_id=None,
+                  database=None, schema=None):
+    """
+    Lazily yield the ExecuteStatement responses of a SELECT statement,
+    fetched page by page.
+
+    Pages are read with keyset paging on the ``key`` column, which must be
+    unique and selected by ``sql`` (e.g. the ``id BIGSERIAL`` primary key),
+    so only one page of rows is held in memory at a time and deep pages
+    cost as much as the first one.
+
+    Args:
+        sql (str): the SELECT statement, using ``:name`` placeholders
+        parameters (dict): the values of the placeholders
+        key (str): the unique, ordered column used for paging, default=id
+        page_size (int): the number of rows fetched per request
+        transaction_id (str): run inside this transaction
+        database (str): the database name, default=$DB_NAME
+        schema (str): the database schema
+
+    Yields:
+        dict: one response, run with ``includeResultMetadata=True``
+    """
+    first_page = f'SELECT * FROM ({sql}) AS page ' \
+                 f'ORDER BY page.{key} LIMIT {int(page_size)}'
+    next_page = f'SELECT * FROM ({sql}) AS page ' \
+                f'WHERE page.{key} > :_last_key ' \
+                f'ORDER BY page.{key} LIMIT {int(page_size)}'
+
+    statement = first_page
+    values = dict(parameters or {})
+    while True:
+        response = execute_statement(
+            statement, values, transaction_id=transaction_id,
+            database=database, schema=schema, includeResultMetadata=True,
+        )
+        yield response
+        records = response.get('records', [])
+        if len(records) < page_size:
+            return
+        names = [column['name'] for column in response['columnMetadata']]
+        statement = next_page
+        values['_last_key'] = decode_field(records[-1][names.index(key)])
+
+
+def iterate_statement(sql, parameters=None, *, key='id',
+                      page_size=DEFAULT_PAGE_SIZE, transaction_id=None,
+                      database=None, schema=None):
+    """
+    Lazily yield the rows of a SELECT statement, fetched page by page with
+    ``iterate_pages``
+
+    Yields:
+        dict: one decoded row
+    """
+    for response in iterate_pages(
+            sql, parameters, key=key, page_size=page_size,
+            transaction_id=transaction_id, database=database,
+            schema=schema):
+        yield from decode_records(response)
+
+
+def begin_transaction(*, database=None, schema=None):
+    response = _call('begin_transaction',
+                     **_connection_kwargs(database, schema))
+    return response['transactionId']
+
+
+def commit_transaction(transaction_id):
+    return _call('commit_transaction', transactionId=transaction_id,
+                 **_arns())
+
+
+def rollback_transaction(transaction_id):
+    return _call('rollback_transaction', transactionId=transaction_id,
+                 **_arns())
+
+
+def _chunk_parameter_sets(sql, parameter_sets, max_parameter_sets,
+                          max_request_size):
+    chunk = []
+    size = len(sql.encode())
+    for values in parameter_sets:
+        parameters = to_parameters(values)
+        parameters_size = len(json.dumps(parameters, default=str).encode())
+        if chunk and (len(chunk) >= max_parameter_sets or
+                      size + parameters_size > max_request_size):
+            yield chunk
+            chunk = []
+            size = len(sql.encode())
+        chunk.append(parameters)
+        size += parameters_size
+    if chunk:
+        yield chunk
+
+
+def batch_execute_statement(sql, parameter_sets, *, transaction_id=None,
+                            database=None, schema=None,
+                            max_parameter_sets=MAX_PARAMETER_SETS,
+                            max_request_size=MAX_REQUEST_SIZE):
+    """
+    Run one SQL statement for many parameter sets.
+
+    The parameter sets are sent in as few BatchExecuteStatement requests
+    as the Data API limits allow. All requests run in one transaction:
+    the given one, or a new transaction committed at the end and rolled
+    back if any chunk fails.
+
+    Args:
+        sql (str): the SQL statement, e.g. ``INSERT ... RETURNING id``
+        parameter_sets (iterable): one dict of values per row
+        transaction_id (str): run inside this transaction
+        database (str): the database name, default=$DB_NAME
+        schema (str): the database schema
+        max_parameter_sets (int): maximum parameter sets per request
+        max_request_size (int): maximum request size in bytes
+
+    Returns:
+        list: the generated values (e.g. ``RETURNING id``) of each row
+    """
+    if transaction_id is None:
+        with transaction(database=database, schema=schema) as tx:
+            return batch_execute_statement(
+                sql, parameter_sets, transaction_id=tx.id,
+                database=database, schema=schema,
+                max_parameter_sets=max_parameter_sets,
+                max_request_size=max_request_size,
+            )
+
+    request = _connection_kwargs(database, schema)
+    request['sql'] = sql
+    request['transactionId'] = transaction_id
+
+    generated = []
+    for chunk in _chunk_parameter_sets(sql, parameter_sets,
+                                       max_parameter_sets, max_request_size):
+        response = _call('batch_execute_statement',
+                         parameterSets=chunk, **request)
+        for result in response.get('updateResults', []):
+            generated.append([
+                decode_field(field)
+                for field in result.get('generatedFields', [])
+            ])
+    return generated
+
+
+def is_retryable(error):
+    """
+    Tell whether a Data API error is transient: the cluster is resuming
+    from auto-pause or the statement timed out
+    """
+    response = getattr(error, 'response', None) or {}
+    code = response.get('Error', {}).get('Code', '')
+    message = response.get('Error', {}).get('Message', '')
+    return code in RETRYABLE_ERROR_CODES or \
+        any(text in message for text in RESUMING_MESSAGES)
+
+
+class transaction:
+    """
+    Run a unit of work inside one Data API transaction.
+
+    Used as a context manager, the block runs once: it is committed on
+    success and rolled back on error. Starting the transaction is retried
+    while the cluster is resuming, since nothing has run yet::
+
+        with transaction() as tx:
+            execute_statement(sql, values, transaction_id=tx.id)
+
+    Used as a decorator, the whole function is retried with jittered
+    exponential backoff on transient errors, so it must be idempotent. It
+    receives the transaction id as the ``transaction_id`` keyword::
+
+        @transaction(retries=3)
+        def create_user(values, *, transaction_id):
+            ...
+
+    ``attempts`` holds the duration in seconds of every attempt and
+    ``elapsed`` the duration of the whole unit of work, retries included.
+    The decorated function keeps its last unit of work as ``last``, and
+    adds its timings to the invocation metrics: ``Transaction`` for the
+    whole unit and ``TransactionAttempt`` for each attempt, with their
+    ``Calls`` counts.
+    """
+
+    def __init__(self, *, retries=DEFAULT_RETRIES,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 database=None, schema=None):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.database = database
+        self.schema = schema
+        self.id = None
+        self.attempts = []
+        self.elapsed = None
+
+    def _copy(self):
+        return transaction(
+            retries=self.retries, base_delay=self.base_delay,
+            max_delay=self.max_delay, database=self.database,
+            schema=self.schema,
+        )
+
+    def backoff(self, attempt):
+        """Full-jitter exponential delay before retry number ``attempt``"""
+        import random
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** attempt)
+        )
+
+    def _retry(self, call):
+        started = time.perf_counter()
+        try:
+            for attempt in range(self.retries + 1):
+                attempt_started = time.perf_counter()
+                try:
+                    return call()
+                except Exception as error:
+                    if attempt == self.retries or not is_retryable(error):
+                        raise
+                    logger.warning('Transient Data API error, retrying: %s',
+                                   error)
+                    metrics.increment('DataApiRetries')
+                    time.sleep(self.backoff(attempt))
+                finally:
+                    self.attempts.append(
+                        time.perf_counter() - attempt_started
+                    )
+        finally:
+            self.elapsed = time.perf_counter() - started
+            logger.debug(
+                'Transaction took %.1f ms over %d attempt(s): %s',
+                self.elapsed * 1000, len(self.attempts),
+                ', '.join(f'{a * 1000:.1f} ms' for a in self.attempts),
+            )
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self.id = self._retry(lambda: begin_transaction(
+            database=self.database, schema=self.schema
+        ))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                commit_transaction(self.id)
+                return False
+            try:
+                rollback_transaction(self.id)
+            except Exception:
+                logger.exception('Rollback of transaction %s failed',
+                                 self.id)
+            return False
+        finally:
+            self.elapsed = time.perf_counter() - self._started
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            unit = self._copy()
+
+            def attempt():
+                # begin_transaction is retried by the outer loop
+                with transaction(retries=0, database=self.database,
+                                 schema=self.schema) as tx:
+                    return fn(*args, transaction_id=tx.id, **kwargs)
+
+            wrapper.last = unit
+            try:
+                return unit._retry(attempt)
+            finally:
+                for seconds in unit.attempts:
+                    metrics.record_call('TransactionAttempt', seconds)
+                metrics.record_call('Transaction', unit.elapsed)
+
+        wrapper.last = None
+        return wrapper
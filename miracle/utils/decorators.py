@@ -1,18 +1,196 @@
 """
 This module defines helper decorators
 """
+import functools
+import json
+import logging
+import os
+import sys
+import time
 
+from miracle.utils import metrics
+from miracle.utils import response as responses
 
-def middleware(*args, **kwargs):
+logger = logging.getLogger(__name__)
+
+_MISS = object()
+
+
+class ResponseCache:
+    """
+    Middleware stage caching the responses of idempotent GET requests in
+    the warm container. Responses are keyed on the resource, the path
+    parameters, the query string and the caller, unless ``shared``; only
+    200 responses are stored. A hit returns straight away, skipping the
+    handler and the database.
+    """
+
+    def __init__(self, *, ttl=30, max_size=128, shared=False):
+        """
+
+        Args:
+            ttl (float): the seconds a response is served from the cache
+            max_size (int): the maximum number of cached responses
+            shared (bool): serve one cached response to every caller,
+                only for responses which don't depend on the caller
+        """
+        from miracle.utils.cache import TTLCache
+        self._cache = TTLCache(None, max_size=max_size, ttl=ttl)
+        self.shared = shared
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Build the stage declared for the endpoint in ``views``, which the
+        API construct passes as RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIZE
+        and RESPONSE_CACHE_SHARED
+        """
+        ttl = os.getenv('RESPONSE_CACHE_TTL')
+        if not ttl:
+            return None
+        return cls(ttl=float(ttl),
+                   max_size=int(os.getenv('RESPONSE_CACHE_SIZE', '128')),
+                   shared=os.getenv('RESPONSE_CACHE_SHARED') == 'true')
+
+    @staticmethod
+    def caller(event):
+        """
+        Return the identity of the caller: the principal returned by the
+        authorizer, else the Authorization header it was given
+        """
+        authorizer = (event.get('requestContext') or {}).get('authorizer')
+        if authorizer and authorizer.get('principalId') is not None:
+            return 'principal', authorizer['principalId']
+        for name, value in (event.get('headers') or {}).items():
+            if name.lower() == 'authorization':
+                return 'authorization', value
+        return None
+
+    def key(self, event):
+        query = event.get('multiValueQueryStringParameters') or \
+            event.get('queryStringParameters') or {}
+        return (
+            event.get('resource') or event.get('path'),
+            tuple(sorted((event.get('pathParameters') or {}).items())),
+            tuple(sorted(
+                (name, tuple(value) if isinstance(value, list) else value)
+                for name, value in query.items()
+            )),
+            None if self.shared else self.caller(event),
+        )
+
+    def info(self):
+        return self._cache.info()
+
+    def __call__(self, event, context, call_next):
+        if event.get('httpMethod') != 'GET':
+            return call_next(event, context)
+        key = self.key(event)
+        response = self._cache.peek(key, _MISS)
+        if response is not _MISS:
+            metrics.increment('ResponseCacheHits')
+            return dict(response)
+        response = call_next(event, context)
+        if isinstance(response, dict) and response.get('statusCode') == 200:
+            self._cache.put(key, dict(response))
+        return response
+
+
+def _bind(stage, call_next):
+    def call(event, context):
+        return stage(event, context, call_next)
+    return call
+
+
+def middleware(*stages, log_payload=False, sample_rate=None):
+    """
+    Wrap a Lambda handler in an ordered middleware pipeline.
+
+    Each stage is a callable ``stage(event, context, call_next)``: it can
+    return a response early, or call ``call_next(event, context)`` to run
+    the next stages and the handler. When the endpoint declares a
+    ``response_cache`` in ``views``, a ``ResponseCache`` stage runs first.
+
+    Bodies which are not strings are serialized with
+    ``miracle.utils.response``, so they can hold model instances. When
+    RESPONSE_GZIP_MIN_SIZE is set, larger bodies are gzipped for clients
+    accepting it.
+
+    Every invocation records the time spent in the handler body, in Data
+    API calls, in response serialization and compression and in the
+    middleware itself, and flags cold starts. The metrics are emitted in
+    CloudWatch Embedded Metric Format, sampled with ``sample_rate``.
+
+    Args:
+        stages: the middleware stages, outermost first
+        log_payload (bool): log the incoming event, default=False
+        sample_rate (float): the share of warm invocations emitting
+            metrics, default=$METRICS_SAMPLE_RATE
+    """
     def inner(fn):
         """This decorator is used for implement any action
         before processing the API"""
-        def wrapper(*args, **kwargs):
-            print('before execution')
-            print(args)
-            print(kwargs)
-            response = fn(*args, **kwargs)
-            print('after execution')
+        function_name = os.getenv('AWS_LAMBDA_FUNCTION_NAME', fn.__name__)
+        response_cache = ResponseCache.from_environment()
+        pipeline = ([response_cache] if response_cache else []) + \
+            list(stages)
+        gzip_min_size = os.getenv('RESPONSE_GZIP_MIN_SIZE')
+        gzip_min_size = int(gzip_min_size) if gzip_min_size else None
+
+        def endpoint(event, context):
+            invocation = metrics.current()
+            started = time.perf_counter()
+            response = fn(event, context)
+            serialization_started = time.perf_counter()
+            invocation.add_time('Handler', serialization_started - started)
+
+            if isinstance(response, dict) and \
+                    not isinstance(response.get('body'), (str, type(None))):
+                response['body'] = responses.dumps(response['body'])
+                headers = response.setdefault('headers', {})
+                headers.setdefault('Content-Type', 'application/json')
+            invocation.add_time('Serialization',
+                                time.perf_counter() - serialization_started)
             return response
+
+        call = endpoint
+        for stage in reversed(pipeline):
+            call = _bind(stage, call)
+
+        @functools.wraps(fn)
+        def wrapper(event, context):
+            started = time.perf_counter()
+            invocation = metrics.start(function_name)
+            if log_payload:
+                logger.info('Event: %s', json.dumps(event, default=str))
+            try:
+                response = call(event, context)
+                if gzip_min_size is not None and isinstance(response, dict):
+                    # After the response cache, which serves every client
+                    compression_started = time.perf_counter()
+                    response = responses.compress(response, event,
+                                                  gzip_min_size)
+                    invocation.add_time(
+                        'Compression',
+                        time.perf_counter() - compression_started,
+                    )
+                return response
+            finally:
+                # Only reported by handlers that use the Data API
+                data_api = sys.modules.get('miracle.utils.data_api')
+                if data_api is not None:
+                    invocation.set('DataApiClientCacheHitRate',
+                                   data_api.client_cache_info().hit_rate)
+                timings = invocation.metrics
+                inner_time = sum(
+                    timings[name][0]
+                    for name in ('Handler', 'Serialization', 'Compression')
+                    if name in timings
+                )
+                invocation.add_time(
+                    'Middleware',
+                    time.perf_counter() - started - inner_time / 1000,
+                )
+                metrics.finish(invocation, sample_rate)
         return wrapper
     return inner
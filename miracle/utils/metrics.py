@@ -0,0 +1,107 @@
+"""
+This module defines the hot-path timing and metrics of the handlers.
+
+The middleware opens an ``Invocation`` for every request; the Data API
+helpers and the middleware itself add their timings to it. When the
+invocation ends, its metrics are written to stdout as one CloudWatch
+Embedded Metric Format (EMF) line, so CloudWatch extracts the metrics
+from the logs without any API call. Cold starts are always emitted,
+warm invocations are sampled with METRICS_SAMPLE_RATE.
+"""
+import contextvars
+import json
+import os
+import sys
+import time
+
+NAMESPACE = os.getenv('METRICS_NAMESPACE', 'miracle')
+SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', '1'))
+
+_current = contextvars.ContextVar('miracle_invocation', default=None)
+_cold_start = True
+
+
+class Invocation:
+    """Metrics collected during one handler invocation"""
+
+    __slots__ = ('function_name', 'cold_start', 'metrics')
+
+    def __init__(self, function_name, cold_start):
+        self.function_name = function_name
+        self.cold_start = cold_start
+        self.metrics = {}
+
+    def add_time(self, name, seconds):
+        """Add a duration to the ``name`` timing, in milliseconds"""
+        entry = self.metrics.get(name)
+        if entry is None:
+            self.metrics[name] = [seconds * 1000, 'Milliseconds']
+        else:
+            entry[0] += seconds * 1000
+
+    def increment(self, name, value=1):
+        entry = self.metrics.get(name)
+        if entry is None:
+            self.metrics[name] = [value, 'Count']
+        else:
+            entry[0] += value
+
+    def set(self, name, value, unit='None'):
+        self.metrics[name] = [value, unit]
+
+    def to_emf(self):
+        return {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': [['FunctionName']],
+                    'Metrics': [
+                        {'Name': name, 'Unit': unit}
+                        for name, (_, unit) in self.metrics.items()
+                    ],
+                }],
+            },
+            'FunctionName': self.function_name,
+            **{name: value for name, (value, _) in self.metrics.items()},
+        }
+
+
+def start(function_name):
+    """Open the invocation of the current request"""
+    global _cold_start
+    invocation = Invocation(function_name, _cold_start)
+    _cold_start = False
+    if invocation.cold_start:
+        invocation.increment('ColdStart')
+    _current.set(invocation)
+    return invocation
+
+
+def current():
+    return _current.get()
+
+
+def record_call(name, seconds):
+    """Add one timed call, e.g. a Data API request, to the invocation"""
+    invocation = _current.get()
+    if invocation is not None:
+        invocation.add_time(name, seconds)
+        invocation.increment(f'{name}Calls')
+
+
+def increment(name, value=1):
+    invocation = _current.get()
+    if invocation is not None:
+        invocation.increment(name, value)
+
+
+def finish(invocation, sample_rate=None):
+    """Close the invocation and emit its metrics if it is sampled"""
+    _current.set(None)
+    rate = SAMPLE_RATE if sample_rate is None else sample_rate
+    if not (invocation.cold_start or rate >= 1):
+        import random
+        if random.random() >= rate:
+            return
+    sys.stdout.write(json.dumps(invocation.to_emf()) + '\n')
@@ -0,0 +1,171 @@
+"""
+This module defines the serialization of the handler responses.
+
+Model instances are written by a serializer compiled once per model from
+its field registry: every field has a dedicated encoder, so no dict copy
+of the instance is built and no type is guessed per value. ``Decimal``
+values are written as JSON numbers, and the epoch ``BIGINT`` values of
+date fields in the format of the field.
+
+Responses may be gzip-compressed for clients accepting it, see
+``compress``.
+"""
+import base64
+import json
+import math
+import operator
+import time
+from decimal import Decimal
+from json.encoder import encode_basestring_ascii as encode_string
+
+_fallback = json.JSONEncoder(default=str).encode
+
+
+def encode_value(value):
+    """Encode any value, the generic path for non-field values"""
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    value_type = type(value)
+    if value_type is str:
+        return encode_string(value)
+    if value_type is int:
+        return int.__repr__(value)
+    if value_type is float or value_type is Decimal:
+        return encode_number(value)
+    meta = getattr(value_type, '_meta', None)
+    if meta is not None:
+        return meta.serializer(value)
+    if value_type is list or value_type is tuple:
+        return encode_list(value)
+    if value_type is dict:
+        return '{' + ','.join(
+            f'{encode_string(str(key))}:{encode_value(item)}'
+            for key, item in value.items()
+        ) + '}'
+    return _fallback(value)
+
+
+def encode_text(value):
+    if type(value) is str:
+        return encode_string(value)
+    return encode_value(value)
+
+
+def encode_integer(value):
+    if type(value) is int:
+        return int.__repr__(value)
+    return encode_value(value)
+
+
+def encode_number(value):
+    """Encode a float or a Decimal as a JSON number, keeping its digits"""
+    value_type = type(value)
+    if value_type is float:
+        return float.__repr__(value) if math.isfinite(value) else 'null'
+    if value_type is Decimal:
+        return str(value) if value.is_finite() else 'null'
+    return encode_value(value)
+
+
+def encode_epoch(format_date):
+    """Return the encoder of epoch seconds as ``format_date`` UTC strings"""
+    strftime = time.strftime
+    gmtime = time.gmtime
+
+    def encode(value):
+        if type(value) is int or type(value) is float:
+            # 3x faster than datetime.strftime
+            return f'"{strftime(format_date, gmtime(value))}"'
+        return encode_value(value)
+    return encode
+
+
+def encode_list(values):
+    """
+    Encode a list in one buffer; a list of instances of one model is
+    written by its serializer without any per-item dispatch
+    """
+    if not values:
+        return '[]'
+    meta = getattr(type(values[0]), '_meta', None)
+    if meta is not None and all(type(value) is type(values[0])
+                                for value in values):
+        serializer = meta.serializer
+        return '[' + ','.join(map(serializer, values)) + ']'
+    return '[' + ','.join(map(encode_value, values)) + ']'
+
+
+def compile_serializer(model):
+    """
+    Build the function writing an instance of ``model`` as a JSON object,
+    with ``id`` followed by the fields in column order
+    """
+    fields = model._meta.fields
+    # One C call reads every slot of an instance
+    values = operator.attrgetter('id', *(
+        field.slot.__name__ for field in fields.values()
+    ))
+    members = tuple(zip(
+        ('{"id":',) + tuple(f',{encode_string(attname)}:'
+                            for attname in fields),
+        (encode_integer,) + tuple(field.encoder()
+                                  for field in fields.values()),
+    ))
+
+    def serialize(instance):
+        parts = []
+        append = parts.append
+        for (prefix, encode), value in zip(members, values(instance)):
+            append(prefix)
+            append('null' if value is None else encode(value))
+        append('}')
+        return ''.join(parts)
+
+    return serialize
+
+
+def dumps(value):
+    """Serialize a response body, e.g. a dict holding model instances"""
+    return encode_value(value)
+
+
+def accepts_gzip(event):
+    headers = event.get('headers') or {}
+    for name, value in headers.items():
+        if name.lower() != 'accept-encoding':
+            continue
+        for encoding in (value or '').lower().split(','):
+            coding, _, parameters = encoding.partition(';')
+            if coding.strip() in ('gzip', '*') and \
+                    parameters.replace(' ', '') not in ('q=0', 'q=0.0'):
+                return True
+    return False
+
+
+def compress(response, event, min_size):
+    """
+    Gzip the body of a proxy response when the client accepts it and the
+    body has at least ``min_size`` bytes. The body is then base64 encoded,
+    which API Gateway REST APIs only decode for the ``binaryMediaTypes``
+    of the API; otherwise rely on its ``minimumCompressionSize``.
+    """
+    body = response.get('body')
+    if not isinstance(body, str) or response.get('isBase64Encoded') \
+            or not accepts_gzip(event):
+        return response
+    data = body.encode()
+    if len(data) < min_size:
+        return response
+    # Imported here, small responses and most clients never need it
+    import gzip
+    response['body'] = base64.b64encode(
+        gzip.compress(data, compresslevel=5)
+    ).decode()
+    response['isBase64Encoded'] = True
+    response['headers'] = {**(response.get('headers') or {}),
+                           'Content-Encoding': 'gzip'}
+    return response
@@ -0,0 +1,98 @@
+"""
+This module defines the in-process router of an API module deployed in
+``router`` mode: one Lambda function serves every endpoint of the module.
+
+The API construct passes the module ``views`` as the ROUTER_VIEWS
+environment variable. They are compiled once into a dispatch table keyed
+on the HTTP method and the API Gateway resource path of the proxy event,
+e.g. ``('GET', '/get/{user_id}')``. Endpoint handlers are loaded from
+``<endpoint>/<endpoint>.py`` on first use, and each endpoint's own
+environment variables are set while its code is imported and run.
+"""
+import importlib.util
+import json
+import os
+
+NOT_FOUND = {
+    'statusCode': 404,
+    'body': json.dumps({'message': 'Not Found'}),
+}
+
+
+class Router:
+
+    def __init__(self, views, root):
+        """
+
+        Args:
+            views (dict): the endpoint configurations, as in ``views.py``
+            root (str): the directory holding the endpoint packages
+        """
+        self._root = root
+        self._routes = {}
+        self._environment = {}
+        self._handlers = {}
+        for endpoint, metadata in views.items():
+            resource = f'/{endpoint}'
+            if metadata.get('pathParams'):
+                resource += f'/{metadata["pathParams"]}'
+            self._routes[(metadata.get('method'), resource)] = endpoint
+            self._environment[endpoint] = metadata.get('environment') or {}
+
+    @classmethod
+    def from_environment(cls):
+        return cls(
+            json.loads(os.environ['ROUTER_VIEWS']),
+            os.getenv('LAMBDA_TASK_ROOT', os.getcwd()),
+        )
+
+    def resolve(self, event):
+        """Return the endpoint of a proxy event, ``None`` if unknown"""
+        return self._routes.get(
+            (event.get('httpMethod'), event.get('resource'))
+        )
+
+    def _swap_environment(self, variables):
+        previous = {name: os.environ.get(name) for name in variables}
+        os.environ.update(variables)
+        return previous
+
+    @staticmethod
+    def _restore_environment(previous):
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    def _load(self, endpoint):
+        path = os.path.join(self._root, endpoint, f'{endpoint}.py')
+        spec = importlib.util.spec_from_file_location(
+            f'endpoint_{endpoint.replace("-", "_")}', path
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self._handlers[endpoint] = module.handler
+        return module.handler
+
+    def __call__(self, event, context):
+        endpoint = self.resolve(event)
+        if endpoint is None:
+            return dict(NOT_FOUND)
+        previous = self._swap_environment(self._environment[endpoint])
+        try:
+            handler = self._handlers.get(endpoint) or self._load(endpoint)
+            return handler(event, context)
+        finally:
+            self._restore_environment(previous)
+
+
+_router = None
+
+
+def handler(event, context):
+    """Lambda entry point of the router functions"""
+    global _router
+    if _router is None:
+        _router = Router.from_environment()
+    return _router(event, context)
@@ -1,12 +1,21 @@
 """
-This is the handler for user/get
+This is the handler for user/get-all
 """
+from miracle.db import pagination
+from miracle.euni.users import User
 from miracle.utils.decorators import middleware
 
 
-@middleware(loggig=False)
+@middleware()
 def handler(event, context):
-    pass
-
-
-print(handler({}, {}))
+    try:
+        page = pagination.paginate_event(User.objects, event)
+    except pagination.InvalidPage as error:
+        return {'statusCode': 400, 'body': {'message': str(error)}}
+    return {
+        'statusCode': 200,
+        'body': {
+            'items': page.items,
+            'next_cursor': page.next_cursor,
+        },
+    }
@@ -4,6 +4,23 @@ These configuration includes:
 - endpoint sub-path
 - endpoint path parameter
 - additional environment for handler of each endpoint
+- in-container response cache of idempotent GET endpoint: ttl (seconds),
+  max_size, and shared to serve one cached response to every caller
+  instead of one per principal
+- Lambda settings of the handler: timeout (seconds), memory_size (MB),
+  architecture ('x86_64' or 'arm64'), reserved_concurrency and
+  provisioned_concurrency
+- API Gateway stage cache of the endpoint: ttl (seconds), key_parameters
+  (e.g. 'querystring.limit', 'header.Accept'), encrypted, and shared to
+  serve one cached response to every caller instead of one per identity
+- CORS preflight of the endpoint: methods allowed (default=its method) and
+  max_age (seconds browsers cache the preflight)
+- cursor pagination of list endpoint, with the limit & cursor query
+  parameters: order_by (sort key, '-' for descending), default_limit and
+  max_limit
+- gzip_min_size: gzip in the handler the responses of at least this many
+  bytes, the API must then declare the binary media types; API Gateway
+  compression (minimum_compression_size of the API) needs no setting
 """
 
 url = {
@@ -11,7 +28,19 @@ url = {
         'method': 'GET',
         'environment': {
             'resource-arn': 'abc'
-        }
+        },
+        'response_cache': {
+            'ttl': 30,
+            'max_size': 128,
+        },
+        'pagination': {
+            'order_by': '-created_at',
+            'default_limit': 50,
+            'max_limit': 200,
+        },
+        'memory_size': 512,
+        'architecture': 'arm64',
+        'provisioned_concurrency': 2,
     },
     'get': {
         'method': 'GET',
@@ -19,6 +48,14 @@ url = {
         'environment': {
             'resource-arn': 'abc',
         },
+        'response_cache': {
+            'ttl': 30,
+            'max_size': 512,
+        },
+        'cache': {
+            'ttl': 60,
+            'encrypted': True,
+        },
     },
     'create': {
         'method': 'POST',
@@ -0,0 +1,97 @@
+import copy
+
+import pytest
+
+from miracle.db import migrations
+from miracle.db import models
+from miracle.euni.users import User
+from miracle.euni.dictionary import Dictionary
+
+
+def test_empty_snapshot_creates_referenced_tables_first():
+    new = migrations.snapshot([Dictionary, User])
+    statements = migrations.diff(migrations.empty_snapshot(), new)
+    assert [s.split(' (')[0] for s in statements] == [
+        'CREATE TABLE "user"', 'CREATE TABLE "dictionary"',
+        'CREATE INDEX user_created_by_idx ON "user"',
+        'CREATE INDEX user_updated_by_idx ON "user"',
+        'CREATE INDEX user_created_at_id_idx ON "user"',
+        'CREATE INDEX dictionary_created_by_idx ON "dictionary"',
+        'CREATE INDEX dictionary_updated_by_idx ON "dictionary"',
+        'CREATE INDEX dictionary_key_idx ON "dictionary"',
+    ]
+
+
+def test_unchanged_models_emit_nothing():
+    state = migrations.snapshot([User, Dictionary])
+    assert migrations.diff(state, copy.deepcopy(state)) == []
+
+
+def test_column_changes_emit_minimal_alters():
+    new = migrations.snapshot([User])
+    old = copy.deepcopy(new)
+    columns = old['tables']['user']['columns']
+    del columns['last_name']
+    columns['fname']['type'] = 'varchar(20)'
+    columns['obsolete'] = dict(columns['fname'])
+    old['tables']['user']['indexes']['user_fname_idx'] = \
+        'CREATE INDEX user_fname_idx ON "user" ("fname");'
+
+    new['tables']['user']['columns']['last_name']['nullable'] = True
+
+    assert migrations.diff(old, new) == [
+        'DROP INDEX IF EXISTS user_fname_idx;',
+        'ALTER TABLE "user" ADD COLUMN "last_name" varchar(30);',
+        'ALTER TABLE "user" ALTER COLUMN "fname" TYPE varchar(30)'
+        ' USING "fname"::varchar(30);',
+        'ALTER TABLE "user" DROP COLUMN "obsolete";',
+    ]
+
+
+def test_required_columns_are_added_with_their_default():
+    new = migrations.snapshot([User])
+    old = copy.deepcopy(new)
+    del old['tables']['user']['columns']['fname']
+    del old['tables']['user']['columns']['last_name']
+
+    with pytest.raises(ValueError):
+        migrations.diff(old, new)
+
+    del new['tables']['user']['columns']['last_name']
+    assert migrations.diff(old, new) == [
+        'ALTER TABLE "user" ADD COLUMN "fname" varchar(30) DEFAULT \'Tan\''
+        " NOT NULL;",
+    ]
+
+
+def test_constraint_names_are_not_schema_qualified():
+    class Tag(models.Model):
+        name = models.CharField(max_length=10)
+
+        class Meta:
+            table_name = 'tag'
+            db_schema = 'app'
+
+    new = migrations.snapshot([Tag])
+    old = copy.deepcopy(new)
+    new['tables']['app.tag']['columns']['name']['unique'] = True
+
+    assert migrations.diff(old, new) == [
+        'ALTER TABLE "app"."tag" ADD CONSTRAINT tag_name_key'
+        ' UNIQUE ("name");',
+    ]
+
+
+def test_model_ddl_uses_the_migration_renderer():
+    class Profile(models.Model):
+        owner = models.ForeignKey(ref_table='user', ref_column='id',
+                                  unique=True, default=1)
+
+        class Meta:
+            table_name = 'profile'
+
+    create = migrations.create_table('profile',
+                                     migrations.table_state(Profile))
+    assert '"owner" INT REFERENCES "user" ("id") ON DELETE CASCADE' \
+           ' DEFAULT 1 NOT NULL UNIQUE' in create
+    assert Profile.generate_ddl_scripts() == create
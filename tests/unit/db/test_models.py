@@ -0,0 +1,264 @@
+import json
+from decimal import Decimal
+
+from miracle.db import models
+from miracle.euni import Abstract
+from miracle.euni.users import User
+from miracle.euni.dictionary import Dictionary
+
+
+def test_registry_merges_inherited_fields_in_order():
+    assert User._meta.field_names == (
+        'created_by', 'updated_by', 'created_at', 'updated_at',
+        'first_name', 'last_name',
+    )
+    assert Dictionary._meta.fields['created_by'] is \
+        Abstract._meta.fields['created_by']
+
+
+def test_registry_exposes_columns():
+    assert User._meta.columns['fname'] is User._meta.fields['first_name']
+    assert User._meta.column_order['last_name'] == 5
+    assert User._meta.table_name == 'user'
+
+
+def test_registry_is_immutable():
+    try:
+        User._meta.fields['other'] = models.CharField()
+    except TypeError:
+        pass
+    else:
+        raise AssertionError('registry should be read-only')
+
+
+def test_plain_attribute_removes_inherited_field():
+    class Child(Dictionary):
+        value = None
+
+    assert 'value' not in Child._meta.fields
+    assert 'key' in Child._meta.fields
+
+
+def test_instances_are_slot_backed():
+    user = User(first_name='Ada', last_name='Lovelace')
+    assert not hasattr(user, '__dict__')
+    assert (user.id, user.first_name, user.created_at) == \
+        (None, 'Ada', None)
+    assert isinstance(User.first_name, models.CharField)
+
+
+def test_from_records_maps_columns_to_slots():
+    users = User.from_records(
+        [
+            [{'longValue': 1}, {'stringValue': 'Ada'}, {'isNull': True}],
+            [{'longValue': 2}, {'stringValue': 'Alan'}, {'longValue': 7}],
+        ],
+        ['id', 'fname', 'unknown'],
+    )
+    assert [(u.id, u.first_name, u.last_name) for u in users] == \
+        [(1, 'Ada', None), (2, 'Alan', None)]
+
+
+class Price(models.Model):
+    amount = models.DecimalField(nullable=True)
+    valid_from = models.DateField(nullable=True)
+
+
+def test_from_records_uses_typed_decoders():
+    prices = Price.from_records(
+        [
+            [{'longValue': 1}, {'doubleValue': 0.1}, {'longValue': 86400}],
+            [{'longValue': 2}, {'stringValue': '2.50'}, {'isNull': True}],
+        ],
+        ['id', 'amount', 'valid_from'],
+    )
+    assert [(p.id, p.amount, p.valid_from) for p in prices] == \
+        [(1, Decimal('0.1'), 86400), (2, Decimal('2.50'), None)]
+    assert Price._meta.record_loader(('id', 'amount'))[1] == \
+        (Price.valid_from.slot.__set__,)
+
+
+def test_iterator_loads_pages_with_typed_decoders(monkeypatch):
+    table = [[{'longValue': i}, {'stringValue': f'{i}.10'}, {'isNull': True}]
+             for i in range(1, 4)]
+    statements = []
+
+    def execute_statement(sql, parameters, **kwargs):
+        statements.append((sql, dict(parameters)))
+        last = parameters.get('_last_key', 0)
+        return {
+            'columnMetadata': [{'name': 'id'}, {'name': 'amount'},
+                               {'name': 'valid_from'}],
+            'records': [r for r in table if r[0]['longValue'] > last][:2],
+        }
+
+    monkeypatch.setattr(models.data_api, 'execute_statement',
+                        execute_statement)
+    prices = list(Price.objects.filter(amount__gt=1).iterator(page_size=2))
+    assert [(p.id, p.amount, p.valid_from) for p in prices] == \
+        [(1, Decimal('1.10'), None), (2, Decimal('2.10'), None),
+         (3, Decimal('3.10'), None)]
+    assert type(prices[0].amount) is Decimal
+    assert [parameters.get('_last_key') for _, parameters in statements] \
+        == [None, 2]
+
+
+def test_from_response_reads_json_formatted_records():
+    prices = Price.from_response({'formattedRecords': json.dumps([
+        {'id': 1, 'amount': 0.1, 'valid_from': 86400},
+        {'id': 2, 'amount': None, 'valid_from': None},
+    ])})
+    assert [(p.id, p.amount, p.valid_from) for p in prices] == \
+        [(1, Decimal('0.1'), 86400), (2, None, None)]
+    assert Price.from_response({'formattedRecords': '[]'}) == []
+
+
+def test_validate_many_collects_errors_per_row():
+    errors = User.validate_many([
+        {'first_name': 'Ada Lovelace', 'last_name': 'Lovelace'},
+        {'first_name': 'Ada', 'last_name': None, 'nickname': 'x'},
+        {'last_name': 'x' * 31, 'created_at': 'yesterday'},
+        {'last_name': 'Turing', 'created_by': True},
+    ])
+    assert list(errors) == [1, 2, 3]
+    assert errors[1] == {
+        'first_name': ['Ensure this value has at least 10 characters'],
+        'last_name': ['This field is required'],
+        'nickname': ['Unknown field'],
+    }
+    assert set(errors[2]) == {'last_name', 'created_at'}
+    assert errors[3] == {'created_by': ['Must be an integer id']}
+
+
+def test_non_finite_decimals_are_rejected():
+    class Fee(models.Model):
+        amount = models.DecimalField(min_value=0, max_value=10)
+
+    errors = Fee.validate_many([
+        {'amount': value}
+        for value in ('NaN', 'Infinity', '-inf', 1e400, 'sNaN', '2.5')
+    ])
+    assert errors == {
+        index: {'amount': ['Must be a finite decimal number']}
+        for index in range(5)
+    }
+
+
+def test_partial_validation_allows_absent_fields():
+    assert User.validate_many([{'first_name': 'Grace Hopper'}],
+                              partial=True) == {}
+
+
+def test_instance_validate_raises():
+    from miracle.db.validation import ValidationError
+
+    user = User(first_name='Ada', last_name='Lovelace')
+    try:
+        user.validate()
+    except ValidationError as error:
+        assert list(error.errors) == ['first_name']
+    else:
+        raise AssertionError('expected a ValidationError')
+
+
+def test_index_declarations():
+    class Entry(Abstract):
+        code = models.CharField(max_length=10, unique=True, db_index=True)
+        label = models.CharField(name='lbl', max_length=10, db_index=True)
+        amount = models.IntegerField()
+
+        class Meta:
+            table_name = 'entry'
+            db_schema = 'app'
+            indexes = [
+                models.Index('label', 'amount', include=('code',),
+                             where='amount > 0'),
+                models.Index(expressions=('lower(lbl)',),
+                             name='entry_lower_lbl_idx', unique=True),
+            ]
+
+    assert Entry.generate_index_scripts() == [
+        'CREATE INDEX entry_created_by_idx ON "app"."entry" ("created_by");',
+        'CREATE INDEX entry_updated_by_idx ON "app"."entry" ("updated_by");',
+        'CREATE INDEX entry_lbl_idx ON "app"."entry" ("lbl");',
+        'CREATE INDEX entry_lbl_amount_idx ON "app"."entry"'
+        ' ("lbl", "amount") INCLUDE ("code") WHERE amount > 0;',
+        'CREATE UNIQUE INDEX entry_lower_lbl_idx ON "app"."entry"'
+        ' (lower(lbl));',
+    ]
+    assert Entry.generate_index_scripts(concurrently=True)[0] == \
+        'CREATE INDEX CONCURRENTLY entry_created_by_idx' \
+        ' ON "app"."entry" ("created_by");'
+
+
+def test_index_of_unknown_field_is_rejected():
+    try:
+        class Broken(models.Model):
+            name = models.CharField()
+
+            class Meta:
+                indexes = [models.Index('missing')]
+    except ValueError as error:
+        assert 'missing' in str(error)
+    else:
+        raise AssertionError('unknown indexed field should be rejected')
+
+
+def test_renaming_a_dictionary_entry_invalidates_both_keys(monkeypatch):
+    from miracle.euni import dictionary
+
+    monkeypatch.setattr(models, 'execute_statement',
+                        lambda sql, values, transaction_id=None: {})
+    cache = dictionary._cache
+    entry, = Dictionary.from_json(
+        [{'id': 1, 'key': 'color', 'value': 'red'}], ['id', 'key', 'value']
+    )
+    cache.preload([('color', 'red'), ('size', 'L')])
+
+    entry.key = 'colour'
+    entry.save()
+    assert 'color' not in cache._data and 'size' in cache._data
+
+    cache.preload([('colour', 'red')])
+    entry.key = 'hue'
+    entry.save()
+    assert 'colour' not in cache._data
+    cache.invalidate()
+
+
+def test_validated_dates_are_written_as_epochs(monkeypatch):
+    from datetime import date
+    from miracle.db import query
+    from miracle.utils import data_api
+
+    rows = [
+        {'first_name': 'Ada Lovelace', 'last_name': 'L',
+         'created_at': '2021-01-01 00:00:00'},
+        {'first_name': 'Alan Turing', 'last_name': 'T',
+         'created_at': date(2021, 1, 1)},
+    ]
+    assert User.validate_many(rows) == {}
+
+    written = []
+    monkeypatch.setattr(
+        models, 'execute_statement',
+        lambda sql, values, transaction_id=None:
+            written.append(data_api.to_parameters(values))
+            or {'records': [[{'longValue': 1}]]},
+    )
+    monkeypatch.setattr(
+        query.data_api, 'execute_statement',
+        lambda sql, values, transaction_id=None:
+            written.append(data_api.to_parameters(values)) or {},
+    )
+    User(**rows[0]).save()
+    User.bulk_create([User(**rows[1])])
+
+    created_at = [parameter['value'] for parameters in written
+                  for parameter in parameters
+                  if parameter['name'] in ('created_at', 'p2')]
+    assert created_at == [{'longValue': 1609459200}] * 2
+    sql, parameters = User.objects.filter(
+        created_at__gte='2021-01-01 00:00:00'
+    ).compile()
+    assert parameters == {'p0': 1609459200}
@@ -0,0 +1,86 @@
+import pytest
+
+from miracle.db import pagination
+from miracle.db import query
+from miracle.euni.users import User
+
+
+def record(id, created_at):
+    return [{'longValue': id}, {'isNull': True}, {'isNull': True},
+            {'longValue': created_at}, {'isNull': True},
+            {'stringValue': 'Ada'}, {'stringValue': 'L'}]
+
+
+@pytest.fixture
+def statements(monkeypatch):
+    calls = []
+
+    def execute_statement(sql, parameters, **kwargs):
+        calls.append((sql, parameters))
+        return {'records': [record(id, 100 - id) for id in range(1, 4)]}
+
+    monkeypatch.setattr(query.data_api, 'execute_statement',
+                        execute_statement)
+    return calls
+
+
+def test_seek_compiles_to_a_row_comparison():
+    sql, parameters = User.objects.filter(last_name='L').order_by(
+        '-created_at', '-id'
+    ).after(90, 7).limit(2).compile()
+    assert sql.endswith(
+        'WHERE "last_name" = :p0 AND ("created_at", "id") < (:k0, :k1) '
+        'ORDER BY "created_at" DESC, "id" DESC LIMIT :limit'
+    )
+    assert parameters == {'p0': 'L', 'k0': 90, 'k1': 7, 'limit': 2}
+
+    with pytest.raises(ValueError):
+        User.objects.order_by('created_at', '-id').after(90, 7)
+
+
+def test_pages_chain_through_the_cursor(statements):
+    page = pagination.paginate(User.objects, order_by='-created_at',
+                               limit=2)
+    assert [user.id for user in page.items] == [1, 2]
+    assert statements[0][1] == {'limit': 3}
+
+    page = pagination.paginate(User.objects, order_by='-created_at',
+                               cursor=page.next_cursor, limit=5)
+    assert statements[1][1] == {'k0': 98, 'k1': 2, 'limit': 6}
+    assert page.next_cursor is None
+
+
+def test_event_parameters_are_validated(statements, monkeypatch):
+    monkeypatch.setenv('MAX_PAGE_SIZE', '2')
+    page = pagination.paginate_event(
+        User.objects, {'queryStringParameters': {'limit': '500'}}
+    )
+    assert len(page.items) == 2
+
+    for query_string in ({'limit': 'ten'}, {'limit': '0'},
+                         {'cursor': 'not-a-cursor'},
+                         {'cursor': pagination.encode_cursor('id', [1])}):
+        with pytest.raises(pagination.InvalidPage):
+            pagination.paginate_event(
+                User.objects, {'queryStringParameters': query_string},
+                order_by='-created_at',
+            )
+
+
+def test_cursor_values_must_match_the_sort_keys(statements):
+    for values in (['abc', 1], [1.5, 1], [True, 1], [90, '1'], [90, None],
+                   [2 ** 63, 1]):
+        cursor = pagination.encode_cursor('-created_at', values)
+        with pytest.raises(pagination.InvalidPage):
+            pagination.paginate(User.objects, order_by='-created_at',
+                                cursor=cursor)
+    assert statements == []
+
+    cursor = pagination.encode_cursor('last_name', ['L', 3])
+    pagination.paginate(User.objects, order_by='last_name', cursor=cursor)
+    assert statements[0][1]['k0'] == 'L'
+    with pytest.raises(pagination.InvalidPage):
+        pagination.paginate(
+            User.objects, order_by='last_name',
+            cursor=pagination.encode_cursor('last_name', [3, 3]),
+        )
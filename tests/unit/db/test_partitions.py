@@ -0,0 +1,95 @@
+from datetime import datetime
+from datetime import timezone
+
+import pytest
+
+from miracle.db import migrations
+from miracle.db import models
+from miracle.db import partitions
+from miracle.db.partitions import RangePartition
+from miracle.euni import Abstract
+
+
+def epoch(*args):
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+class Event(Abstract):
+    name = models.CharField(max_length=20)
+
+    class Meta:
+        table_name = 'event'
+        partition_by = RangePartition('created_at', interval='month',
+                                      premake=2, retention=1)
+
+
+def test_partitioned_parent_table():
+    script = Event.generate_ddl_scripts().split('\n')
+    assert script[1] == '\t"id" BIGSERIAL,'
+    assert script[-4:-2] == [
+        '\tPRIMARY KEY ("id", "created_at")',
+        ') PARTITION BY RANGE ("created_at");',
+    ]
+
+    state = migrations.snapshot([Event])
+    create = migrations.diff(migrations.empty_snapshot(), state)[0]
+    assert create.endswith(
+        '\tPRIMARY KEY ("id", "created_at")\n'
+        ') PARTITION BY RANGE ("created_at");'
+    )
+
+
+def test_monthly_partitions_are_created_ahead():
+    assert partitions.create_partitions(Event, now=epoch(2023, 11, 15)) == [
+        f'CREATE TABLE IF NOT EXISTS "event_p{suffix}" PARTITION OF "event"'
+        f' FOR VALUES FROM ({lower}) TO ({upper});'
+        for suffix, lower, upper in (
+            ('2023_11', epoch(2023, 11, 1), epoch(2023, 12, 1)),
+            ('2023_12', epoch(2023, 12, 1), epoch(2024, 1, 1)),
+            ('2024_01', epoch(2024, 1, 1), epoch(2024, 2, 1)),
+        )
+    ]
+
+
+def test_expired_partitions_are_detached():
+    attached = {
+        f'event_p{month}': f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        for month, lower, upper in (
+            ('2023_09', epoch(2023, 9, 1), epoch(2023, 10, 1)),
+            ('2023_10', epoch(2023, 10, 1), epoch(2023, 11, 1)),
+            ('2023_11', epoch(2023, 11, 1), epoch(2023, 12, 1)),
+        )
+    }
+    statements = partitions.maintenance_statements(
+        Event, attached, now=epoch(2023, 11, 15)
+    )
+    assert statements[-1] == \
+        'ALTER TABLE "event" DETACH PARTITION "event_p2023_09";'
+    assert len(statements) == 4
+
+
+def test_weekly_and_numeric_intervals():
+    weekly = RangePartition('created_at', interval='week')
+    lower = weekly.lower_bound(epoch(2024, 1, 3, 12))
+    assert lower == epoch(2024, 1, 1)
+    assert weekly.suffix(lower) == '2024w01'
+
+    numeric = RangePartition('amount', interval=1000)
+    assert list(numeric.ranges(2500, 2)) == [(2000, 3000), (3000, 4000)]
+
+
+def test_invalid_partitioning_is_rejected():
+    with pytest.raises(ValueError):
+        RangePartition('created_at', interval='day')
+
+    with pytest.raises(ValueError, match='unique'):
+        class Unique(Abstract):
+            code = models.CharField(unique=True)
+
+            class Meta:
+                partition_by = RangePartition('created_at')
+
+    with pytest.raises(ValueError, match='partitioning'):
+        old = migrations.snapshot([Event])
+        old['tables']['event']['partition'] = None
+        migrations.diff(old, migrations.snapshot([Event]))
@@ -0,0 +1,171 @@
+import pytest
+
+from miracle.db import models
+from miracle.db import query
+from miracle.euni.users import User
+
+
+def test_queryset_is_lazy_and_chainable(monkeypatch):
+    calls = []
+    monkeypatch.setattr(query.data_api, 'execute_statement',
+                        lambda *args, **kwargs: calls.append(args))
+
+    qs = User.objects.filter(last_name='Doe').order_by('-created_at')
+    assert calls == []
+    assert qs.limit(10) is not qs
+
+
+def test_compile_builds_parameterized_sql():
+    sql, parameters = User.objects.filter(
+        first_name='Ada', created_at__gte=10, id__in=[1, 2],
+        updated_by__isnull=True,
+    ).order_by('-created_at', 'id').limit(5).compile()
+
+    assert sql == (
+        'SELECT "id", "created_by", "updated_by", "created_at", '
+        '"updated_at", "fname", "last_name" FROM "user" WHERE "fname" = :p0 '
+        'AND "created_at" >= :p1 AND "id" IN (:p2, :p3) '
+        'AND "updated_by" IS NULL '
+        'ORDER BY "created_at" DESC, "id" LIMIT :limit'
+    )
+    assert parameters == {'p0': 'Ada', 'p1': 10, 'p2': 1, 'p3': 2,
+                          'limit': 5}
+
+
+def test_same_shape_reuses_compiled_sql():
+    query.compile_select.cache_clear()
+    User.objects.filter(last_name='a').compile()
+    User.objects.filter(last_name='b').compile()
+    info = query.compile_select.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_unknown_field_is_rejected():
+    with pytest.raises(ValueError):
+        User.objects.filter(nickname='x')
+
+
+def test_none_compiles_to_null_checks():
+    sql, parameters = User.objects.filter(
+        first_name=None, last_name__ne=None
+    ).compile()
+    assert sql.endswith('WHERE "fname" IS NULL AND "last_name" IS NOT NULL')
+    assert parameters == {}
+
+    with pytest.raises(ValueError):
+        User.objects.filter(created_at__gt=None)
+
+
+def test_empty_in_matches_no_row():
+    sql, parameters = User.objects.filter(
+        first_name__in=[], last_name='L'
+    ).compile()
+    assert sql.endswith('WHERE FALSE AND "last_name" = :p0')
+    assert parameters == {'p0': 'L'}
+
+
+def test_iteration_hydrates_instances(monkeypatch):
+    def execute_statement(sql, parameters, **kwargs):
+        return {'records': [[{'longValue': 3}] + [{'isNull': True}] * 4 +
+                            [{'stringValue': 'Ada'}, {'stringValue': 'L'}]]}
+
+    monkeypatch.setattr(query.data_api, 'execute_statement',
+                        execute_statement)
+    user = User.objects.filter(last_name='L').first()
+    assert (user.id, user.first_name) == (3, 'Ada')
+
+
+def test_iteration_requests_json_formatted_records(monkeypatch):
+    calls = []
+
+    def execute_statement(sql, parameters, **kwargs):
+        calls.append(kwargs)
+        return {'formattedRecords': '[{"id": 3, "fname": "Ada", '
+                                    '"last_name": "L"}]'}
+
+    monkeypatch.setattr(query.data_api, 'execute_statement',
+                        execute_statement)
+    user = User.objects.filter(last_name='L').first()
+    assert calls == [{'formatRecordsAs': 'JSON'}]
+    assert (user.id, user.first_name, user.created_at) == (3, 'Ada', None)
+
+
+def test_bulk_create_uses_defaults_and_sets_ids(monkeypatch):
+    statements = []
+
+    def execute_statement(sql, parameters, transaction_id=None):
+        statements.append((sql, parameters))
+        return {'records': [[{'longValue': 10}], [{'longValue': 11}]]}
+
+    monkeypatch.setattr(query.data_api, 'execute_statement',
+                        execute_statement)
+    users = [User(first_name='Ada', last_name='L'),
+             User(first_name=None, last_name='T', created_by=1)]
+    User.bulk_create(users)
+
+    assert [user.id for user in users] == [10, 11]
+    sql, parameters = statements[0]
+    assert sql == (
+        'INSERT INTO "user" ("created_by", "updated_by", "fname", '
+        '"last_name") VALUES (:p0, :p1, :p2, :p3), '
+        '(:p4, :p5, DEFAULT, :p6) RETURNING "id"'
+    )
+    assert parameters == {'p0': None, 'p1': None, 'p2': 'Ada', 'p3': 'L',
+                          'p4': 1, 'p5': None, 'p6': 'T'}
+
+
+def test_bulk_create_of_default_rows(monkeypatch):
+    class Log(models.Model):
+        logged_at = models.DateTimeField(default_now=True)
+
+        class Meta:
+            table_name = 'log'
+
+    statements = []
+    monkeypatch.setattr(
+        query.data_api, 'execute_statement',
+        lambda sql, parameters, transaction_id=None:
+            statements.append((sql, parameters)) or {},
+    )
+    Log.bulk_create([Log(), Log()])
+    assert statements == [
+        ('INSERT INTO "log" ("id") VALUES (DEFAULT), (DEFAULT) '
+         'RETURNING "id"', {}),
+    ]
+
+    Log(id=1).save()
+    assert len(statements) == 1
+
+
+class FakeTransaction:
+    id = 'tx-1'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+def test_bulk_update_writes_values_list(monkeypatch):
+    statements = []
+    monkeypatch.setattr(query.data_api, 'transaction', FakeTransaction)
+    monkeypatch.setattr(
+        query.data_api, 'execute_statement',
+        lambda sql, parameters, transaction_id=None:
+            statements.append((sql, parameters, transaction_id)),
+    )
+    users = [User(id=1, first_name='Ada', last_name='L'),
+             User(id=2, first_name='Alan', last_name='T')]
+    User.bulk_update(users, ['last_name', 'updated_at'], batch_size=1)
+
+    assert [tx for _, _, tx in statements] == ['tx-1', 'tx-1']
+    sql, parameters, _ = statements[0]
+    assert sql == (
+        'UPDATE "user" AS t SET "last_name" = v."last_name", '
+        '"updated_at" = v."updated_at" FROM (VALUES (CAST(:p0 AS BIGINT), '
+        'CAST(:p1 AS varchar(30)), '
+        'CAST(EXTRACT(EPOCH FROM CURRENT_TIMESTAMP) AS BIGINT))) '
+        'AS v("id", "last_name", "updated_at") WHERE t."id" = v."id"'
+    )
+    assert parameters == {'p0': 1, 'p1': 'L'}
@@ -0,0 +1,71 @@
+import sys
+
+import pytest
+
+from deploy_scripts import build_layers
+
+
+def touch(path, content=''):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    return path
+
+
+def test_top_level_packages_skip_metadata(tmp_path):
+    touch(tmp_path / 'jwt' / '__init__.py')
+    touch(tmp_path / 'PyJWT-2.1.0.dist-info' / 'METADATA')
+    touch(tmp_path / 'six.py')
+    touch(tmp_path / '_cffi_backend.cpython-38-x86_64-linux-gnu.so')
+    assert build_layers.top_level_packages(str(tmp_path)) == {
+        '_cffi_backend': str(tmp_path /
+                             '_cffi_backend.cpython-38-x86_64-linux-gnu.so'),
+        'jwt': str(tmp_path / 'jwt'),
+        'six': str(tmp_path / 'six.py'),
+    }
+
+
+def test_strip_keeps_sources_and_licenses(tmp_path):
+    kept = [
+        touch(tmp_path / 'jwt' / '__init__.py'),
+        touch(tmp_path / 'jwt' / 'LICENSE'),
+        touch(tmp_path / 'PyJWT-2.1.0.dist-info' / 'LICENSE'),
+    ]
+    stripped = [
+        touch(tmp_path / 'jwt' / '__pycache__' / 'api.cpython-311.pyc'),
+        touch(tmp_path / 'jwt' / 'tests' / 'test_api.py'),
+        touch(tmp_path / 'jwt' / 'api.pyi'),
+        touch(tmp_path / 'jwt' / 'py.typed'),
+        touch(tmp_path / 'README.md'),
+    ]
+    build_layers.strip(str(tmp_path), keep_metadata=True)
+    assert all(path.exists() for path in kept)
+    assert not any(path.exists() for path in stripped)
+
+    build_layers.strip(str(tmp_path))
+    assert not (tmp_path / 'PyJWT-2.1.0.dist-info').exists()
+
+
+def test_deduplicate_keeps_the_first_layer_copy(tmp_path):
+    jwt = tmp_path / 'jwt'
+    common = tmp_path / 'common'
+    touch(jwt / 'cryptography' / '__init__.py')
+    touch(jwt / 'jwt' / '__init__.py')
+    touch(common / 'cryptography' / '__init__.py')
+    touch(common / 'six.py')
+    touch(common / 'requests' / '__init__.py')
+
+    removed = build_layers.deduplicate({'jwt': str(jwt),
+                                        'common': str(common)})
+    assert removed == {'jwt': [], 'common': ['cryptography']}
+    assert (jwt / 'cryptography').exists()
+    assert not (common / 'cryptography').exists()
+    assert (common / 'six.py').exists()
+
+
+def test_interpreters_must_match_a_runtime():
+    version = '%d.%d' % sys.version_info[:2]
+    build_layers.check_interpreters([sys.executable], runtimes=(version,))
+    with pytest.raises(ValueError):
+        build_layers.check_interpreters([sys.executable], runtimes=('2.7',))
+    with pytest.raises(ValueError):
+        build_layers.check_interpreters(['/nonexistent/python'])
@@ -0,0 +1,32 @@
+import subprocess
+import sys
+
+from deploy_scripts import profile_imports
+
+
+def test_parse_importtime_keeps_the_handler_imports():
+    stderr = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:       120 |        120 | pkgutil',
+        profile_imports.MARKER,
+        'import time:       300 |        300 |     miracle.utils.metrics',
+        'import time:      6392 |       6692 |   miracle.utils.data_api',
+        'import time:        80 |       6772 | miracle.db.query',
+        'Traceback is not an import line',
+    ])
+    assert profile_imports.parse_importtime(stderr) == {
+        'miracle.utils.metrics': (300, 300),
+        'miracle.utils.data_api': (6392, 6692),
+        'miracle.db.query': (80, 6772),
+    }
+
+
+def test_every_miracle_module_is_reported():
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         'from miracle.utils import data_api'],
+        capture_output=True, text=True, check=True,
+    )
+    modules = profile_imports.parse_importtime(result.stderr)
+    assert {'miracle', 'miracle.utils', 'miracle.utils.data_api',
+            'miracle.utils.metrics'} <= set(modules)
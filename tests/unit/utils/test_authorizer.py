@@ -0,0 +1,152 @@
+import base64
+import json
+
+import pytest
+
+from miracle.utils.authorizer import JWKSCache
+from miracle.utils.authorizer import JWTAuthorizer
+from miracle.utils.authorizer import TokenCache
+from miracle.utils.authorizer import Unauthorized
+from miracle.utils.authorizer import policy
+
+METHOD_ARN = 'arn:aws:execute-api:us-east-1:123:abc123/dev/GET/get/42'
+
+
+def make_token(kid, sub='user-1', exp=2000):
+    def segment(data):
+        return base64.urlsafe_b64encode(
+            json.dumps(data).encode()
+        ).rstrip(b'=').decode()
+    return '.'.join([segment({'alg': 'RS256', 'kid': kid}),
+                     segment({'sub': sub, 'exp': exp}), 'signature'])
+
+
+class Clock:
+
+    def __init__(self, now=1000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_authorizer(jwks, clock):
+    fetched = []
+
+    def fetch(url):
+        fetched.append(url)
+        return {'keys': [{'kid': kid} for kid in jwks]}
+
+    def decode(token, key, **options):
+        decoded.append(key)
+        payload = token.split('.')[1]
+        return json.loads(base64.urlsafe_b64decode(payload + '=='))
+
+    decoded = []
+    keys = JWKSCache('https://idp/jwks', fetch=fetch,
+                     load=lambda jwk: f'key-{jwk["kid"]}', clock=clock)
+    authorizer = JWTAuthorizer(keys, tokens=TokenCache(clock=clock),
+                               decode=decode)
+    return authorizer, fetched, decoded
+
+
+def test_verified_tokens_are_cached_until_expiry():
+    clock = Clock()
+    authorizer, fetched, decoded = make_authorizer(['k1'], clock)
+    token = make_token('k1', exp=1500)
+
+    assert authorizer.verify(token)['sub'] == 'user-1'
+    assert authorizer.verify(token)['sub'] == 'user-1'
+    assert decoded == ['key-k1'] and len(fetched) == 1
+
+    clock.now = 1500
+    authorizer.verify(token)
+    assert len(decoded) == 2
+
+
+def test_unknown_kid_refreshes_keys_once_per_interval():
+    clock = Clock()
+    jwks = ['k1']
+    authorizer, fetched, _ = make_authorizer(jwks, clock)
+    authorizer.verify(make_token('k1'))
+
+    clock.now += 60
+    jwks.append('k2')
+    assert authorizer.verify(make_token('k2'))['sub'] == 'user-1'
+    assert len(fetched) == 2
+
+    for _ in range(3):
+        with pytest.raises(Unauthorized):
+            authorizer.verify(make_token('forged'))
+    assert len(fetched) == 2
+
+    clock.now += 60
+    with pytest.raises(Unauthorized):
+        authorizer.verify(make_token('forged'))
+    assert len(fetched) == 3
+
+
+def test_failed_refresh_keeps_serving_cached_keys():
+    clock = Clock()
+    outage = []
+
+    def fetch(url):
+        outage.append(url)
+        if len(outage) > 1:
+            raise TimeoutError('idp is down')
+        return {'keys': [{'kid': 'k1'}]}
+
+    keys = JWKSCache('https://idp/jwks', ttl=3600, max_age=7200,
+                     min_refresh_interval=30, fetch=fetch,
+                     load=lambda jwk: f'key-{jwk["kid"]}', clock=clock)
+    assert keys.get('k1') == 'key-k1'
+
+    clock.now += 3600
+    assert keys.get('k1') == 'key-k1'
+    assert len(outage) == 2
+    for _ in range(3):
+        assert keys.get('k1') == 'key-k1'
+        with pytest.raises(Unauthorized):
+            keys.get('k2')
+    assert len(outage) == 2
+
+    clock.now += 30
+    assert keys.get('k1') == 'key-k1'
+    assert len(outage) == 3
+
+    clock.now += 3600
+    with pytest.raises(Unauthorized):
+        keys.get('k1')
+    assert len(outage) == 4
+
+
+def test_token_cache_is_bounded():
+    cache = TokenCache(max_size=2, clock=Clock())
+    for token in ('a', 'b', 'c'):
+        cache.put(token, {'exp': 2000})
+    cache.put('no-expiry', {'sub': 'x'})
+    assert len(cache) == 2
+    assert cache.get('a') is None and cache.get('c') == {'exp': 2000}
+
+
+def test_policy_allows_the_whole_stage():
+    response = policy('user-1', 'Allow', METHOD_ARN,
+                      context={'sub': 'user-1', 'roles': ['admin']})
+    statement = response['policyDocument']['Statement'][0]
+    assert statement['Resource'] == \
+        'arn:aws:execute-api:us-east-1:123:abc123/dev/*'
+    assert response['context'] == {'sub': 'user-1'}
+
+
+def test_handler_rejects_missing_and_malformed_tokens():
+    authorizer, _, _ = make_authorizer(['k1'], Clock())
+    for headers in ({}, {'Authorization': 'Bearer not-a-jwt'},
+                    {'Authorization': 'Basic abc'}):
+        with pytest.raises(Exception, match='Unauthorized'):
+            authorizer({'headers': headers, 'methodArn': METHOD_ARN}, None)
+
+    response = authorizer({
+        'headers': {'authorization': f'Bearer {make_token("k1")}'},
+        'methodArn': METHOD_ARN,
+    }, None)
+    assert response['principalId'] == 'user-1'
@@ -0,0 +1,76 @@
+from miracle.utils.cache import TTLCache
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class DeferredExecutor:
+
+    def __init__(self):
+        self.pending = []
+
+    def submit(self, fn, *args):
+        self.pending.append((fn, args))
+
+    def run(self):
+        for fn, args in self.pending:
+            fn(*args)
+        self.pending = []
+
+
+def make_cache(**kwargs):
+    loads = []
+
+    def loader(key):
+        loads.append(key)
+        return f'{key}-{len(loads)}'
+
+    clock = Clock()
+    executor = DeferredExecutor()
+    cache = TTLCache(loader, clock=clock, executor=executor, **kwargs)
+    return cache, loads, clock, executor
+
+
+def test_read_through_and_counters():
+    cache, loads, _, _ = make_cache()
+    assert cache.get('a') == 'a-1'
+    assert cache.get('a') == 'a-1'
+    assert loads == ['a']
+    info = cache.info()
+    assert (info.hits, info.misses, info.size) == (1, 1, 1)
+
+
+def test_lru_eviction():
+    cache, _, _, _ = make_cache(max_size=2)
+    cache.preload([('a', 1), ('b', 2)])
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('a') == 1
+    assert cache.get('b') == 'b-1'
+    assert cache.info().evictions == 2
+
+
+def test_stale_entry_is_served_then_refreshed_in_background():
+    cache, loads, clock, executor = make_cache(ttl=10)
+    cache.put('a', 'old')
+    clock.now = 11
+    assert cache.get('a') == 'old'
+    assert cache.get('a') == 'old'
+    assert len(executor.pending) == 1
+    executor.run()
+    assert cache.get('a') == 'a-1'
+    assert cache.info().refreshes == 1
+
+
+def test_invalidate_discards_in_flight_refresh():
+    cache, _, clock, executor = make_cache(ttl=10)
+    cache.put('a', 'old')
+    clock.now = 11
+    cache.get('a')
+    cache.invalidate('a')
+    executor.run()
+    assert cache.info().size == 0
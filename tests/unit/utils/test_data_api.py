@@ -0,0 +1,184 @@
+import pytest
+
+from miracle.utils import data_api
+from miracle.utils import metrics
+
+
+class FakeClient:
+
+    def __init__(self):
+        self.calls = []
+        self.next_id = 0
+
+    def begin_transaction(self, **kwargs):
+        self.calls.append(('begin', kwargs))
+        return {'transactionId': 'tx-1'}
+
+    def commit_transaction(self, **kwargs):
+        self.calls.append(('commit', kwargs))
+
+    def rollback_transaction(self, **kwargs):
+        self.calls.append(('rollback', kwargs))
+
+    def batch_execute_statement(self, **kwargs):
+        self.calls.append(('batch', kwargs))
+        results = []
+        for _ in kwargs['parameterSets']:
+            self.next_id += 1
+            results.append({'generatedFields': [{'longValue': self.next_id}]})
+        return {'updateResults': results}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setenv('RESOURCE_ARN', 'resource')
+    monkeypatch.setenv('SECRET_ARN', 'secret')
+    monkeypatch.setattr(data_api, 'get_client', lambda: fake)
+    return fake
+
+
+def test_batch_is_chunked_inside_one_transaction(client):
+    rows = ({'name': f'user-{i}'} for i in range(25))
+    ids = data_api.batch_execute_statement(
+        'INSERT INTO t (name) VALUES (:name) RETURNING id', rows,
+        max_parameter_sets=10,
+    )
+    assert ids == [[i] for i in range(1, 26)]
+    kinds = [kind for kind, _ in client.calls]
+    assert kinds == ['begin', 'batch', 'batch', 'batch', 'commit']
+    assert all(kwargs.get('transactionId') == 'tx-1'
+               for kind, kwargs in client.calls[1:])
+
+
+def test_batch_is_chunked_by_request_size(client):
+    rows = [{'name': 'x' * 100}] * 6
+    data_api.batch_execute_statement(
+        'INSERT INTO t (name) VALUES (:name)', rows,
+        max_request_size=400,
+    )
+    sizes = [len(kwargs['parameterSets'])
+             for kind, kwargs in client.calls if kind == 'batch']
+    assert sum(sizes) == 6 and len(sizes) > 1
+
+
+def test_batch_rolls_back_on_error(client):
+    def failing(**kwargs):
+        raise RuntimeError('boom')
+
+    client.batch_execute_statement = failing
+    with pytest.raises(RuntimeError):
+        data_api.batch_execute_statement('SELECT 1', [{'a': 1}])
+    assert [kind for kind, _ in client.calls] == ['begin', 'rollback']
+
+
+def test_to_parameters_adds_type_hints():
+    from decimal import Decimal
+
+    assert data_api.to_parameters({'a': Decimal('1.5'), 'b': None}) == [
+        {'name': 'a', 'value': {'stringValue': '1.5'}, 'typeHint': 'DECIMAL'},
+        {'name': 'b', 'value': {'isNull': True}},
+    ]
+
+
+def test_iterate_statement_pages_on_key(client):
+    table = [{'longValue': i} for i in range(1, 6)]
+
+    def execute_statement(**kwargs):
+        client.calls.append(('execute', kwargs))
+        last = {p['name']: p['value']['longValue']
+                for p in kwargs.get('parameters', [])}.get('_last_key', 0)
+        records = [[cell] for cell in table
+                   if cell['longValue'] > last][:2]
+        return {'columnMetadata': [{'name': 'id'}], 'records': records}
+
+    client.execute_statement = execute_statement
+    rows = data_api.iterate_statement('SELECT id FROM t', page_size=2)
+    assert client.calls == []
+    assert [row['id'] for row in rows] == [1, 2, 3, 4, 5]
+    statements = [kwargs['sql'] for _, kwargs in client.calls]
+    assert len(statements) == 3
+    assert 'page.id > :_last_key' not in statements[0]
+    assert 'page.id > :_last_key' in statements[1]
+
+
+def test_client_is_cached_per_region_and_cluster(monkeypatch):
+    boto3 = pytest.importorskip('boto3')
+    monkeypatch.setattr(data_api, '_clients', {})
+    monkeypatch.setenv('RESOURCE_ARN', 'resource')
+    monkeypatch.setenv('SECRET_ARN', 'secret')
+    before = data_api.client_cache_info()
+
+    first = data_api.get_client(region='us-east-1')
+    assert data_api.get_client(region='us-east-1') is first
+    assert data_api.get_client(region='eu-west-1') is not first
+
+    after = data_api.client_cache_info()
+    assert after.hits - before.hits == 1
+    assert after.misses - before.misses == 2
+
+
+class ResumingError(Exception):
+    response = {'Error': {
+        'Code': 'BadRequestException',
+        'Message': 'Communications link failure',
+    }}
+
+
+def test_transaction_decorator_retries_transient_errors(client, monkeypatch):
+    monkeypatch.setattr(data_api.time, 'sleep', lambda delay: None)
+    calls = []
+
+    @data_api.transaction(retries=2)
+    def work(value, *, transaction_id):
+        calls.append(transaction_id)
+        if len(calls) < 3:
+            raise ResumingError()
+        return value
+
+    assert work('done') == 'done'
+    assert calls == ['tx-1'] * 3
+    kinds = [kind for kind, _ in client.calls]
+    assert kinds == ['begin', 'rollback'] * 2 + ['begin', 'commit']
+
+
+def test_transaction_does_not_retry_other_errors(client):
+    @data_api.transaction(retries=2)
+    def work(*, transaction_id):
+        raise ValueError('bad input')
+
+    with pytest.raises(ValueError):
+        work()
+    assert [kind for kind, _ in client.calls] == ['begin', 'rollback']
+
+
+def test_transaction_context_manager_records_timings(client):
+    with data_api.transaction() as tx:
+        assert tx.id == 'tx-1'
+    assert len(tx.attempts) == 1 and tx.elapsed >= tx.attempts[0]
+    assert [kind for kind, _ in client.calls] == ['begin', 'commit']
+
+
+def test_transaction_decorator_records_metrics(client, monkeypatch):
+    monkeypatch.setattr(data_api.time, 'sleep', lambda delay: None)
+    calls = []
+
+    @data_api.transaction(retries=2)
+    def work(*, transaction_id):
+        calls.append(transaction_id)
+        if len(calls) < 2:
+            raise ResumingError()
+
+    invocation = metrics.start('test')
+    try:
+        work()
+    finally:
+        metrics.finish(invocation, sample_rate=0)
+
+    assert len(work.last.attempts) == 2
+    assert invocation.metrics['TransactionCalls'] == [1, 'Count']
+    assert invocation.metrics['TransactionAttemptCalls'] == [2, 'Count']
+    assert invocation.metrics['Transaction'][0] == \
+        pytest.approx(work.last.elapsed * 1000)
+    assert invocation.metrics['TransactionAttempt'][0] == \
+        pytest.approx(sum(work.last.attempts) * 1000)
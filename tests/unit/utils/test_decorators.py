@@ -0,0 +1,125 @@
+import json
+
+from miracle.utils import metrics
+from miracle.utils.decorators import middleware
+
+
+def emitted(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_middleware_emits_emf_timings(capsys, monkeypatch):
+    monkeypatch.setattr(metrics, '_cold_start', True)
+
+    @middleware()
+    def handler(event, context):
+        metrics.record_call('DataApi', 0.002)
+        return {'statusCode': 200, 'body': {'users': []}}
+
+    response = handler({'secret': 'payload'}, None)
+    assert response['body'] == '{"users":[]}'
+
+    [record] = emitted(capsys)
+    names = [m['Name'] for m in
+             record['_aws']['CloudWatchMetrics'][0]['Metrics']]
+    assert {'ColdStart', 'Handler', 'Serialization', 'Middleware',
+            'DataApi', 'DataApiCalls'} <= set(names)
+    assert record['DataApi'] == 2.0 and record['ColdStart'] == 1
+    assert 'secret' not in json.dumps(record)
+
+
+def test_warm_invocations_are_sampled(capsys, monkeypatch):
+    monkeypatch.setattr(metrics, '_cold_start', False)
+
+    @middleware(sample_rate=0)
+    def handler(event, context):
+        return None
+
+    handler({}, None)
+    assert emitted(capsys) == []
+    assert metrics.current() is None
+
+
+def test_middleware_overhead_is_recorded(monkeypatch):
+    monkeypatch.setattr(metrics, '_cold_start', False)
+    recorded = []
+    monkeypatch.setattr(metrics, 'finish',
+                        lambda invocation, rate: recorded.append(invocation))
+
+    @middleware()
+    def handler(event, context):
+        return None
+
+    handler({}, None)
+    [invocation] = recorded
+    value, unit = invocation.metrics['Middleware']
+    assert unit == 'Milliseconds' and value >= 0
+
+
+def test_stages_run_in_order_and_can_short_circuit():
+    calls = []
+
+    def first(event, context, call_next):
+        calls.append('first')
+        return call_next(event, context)
+
+    def guard(event, context, call_next):
+        calls.append('guard')
+        if event.get('blocked'):
+            return {'statusCode': 403}
+        return call_next(event, context)
+
+    @middleware(first, guard, sample_rate=0)
+    def handler(event, context):
+        calls.append('handler')
+        return {'statusCode': 200}
+
+    assert handler({'blocked': True}, None) == {'statusCode': 403}
+    assert calls == ['first', 'guard']
+
+
+def test_response_cache_is_keyed_on_the_caller(monkeypatch):
+    monkeypatch.setenv('RESPONSE_CACHE_TTL', '60')
+
+    def me(event, context):
+        principal = event['requestContext']['authorizer']['principalId']
+        return {'statusCode': 200, 'body': {'me': principal}}
+
+    def event(principal, token):
+        return {'httpMethod': 'GET', 'resource': '/get/{user_id}',
+                'pathParameters': {'user_id': '1'},
+                'headers': {'Authorization': f'Bearer {token}'},
+                'requestContext': {'authorizer': {'principalId': principal}}}
+
+    handler = middleware(sample_rate=0)(me)
+    assert handler(event('alice', 'A'), None)['body'] == '{"me":"alice"}'
+    assert handler(event('mallory', 'B'), None)['body'] == \
+        '{"me":"mallory"}'
+    assert handler(event('alice', 'A'), None)['body'] == '{"me":"alice"}'
+
+    monkeypatch.setenv('RESPONSE_CACHE_SHARED', 'true')
+    shared = middleware(sample_rate=0)(me)
+    assert shared(event('alice', 'A'), None)['body'] == '{"me":"alice"}'
+    assert shared(event('mallory', 'B'), None)['body'] == '{"me":"alice"}'
+
+
+def test_response_cache_skips_handler_for_repeated_gets(monkeypatch):
+    monkeypatch.setenv('RESPONSE_CACHE_TTL', '60')
+    calls = []
+
+    @middleware(sample_rate=0)
+    def handler(event, context):
+        calls.append(event)
+        return {'statusCode': 200, 'body': {'n': len(calls)}}
+
+    event = {'httpMethod': 'GET', 'resource': '/get/{user_id}',
+             'pathParameters': {'user_id': '1'},
+             'queryStringParameters': None}
+    other = dict(event, pathParameters={'user_id': '2'})
+    post = dict(event, httpMethod='POST')
+
+    assert handler(event, None)['body'] == '{"n":1}'
+    assert handler(event, None)['body'] == '{"n":1}'
+    assert handler(other, None)['body'] == '{"n":2}'
+    assert handler(post, None)['body'] == '{"n":3}'
+    assert handler(post, None)['body'] == '{"n":4}'
@@ -0,0 +1,51 @@
+import base64
+import gzip
+import json
+from decimal import Decimal
+
+from miracle.euni.dictionary import Dictionary
+from miracle.euni.users import User
+from miracle.utils import response
+from miracle.utils.decorators import middleware
+
+
+def test_model_serializer_encodes_fields_by_type():
+    user = User(id=7, first_name='Ada "A"', last_name='Lovelace',
+                created_at=1700000000, created_by=3)
+    assert json.loads(response.dumps(user)) == {
+        'id': 7, 'created_by': 3, 'updated_by': None,
+        'created_at': '2023-11-14 22:13:20', 'updated_at': None,
+        'first_name': 'Ada "A"', 'last_name': 'Lovelace',
+    }
+
+
+def test_lists_and_generic_values():
+    entries = [Dictionary(id=i, key=f'k{i}', value='v') for i in range(3)]
+    body = response.dumps({'items': entries, 'total': Decimal('10.50'),
+                           'ratio': float('inf'), 'ok': True})
+    data = json.loads(body)
+    assert [item['key'] for item in data['items']] == ['k0', 'k1', 'k2']
+    assert body.endswith('"total":10.50,"ratio":null,"ok":true}')
+    assert response.dumps([User(first_name='a', last_name='b'), 1]) \
+        .startswith('[{"id":null,')
+
+
+def test_gzip_only_for_accepting_clients(monkeypatch):
+    monkeypatch.setenv('RESPONSE_GZIP_MIN_SIZE', '100')
+
+    @middleware(sample_rate=0)
+    def handler(event, context):
+        return {'statusCode': 200, 'body': {'data': 'x' * 200}}
+
+    plain = handler({'headers': {}}, None)
+    assert plain['body'].startswith('{"data"')
+    assert plain['headers'] == {'Content-Type': 'application/json'}
+
+    refused = handler({'headers': {'Accept-Encoding': 'gzip;q=0'}}, None)
+    assert 'isBase64Encoded' not in refused
+
+    compressed = handler({'headers': {'accept-encoding': 'br, gzip'}}, None)
+    assert compressed['isBase64Encoded'] is True
+    assert compressed['headers']['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(base64.b64decode(compressed['body'])) == \
+        plain['body'].encode()
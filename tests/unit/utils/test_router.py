@@ -0,0 +1,49 @@
+import os
+
+from miracle.utils.router import Router
+
+HANDLER = '''
+import os
+
+LOADED_WITH = os.environ.get('TABLE')
+
+
+def handler(event, context):
+    return {{'endpoint': {endpoint!r}, 'loaded_with': LOADED_WITH,
+             'table': os.environ.get('TABLE')}}
+'''
+
+
+def make_router(tmp_path):
+    views = {
+        'get-all': {'method': 'GET', 'environment': {'TABLE': 'users'}},
+        'get': {'method': 'GET', 'pathParams': '{user_id}'},
+    }
+    for endpoint in views:
+        (tmp_path / endpoint).mkdir()
+        (tmp_path / endpoint / f'{endpoint}.py').write_text(
+            HANDLER.format(endpoint=endpoint)
+        )
+    return Router(views, str(tmp_path))
+
+
+def test_dispatch_on_method_and_resource(tmp_path):
+    router = make_router(tmp_path)
+    assert router({'httpMethod': 'GET', 'resource': '/get/{user_id}'},
+                  None)['endpoint'] == 'get'
+    assert router({'httpMethod': 'GET', 'resource': '/get-all'},
+                  None)['endpoint'] == 'get-all'
+    assert router({'httpMethod': 'POST', 'resource': '/get-all'},
+                  None)['statusCode'] == 404
+
+
+def test_endpoint_environment_is_scoped(tmp_path, monkeypatch):
+    monkeypatch.delenv('TABLE', raising=False)
+    router = make_router(tmp_path)
+    response = router({'httpMethod': 'GET', 'resource': '/get-all'}, None)
+    assert response['loaded_with'] == 'users'
+    assert response['table'] == 'users'
+    assert 'TABLE' not in os.environ
+    response = router({'httpMethod': 'GET', 'resource': '/get/{user_id}'},
+                      None)
+    assert response['table'] is None